@@ -1,41 +1,83 @@
-import sys, os, json, datetime, subprocess, hashlib
+import sys, os, json, datetime, subprocess, hashlib, threading, time, base64, statistics, tempfile, uuid, heapq
+from collections import namedtuple, deque
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QPushButton,
     QListWidget, QFileDialog, QMessageBox, QHBoxLayout, QTextEdit, QStackedWidget,
     QInputDialog, QListWidgetItem, QDialog, QDialogButtonBox, QFrame, QLineEdit
 )
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QThread, QObject, QEventLoop, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
 
-# Novos imports para reconhecimento facial
-import cv2
-import face_recognition
-import numpy as np
+# Imports pesados de visão são adiados até o primeiro uso (a janela abre sem carregar o dlib)
+import importlib
+
+class _ModuloPreguicoso:
+    """Representa um módulo que só é importado no primeiro acesso a um atributo"""
+
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+        self._lock = threading.Lock()
+
+    def _carregar(self):
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    inicio = time.perf_counter()
+                    self._modulo = importlib.import_module(self._nome)
+                    TEMPOS_IMPORTACAO[self._nome] = time.perf_counter() - inicio
+        return self._modulo
+
+    def carregado(self):
+        return self._modulo is not None
+
+    def __getattr__(self, atributo):
+        return getattr(self._carregar(), atributo)
+
+TEMPOS_IMPORTACAO = {}
+cv2 = _ModuloPreguicoso("cv2")
+face_recognition = _ModuloPreguicoso("face_recognition")  # carrega os modelos do dlib
+np = _ModuloPreguicoso("numpy")
 
 # Caminhos dos arquivos
 BASE_DIR = os.path.dirname(__file__)
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.environ.get("COFRE_DATA_DIR") or os.path.join(BASE_DIR, "data")
 USERS_FILE = os.path.join(DATA_DIR, "usuarios.json")
 LOG_FILE = os.path.join(DATA_DIR, "logs.txt")
+LOG_JSONL_FILE = os.path.join(DATA_DIR, "logs.jsonl")
 PASTAS_FILE = os.path.join(DATA_DIR, "pastas.json")
 SESSOES_FILE = os.path.join(DATA_DIR, "sessoes.json")
+SESSOES_DIARIO_FILE = os.path.join(DATA_DIR, "sessoes.jsonl")
 COFRES_DIR = os.path.join(DATA_DIR, "cofres")
 ADMINS_FILE = os.path.join(DATA_DIR, "admins.json")
+GALERIA_FILE = os.path.join(DATA_DIR, "galeria.npy")
+GALERIA_INDICE_FILE = os.path.join(DATA_DIR, "galeria_indice.json")
+INDICE_ANN_FILE = os.path.join(DATA_DIR, "indice_ivf.npz")
+MODELOS_DIR = os.path.join(DATA_DIR, "modelos")
+AMOSTRAS_DETECCAO_DIR = os.path.join(DATA_DIR, "amostras_deteccao")
+DETECTOR_FILE = os.path.join(DATA_DIR, "detector.json")
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".bmp")
+DESEMPENHO_FILE = os.path.join(DATA_DIR, "desempenho.json")
+DESEMPENHO_PROM_FILE = os.path.join(DATA_DIR, "desempenho.prom")
+BANCO_FILE = os.path.join(DATA_DIR, "cofre.db")
+
+def inicializar_dados():
+    """Garante pastas e arquivos de dados (chamado na execução, não na importação)"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(COFRES_DIR, exist_ok=True)
+    for caminho, vazio in ((USERS_FILE, {}), (PASTAS_FILE, []), (SESSOES_FILE, {})):
+        if not os.path.exists(caminho):
+            gravar_json_atomico(caminho, vazio)
+
+    # Cria admin master padrão (no arquivo de admins ou, com SQLite, na tabela vazia)
+    with TravaArquivo(ADMINS_FILE):
+        if obter_armazenamento().nome == "json" and os.path.exists(ADMINS_FILE):
+            return
+        if obter_armazenamento().nome == "sqlite" and carregar_admins():
+            return
+        _criar_admin_master()
 
-# Garante pastas e arquivos
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(COFRES_DIR, exist_ok=True)
-if not os.path.exists(USERS_FILE):
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump({}, f)
-if not os.path.exists(PASTAS_FILE):
-    with open(PASTAS_FILE, "w", encoding="utf-8") as f:
-        json.dump([], f)
-if not os.path.exists(SESSOES_FILE):
-    with open(SESSOES_FILE, "w", encoding="utf-8") as f:
-        json.dump({}, f)
-
-# Cria arquivo de admins com admin master padrão
-if not os.path.exists(ADMINS_FILE):
+def _criar_admin_master():
     admin_master = {
         "admin": {
             "senha_hash": hashlib.sha256("admin123".encode()).hexdigest(),
@@ -43,99 +85,1198 @@ if not os.path.exists(ADMINS_FILE):
             "criado_em": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
     }
-    with open(ADMINS_FILE, "w", encoding="utf-8") as f:
-        json.dump(admin_master, f, indent=4, ensure_ascii=False)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')}] Administrador master criado (usuário: admin, senha: admin123)\n")
+    salvar_admins(admin_master)
+    salvar_log("Administrador master criado (usuário: admin, senha: admin123)")
+
+# ------------------------- Registro de Eventos -------------------------
+# salvar_log só enfileira a mensagem (com o horário da chamada); uma thread grava em lotes,
+# a cada INTERVALO_DESCARGA_LOG segundos ou quando a fila passa de LOTE_LOG linhas, e no
+# encerramento do processo. Com COFRE_LOG_JSONL=1 cada linha também vai para logs.jsonl
+# com pid, thread e os campos extras passados a salvar_log.
+LOG_ESTRUTURADO = os.environ.get("COFRE_LOG_JSONL", "0") == "1"
+INTERVALO_DESCARGA_LOG = 0.5
+LOTE_LOG = 512
+CAPACIDADE_FILA_LOG = 100000
+
+class RegistroAssincrono:
+    """Log com fila em memória e uma thread de gravação; quem registra nunca espera o disco.
+
+    Cada lote vira um único os.write em modo append, então linhas de processos diferentes
+    não se misturam. Se a fila encher (disco travado), as mensagens novas são descartadas e
+    contadas em vez de bloquear quem chamou; linhas de um lote que falhou ao gravar contam
+    como perdidas.
+    """
+
+    def __init__(self, caminho=LOG_FILE, caminho_jsonl=None, intervalo=INTERVALO_DESCARGA_LOG, lote=LOTE_LOG,
+                 capacidade=CAPACIDADE_FILA_LOG):
+        self.caminho = caminho
+        self.caminho_jsonl = caminho_jsonl
+        self.intervalo = intervalo
+        self.lote = lote
+        self.capacidade = capacidade
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._fila = deque()       # append/popleft são seguros entre threads
+        self._acordar = threading.Event()
+        self._cond = threading.Condition()
+        self._escrita = threading.Lock()   # _gravar é chamado pela thread e, depois de fechar, por quem registra
+        self._thread = None
+        self._fechado = False
+        self._segundo = None
+        self._segundo_texto = ""
+        self.enfileiradas = 0
+        self.gravadas = 0
+        self.descartadas = 0       # fila cheia: nunca entraram na fila
+        self.perdidas = 0          # entraram na fila, mas a gravação falhou
+        self.lotes = 0
+        self.erros = 0
+
+    def _iniciar(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._executar, name="registro-log", daemon=True)
+            self._thread.start()
+        import atexit
+        atexit.register(self.fechar)
+        if "multiprocessing" in sys.modules:
+            # Processos do multiprocessing saem com os._exit, sem atexit
+            from multiprocessing import util
+            util.Finalize(self, self.fechar, exitpriority=100)
+
+    def registrar(self, msg, **campos):
+        if self._fechado:
+            self.enfileiradas += 1
+            self._gravar([(time.time(), msg, threading.current_thread().name, campos)])
+            return
+        if self._thread is None:
+            self._iniciar()
+        if len(self._fila) >= self.capacidade:
+            self.descartadas += 1
+            return
+        self._fila.append((time.time(), msg, threading.current_thread().name, campos))
+        self.enfileiradas += 1
+        if len(self._fila) >= self.lote:
+            self._acordar.set()
+
+    def _horario(self, ts):
+        segundo = int(ts)
+        if segundo != self._segundo:
+            self._segundo = segundo
+            self._segundo_texto = datetime.datetime.fromtimestamp(segundo).strftime('%d/%m/%Y %H:%M:%S')
+        return self._segundo_texto
+
+    def _gravar(self, itens):
+        with self._escrita:
+            texto = "".join(f"[{self._horario(ts)}] {msg}\n" for ts, msg, _, _ in itens)
+            try:
+                self._anexar(self.caminho, texto)
+                if self.caminho_jsonl:
+                    pid = os.getpid()
+                    linhas = "".join(json.dumps({"ts": datetime.datetime.fromtimestamp(ts).isoformat(timespec="milliseconds"),
+                                                 "pid": pid, "thread": thread, "msg": msg, **campos},
+                                                ensure_ascii=False, default=str) + "\n"
+                                     for ts, msg, thread, campos in itens)
+                    self._anexar(self.caminho_jsonl, linhas)
+                self.gravadas += len(itens)
+            except OSError as e:
+                self.erros += 1
+                self.perdidas += len(itens)
+                print(f"Falha ao gravar log: {e}", file=sys.stderr)
+            self.lotes += 1
+
+    @staticmethod
+    def _anexar(caminho, texto):
+        fd = os.open(caminho, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, texto.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def _esvaziar(self):
+        while self._fila:
+            itens = []
+            while self._fila and len(itens) < self.lote:
+                itens.append(self._fila.popleft())
+            self._gravar(itens)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _executar(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            self._esvaziar()
+            if self._fechado:
+                self._esvaziar()
+                return
+
+    def descarregar(self, timeout=5.0):
+        """Espera até o que já foi registrado estar no disco"""
+        if self._thread is None:
+            return True
+        alvo = self.enfileiradas
+        limite = time.monotonic() + timeout
+        self._acordar.set()
+        with self._cond:
+            while self.gravadas + self.perdidas < alvo:
+                restante = limite - time.monotonic()
+                if restante <= 0 or not self._thread.is_alive():
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def fechar(self, timeout=5.0):
+        if self._fechado:
+            return
+        self._fechado = True
+        if self._thread is not None:
+            self._acordar.set()
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return  # ainda gravando (disco lento): ela esvazia a fila antes de sair
+        self._esvaziar()  # thread parada sem esvaziar (ou nunca iniciada)
+
+    def estatisticas(self):
+        return {"enfileiradas": self.enfileiradas, "gravadas": self.gravadas, "pendentes": len(self._fila),
+                "descartadas": self.descartadas, "perdidas": self.perdidas, "lotes": self.lotes, "erros": self.erros}
+
+REGISTRO = RegistroAssincrono(LOG_FILE, LOG_JSONL_FILE if LOG_ESTRUTURADO else None)
+if hasattr(os, "register_at_fork"):
+    # Thread e fila não sobrevivem ao fork: o filho começa do zero
+    os.register_at_fork(after_in_child=REGISTRO._reiniciar)
+
+def salvar_log(msg, **campos):
+    """Registra uma linha no log; campos extras só aparecem no logs.jsonl"""
+    REGISTRO.registrar(msg, **campos)
+
+def benchmark_log(mensagens=20000, threads=1):
+    """Latência de salvar_log para quem chama e vazão: gravação direta x registro assíncrono"""
+
+    def gravar_direto(caminho, msg):
+        # Comportamento anterior: abre, formata, escreve uma linha e fecha a cada chamada
+        with open(caminho, "a", encoding="utf-8") as f:
+            f.write(f"[{datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')}] {msg}\n")
+
+    def medir(registrar):
+        por_thread = max(1, mensagens // threads)
+        latencias = [[] for _ in range(threads)]
+
+        def trabalho(i):
+            for k in range(por_thread):
+                inicio = time.perf_counter()
+                registrar(f"[BENCH] thread {i} mensagem {k}", thread=i, indice=k)
+                latencias[i].append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        grupo = [threading.Thread(target=trabalho, args=(i,)) for i in range(threads)]
+        for t in grupo:
+            t.start()
+        for t in grupo:
+            t.join()
+        return [x for lista in latencias for x in lista], time.perf_counter() - inicio
+
+    resultados = {}
+    print(f"{mensagens} mensagens, {threads} thread(s)")
+    print(f"{'modo':<22}{'p50 us':>9}{'p99 us':>9}{'máx us':>10}{'linhas/s':>12}{'no disco':>10}")
+    with tempfile.TemporaryDirectory() as pasta:
+        for modo in ("direto", "assincrono", "assincrono+jsonl"):
+            caminho = os.path.join(pasta, f"{modo}.txt")
+            if modo == "direto":
+                latencias, chamadas = medir(lambda msg, **campos: gravar_direto(caminho, msg))
+                total = chamadas
+            else:
+                registro = RegistroAssincrono(caminho, os.path.join(pasta, f"{modo}.jsonl") if "jsonl" in modo else None)
+                latencias, chamadas = medir(registro.registrar)
+                inicio = time.perf_counter()
+                registro.fechar()
+                total = chamadas + (time.perf_counter() - inicio)  # até a última linha estar no disco
+            with open(caminho, "r", encoding="utf-8") as f:
+                linhas = sum(1 for _ in f)
+            latencias.sort()
+            r = {"p50_us": latencias[len(latencias) // 2] * 1e6, "p99_us": latencias[int(len(latencias) * 0.99)] * 1e6,
+                 "max_us": latencias[-1] * 1e6, "linhas_s": len(latencias) / total, "linhas": linhas}
+            resultados[modo] = r
+            print(f"{modo:<22}{r['p50_us']:>9.1f}{r['p99_us']:>9.1f}{r['max_us']:>10.0f}{r['linhas_s']:>12.0f}{linhas:>10}")
+    return resultados
+
+# ------------------------- Acesso Concorrente -------------------------
+# Vários processos (quiosques, painel de admin) podem compartilhar data/. Toda gravação
+# de arquivo de dados: (1) roda sob uma trava consultiva exclusiva em <arquivo>.lock,
+# (2) confere se o arquivo mudou desde a nossa leitura e, se mudou, reaplica as nossas
+# alterações sobre o conteúdo atual e (3) grava num temporário e troca com os.replace,
+# de modo que leitores nunca veem um arquivo truncado ou pela metade.
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+class TravaArquivo:
+    """Trava exclusiva entre processos (flock) e entre threads (RLock); reentrante"""
+    _travas = {}
+    _lock_travas = threading.Lock()
+
+    def __init__(self, caminho):
+        self.caminho = os.path.abspath(caminho) + ".lock"
+        with TravaArquivo._lock_travas:
+            # Uma única trava por arquivo no processo: flock não exclui threads do mesmo processo
+            self._estado = TravaArquivo._travas.setdefault(self.caminho, {"lock": threading.RLock(), "nivel": 0, "fd": None})
+
+    def __enter__(self):
+        estado = self._estado
+        estado["lock"].acquire()
+        if estado["nivel"] == 0:
+            try:
+                fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            except Exception:
+                estado["lock"].release()
+                raise
+            estado["fd"] = fd
+        estado["nivel"] += 1
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        estado = self._estado
+        estado["nivel"] -= 1
+        if estado["nivel"] == 0:
+            fd, estado["fd"] = estado["fd"], None
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+        estado["lock"].release()
+        return False
+
+def _caminho_temporario(caminho):
+    return f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def gravar_atomico(caminho, escrever, binario=False):
+    """Chama escrever(f) num temporário único, faz fsync e troca com os.replace"""
+    temporario = _caminho_temporario(caminho)
+    try:
+        with (open(temporario, "wb") if binario else open(temporario, "w", encoding="utf-8")) as f:
+            escrever(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, caminho)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+def gravar_json_atomico(caminho, dados, indent=4):
+    gravar_atomico(caminho, lambda f: json.dump(dados, f, indent=indent, ensure_ascii=False))
+
+def _copiar_json(valor):
+    """Cópia de dicts/listas aninhados; folhas (str, números) são compartilhadas"""
+    if isinstance(valor, dict):
+        return {k: _copiar_json(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_copiar_json(v) if isinstance(v, (dict, list)) else v for v in valor]
+    return valor
+
+class DictJSON(dict):
+    """Cópia entregue por carregar_*: `base` é o conteúdo de onde ela saiu, para que a
+    gravação aplique só o que este chamador mudou (e não apague o que outros gravaram)"""
+    base = None
+
+class ListaJSON(list):
+    base = None
+
+def _entregar(dados, base):
+    copia = (ListaJSON if isinstance(dados, list) else DictJSON)(_copiar_json(dados))
+    copia.base = base
+    return copia
+
+def _base_de(dados, vazio):
+    """Base da cópia; um dicionário/lista novo (sem base) só acrescenta, nunca remove"""
+    base = getattr(dados, "base", None)
+    return vazio() if base is None else base
+
+def _rebasear(dados, base=None):
+    """Depois de gravar, a cópia passa a ter como base o que ela mesma gravou"""
+    if isinstance(dados, (DictJSON, ListaJSON)):
+        dados.base = _copiar_json(dados) if base is None else base
+
+def _reaplicar_alteracoes(base, nossos, atuais):
+    """Aplica sobre `atuais` o que mudou de `base` para `nossos` (por chave ou por item de lista)"""
+    if isinstance(atuais, list):
+        removidos = [x for x in base if x not in nossos]
+        resultado = [x for x in atuais if x not in removidos]
+        resultado += [x for x in nossos if x not in base and x not in resultado]
+        return resultado
+    resultado = dict(atuais)
+    for chave in base:
+        if chave not in nossos:
+            resultado.pop(chave, None)
+    for chave, valor in nossos.items():
+        if chave not in base or base[chave] != valor:
+            resultado[chave] = valor
+    return resultado
 
 # ------------------------- Funções auxiliares -------------------------
-def salvar_log(msg):
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')}] {msg}\n")
+class ArquivoJSON:
+    """Conteúdo de um arquivo JSON mantido em memória; só é relido quando o arquivo muda.
+
+    Cada leitura custa um stat(): se mtime/tamanho/inode forem os da última leitura ou
+    gravação, não reinterpreta o arquivo. Cada chamador recebe a sua cópia (DictJSON/ListaJSON)
+    marcada com a versão de onde saiu; gravar() compara a cópia com essa base e reaplica só
+    as alterações dela sobre o conteúdo atual do arquivo. Assim quem segurou uma cópia antiga
+    (um diálogo aberto, outra thread) não desfaz o que outro processo ou thread gravou.
+    """
+
+    def __init__(self, caminho, vazio):
+        self.caminho = caminho
+        self.vazio = vazio
+        self._dados = None        # conteúdo interpretado; nunca alterado no lugar
+        self._assinatura = None
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.conflitos = 0
+
+    def _assinatura_atual(self):
+        try:
+            st = os.stat(self.caminho)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def ler(self):
+        assinatura = self._assinatura_atual()
+        with self._lock:
+            if self._dados is not None and assinatura is not None and assinatura == self._assinatura:
+                self.acertos += 1
+                return _entregar(self._dados, self._dados)
+            self.faltas += 1
+            dados, assinatura = self._ler_arquivo()
+            if dados is None:
+                # Arquivo ausente ou ilegível: não guarda, tenta de novo depois
+                self._dados = self._assinatura = None
+                return _entregar(self.vazio(), None)
+            self._dados, self._assinatura = dados, assinatura
+            return _entregar(dados, dados)
+
+    def _ler_arquivo(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                st = os.fstat(f.fileno())
+                content = f.read().strip()
+            return (json.loads(content) if content else self.vazio()), (st.st_mtime_ns, st.st_size, st.st_ino)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return None, None
+
+    def gravar(self, dados):
+        """Grava sob a trava, reaplicando sobre o conteúdo atual só o que mudou desde a base da cópia"""
+        with self._lock, TravaArquivo(self.caminho):
+            if self._dados is not None and self._assinatura_atual() == self._assinatura:
+                atuais = self._dados
+            else:
+                atuais, _ = self._ler_arquivo()
+                if atuais is None:
+                    atuais = self.vazio()
+            base = _base_de(dados, self.vazio)
+            if base is atuais:
+                resultado = dados   # ninguém gravou desde a leitura desta cópia
+            else:
+                resultado = _reaplicar_alteracoes(base, dados, atuais)
+                if getattr(dados, "base", None) is not None:
+                    self.conflitos += 1
+            try:
+                gravar_json_atomico(self.caminho, resultado)
+            except Exception:
+                self._dados = self._assinatura = None
+                raise
+            self._dados = _copiar_json(resultado)
+            self._assinatura = self._assinatura_atual()
+            _rebasear(dados, self._dados if resultado is dados else None)
+            return resultado
+
+    def versao(self):
+        return self._assinatura_atual()
+
+    def invalidar(self):
+        with self._lock:
+            self._dados = self._assinatura = None
+
+    def estatisticas(self):
+        total = self.acertos + self.faltas
+        return {"arquivo": os.path.basename(self.caminho), "acertos": self.acertos, "faltas": self.faltas,
+                "conflitos": self.conflitos, "taxa_acerto": self.acertos / total if total else None}
+
+# ------------------------- Diário de Alterações -------------------------
+LIMITE_DIARIO_BYTES = int(os.environ.get("COFRE_LIMITE_DIARIO", 256 * 1024))   # acima disso o diário é compactado
+
+class DiarioJSONL:
+    """Estado = snapshot JSON + diário JSONL só de acréscimos.
+
+    Cada alteração vira uma linha {"op": "set"|"del", "chave", "valor"} anexada ao diário com
+    um único fsync, então o custo por operação não depende do tamanho do estado. Ao abrir,
+    o snapshot é lido e o diário reaplicado; uma última linha incompleta (queda no meio da
+    escrita) é ignorada e, na próxima gravação, descartada. Quando o diário passa de `limite`
+    bytes, o estado é gravado num snapshot novo e o diário é trocado por um vazio (ambos com
+    os.replace). Reaplicar o diário sobre um snapshot já compactado dá o mesmo estado, então
+    uma queda entre as duas etapas não perde nada.
+
+    Com vários processos, gravações e compactações rodam sob TravaArquivo, e cada leitura
+    acompanha o diário: lê só as linhas acrescentadas desde a última vez, ou recarrega tudo
+    se o diário foi trocado por uma compactação. Cada diário começa com uma linha
+    {"op": "inicio", "geracao"} que identifica a troca (o inode pode ser reaproveitado).
+
+    O estado é um dicionário; `de_snapshot`/`para_snapshot` convertem quando o snapshot tem
+    outro formato (ex.: metadata.json guarda uma lista de arquivos).
+    """
+
+    def __init__(self, snapshot, diario, limite=None, de_snapshot=None, para_snapshot=None):
+        self.caminho = snapshot
+        self.diario = diario
+        self.limite = LIMITE_DIARIO_BYTES if limite is None else limite
+        self.de_snapshot = de_snapshot or (lambda dados: dict(dados))
+        self.para_snapshot = para_snapshot or (lambda estado: estado)
+        self._estado = None
+        self._arquivo = None
+        self._geracao = None
+        self._marca = None    # (inode, tamanho, mtime) do diário na última sincronização
+        self._tamanho = 0     # bytes do diário já aplicados (até a última linha completa)
+        self._lock = threading.RLock()
+        self.registros = 0
+        self.compactacoes = 0
+        self.recargas = 0
+
+    def _carregar(self):
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            estado = self.de_snapshot(json.loads(content)) if content else {}
+        except (json.JSONDecodeError, FileNotFoundError):
+            estado = {}
+        self._fechar_arquivo()
+        self._estado, self._geracao, self._tamanho, self.registros = estado, None, 0, 0
+        self.recargas += 1
+
+    @staticmethod
+    def _geracao_de(linha):
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            return None
+        return registro.get("geracao") if isinstance(registro, dict) and registro.get("op") == "inicio" else None
+
+    def _sincronizar(self):
+        """Aplica o que outros processos anexaram; recarrega se o diário foi trocado"""
+        try:
+            st = os.stat(self.diario)
+            if self._estado is not None and (st.st_ino, st.st_size, st.st_mtime_ns) == self._marca:
+                return  # nada mudou: custa só um stat()
+            f = open(self.diario, "rb")
+        except FileNotFoundError:
+            if self._estado is None or self._tamanho:
+                self._carregar()
+            self._marca = None
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            marca = (st.st_ino, st.st_size, st.st_mtime_ns)
+            geracao = self._geracao_de(f.readline())
+            if self._estado is None or geracao != self._geracao or st.st_size < self._tamanho:
+                self._carregar()
+                self._geracao = geracao
+            f.seek(self._tamanho)
+            novos = f.read()
+        self._marca = marca
+        for linha in novos.splitlines(keepends=True):
+            if not linha.endswith(b"\n"):
+                break  # ainda sendo escrita (ou resto de uma queda): fica para depois
+            try:
+                registro = json.loads(linha)
+                self._aplicar(self._estado, registro)
+            except (ValueError, KeyError, TypeError):
+                break
+            self._tamanho += len(linha)
+            self.registros += registro["op"] != "inicio"
+
+    @staticmethod
+    def _aplicar(estado, registro):
+        if registro["op"] == "set":
+            estado.pop(registro["chave"], None)  # regravar move para o fim, como remover + anexar
+            estado[registro["chave"]] = registro["valor"]
+        elif registro["op"] == "del":
+            estado.pop(registro["chave"], None)
+
+    def _fechar_arquivo(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def ler(self):
+        """Cópia do estado: o original continua sendo alterado por anexar() e por outras threads"""
+        with self._lock:
+            self._sincronizar()
+            return _copiar_json(self._estado)
+
+    def versao(self):
+        """Muda a cada alteração gravada, por este ou por outro processo"""
+        with self._lock:
+            self._sincronizar()
+            return (self._geracao, self._tamanho)
+
+    def anexar(self, operacoes):
+        """Grava [(op, chave, valor), ...] no diário (um fsync) e aplica ao estado.
+        Devolve (versão antes, versão depois) para quem mantém índices sobre o estado."""
+        registros = [{"op": op, "chave": chave, "valor": valor} if op == "set" else {"op": op, "chave": chave}
+                     for op, chave, valor in operacoes]
+        dados = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros).encode("utf-8")
+        with self._lock, TravaArquivo(self.diario):
+            self._sincronizar()
+            antes = (self._geracao, self._tamanho)
+            if not registros:
+                return antes, antes
+            if self._geracao is None:
+                # Diário novo (ou anterior a este formato): recomeça com uma geração própria
+                self.compactar()
+                antes = None
+            if self._arquivo is None:
+                self._arquivo = open(self.diario, "ab")
+            if os.fstat(self._arquivo.fileno()).st_size > self._tamanho:
+                # Resto de uma escrita interrompida: ninguém mais escreve enquanto temos a trava
+                self._arquivo.truncate(self._tamanho)
+                salvar_log(f"Diário {os.path.basename(self.diario)}: linha incompleta descartada")
+            self._arquivo.write(dados)
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self._tamanho += len(dados)
+            self.registros += len(registros)
+            for registro in registros:
+                self._aplicar(self._estado, registro)
+            if self._tamanho > self.limite:
+                self.compactar()
+            return antes, (self._geracao, self._tamanho)
+
+    def gravar(self, dados):
+        """Substitui o estado inteiro (grava snapshot novo e zera o diário)"""
+        with self._lock, TravaArquivo(self.diario):
+            self._sincronizar()
+            self._estado = _copiar_json(dict(dados))
+            self.compactar()
+
+    def compactar(self):
+        with self._lock, TravaArquivo(self.diario):
+            self._sincronizar()
+            gravar_json_atomico(self.caminho, self.para_snapshot(self._estado))
+            geracao = uuid.uuid4().hex
+            cabecalho = (json.dumps({"op": "inicio", "geracao": geracao}) + "\n").encode("utf-8")
+            temporario = _caminho_temporario(self.diario)
+            with open(temporario, "wb") as f:
+                f.write(cabecalho)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, self.diario)
+            self._fechar_arquivo()
+            self._geracao, self._tamanho, self._marca, self.registros = geracao, len(cabecalho), None, 0
+            self.compactacoes += 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {"arquivo": os.path.basename(self.diario), "registros": self.registros,
+                    "bytes": self._tamanho, "compactacoes": self.compactacoes, "recargas": self.recargas}
+
+def benchmark_diario(tamanhos=(100, 1000, 10000), repeticoes=20):
+    """Custo de criar uma sessão com N já gravadas: reescrever o JSON x anexar ao diário"""
+    resultados = []
+    print(f"{'sessões':>9} {'JSON ms':>9} {'diário ms':>10}")
+    for n in tamanhos:
+        sessoes = {f"s{i}": {"usuario": f"usuario{i % 50}", "autenticado_em": "2025-01-01 00:00:00",
+                             "expira_em": "2025-01-01 00:15:00", "metodo": "facial"} for i in range(n)}
+        with tempfile.TemporaryDirectory() as pasta:
+            arquivo = ArquivoJSON(os.path.join(pasta, "sessoes.json"), dict)
+            arquivo.gravar(dict(sessoes))
+            diario = DiarioJSONL(os.path.join(pasta, "d.json"), os.path.join(pasta, "d.jsonl"), limite=float("inf"))
+            diario.gravar(dict(sessoes))
+            tempos = {"json": [], "diario": []}
+            for r in range(repeticoes):
+                registro = dict(sessoes["s0"])
+                inicio = time.perf_counter()
+                dados = arquivo.ler()
+                dados[f"novo{r}"] = registro
+                arquivo.gravar(dados)
+                tempos["json"].append(time.perf_counter() - inicio)
+                inicio = time.perf_counter()
+                diario.anexar([("set", f"novo{r}", registro)])
+                tempos["diario"].append(time.perf_counter() - inicio)
+            if diario._arquivo is not None:
+                diario._arquivo.close()
+        medianas = {k: sorted(v)[len(v) // 2] * 1000 for k, v in tempos.items()}
+        resultados.append({"sessoes": n, **medianas})
+        print(f"{n:>9} {medianas['json']:>9.2f} {medianas['diario']:>10.2f}")
+    return resultados
+
+ARQUIVO_USUARIOS = ArquivoJSON(USERS_FILE, dict)
+ARQUIVO_PASTAS = ArquivoJSON(PASTAS_FILE, list)
+DIARIO_SESSOES = DiarioJSONL(SESSOES_FILE, SESSOES_DIARIO_FILE)
+ARQUIVO_ADMINS = ArquivoJSON(ADMINS_FILE, dict)
+
+def estatisticas_cache_json():
+    return [a.estatisticas() for a in (ARQUIVO_USUARIOS, ARQUIVO_PASTAS, ARQUIVO_ADMINS)]
+
+# ------------------------- Motores de Armazenamento -------------------------
+# carregar_*/salvar_* delegam ao motor ativo: os arquivos JSON de sempre ou um banco SQLite
+# (data/cofre.db, criado pelo comando migrar-sqlite). Com o banco presente ele é usado
+# automaticamente; COFRE_ARMAZENAMENTO=json|sqlite força a escolha.
+MOTOR_ARMAZENAMENTO = os.environ.get("COFRE_ARMAZENAMENTO", "auto")
+
+class ArmazenamentoJSON:
+    """Documentos JSON inteiros (um por tipo de dado), com o cache de ArquivoJSON.
+    As sessões usam um DiarioJSONL: criar/encerrar anexa uma linha em vez de reescrever."""
+    nome = "json"
+
+    def __init__(self, usuarios=ARQUIVO_USUARIOS, pastas=ARQUIVO_PASTAS, sessoes=DIARIO_SESSOES, admins=ARQUIVO_ADMINS):
+        self.arquivos = {"usuarios": usuarios, "pastas": pastas, "sessoes": sessoes, "admins": admins}
+
+    def ler(self, tipo):
+        return self.arquivos[tipo].ler()
+
+    def gravar(self, tipo, dados):
+        self.arquivos[tipo].gravar(dados)
+
+    def versao(self, tipo):
+        return self.arquivos[tipo].versao()
+
+    # gravar_item/remover_itens devolvem (versão antes, versão depois) da gravação
+    def gravar_item(self, tipo, chave, valor):
+        if isinstance(self.arquivos[tipo], DiarioJSONL):
+            return self.arquivos[tipo].anexar([("set", chave, valor)])
+        dados = self.ler(tipo)
+        dados[chave] = valor
+        self.gravar(tipo, dados)
+        return None, self.versao(tipo)
+
+    def remover_itens(self, tipo, chaves):
+        if isinstance(self.arquivos[tipo], DiarioJSONL):
+            return self.arquivos[tipo].anexar([("del", chave, None) for chave in chaves])
+        dados = self.ler(tipo)
+        for chave in chaves:
+            dados.pop(chave, None)
+        self.gravar(tipo, dados)
+        return None, self.versao(tipo)
+
+    def assinatura_usuarios(self):
+        try:
+            st = os.stat(self.arquivos["usuarios"].caminho)
+        except FileNotFoundError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+class ArmazenamentoSQLite:
+    """Banco SQLite em modo WAL com tabelas indexadas e gravação por linha.
+
+    salvar_* continuam recebendo o dicionário inteiro, mas só as linhas que mudaram em
+    relação à base da cópia (ver DictJSON) são escritas. Embeddings ficam em BLOB (float64, sem
+    perda em relação ao JSON). Cada tipo tem um contador de versão na tabela meta: a leitura
+    só remonta o dicionário quando a versão muda (ex.: gravação de outro processo).
+    """
+    nome = "sqlite"
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS usuarios (nome TEXT PRIMARY KEY, embedding BLOB, extra TEXT);
+        CREATE TABLE IF NOT EXISTS usuario_pastas (
+            usuario TEXT NOT NULL REFERENCES usuarios(nome) ON DELETE CASCADE,
+            posicao INTEGER NOT NULL, pasta TEXT NOT NULL, PRIMARY KEY (usuario, posicao));
+        CREATE INDEX IF NOT EXISTS idx_usuario_pastas_pasta ON usuario_pastas(pasta);
+        CREATE TABLE IF NOT EXISTS pastas (posicao INTEGER PRIMARY KEY, caminho TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS admins (usuario TEXT PRIMARY KEY, senha_hash TEXT, nivel TEXT, criado_em TEXT, extra TEXT);
+        CREATE TABLE IF NOT EXISTS sessoes (id TEXT PRIMARY KEY, usuario TEXT, autenticado_em TEXT, expira_em TEXT,
+                                            metodo TEXT, extra TEXT);
+        CREATE INDEX IF NOT EXISTS idx_sessoes_usuario ON sessoes(usuario);
+        CREATE INDEX IF NOT EXISTS idx_sessoes_expira ON sessoes(expira_em);
+    """
+    COLUNAS = {"admins": ("senha_hash", "nivel", "criado_em"),
+               "sessoes": ("usuario", "autenticado_em", "expira_em", "metodo")}
+    CHAVES = {"admins": "usuario", "sessoes": "id"}
+
+    def __init__(self, caminho=BANCO_FILE):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._cache = {}       # tipo -> (versão, conteúdo nunca alterado no lugar)
+        self._conexao().executescript(self.ESQUEMA)
+
+    def _conexao(self):
+        con = getattr(self._local, "conexao", None)
+        if con is None:
+            import sqlite3
+            con = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA foreign_keys=ON")
+            self._local.conexao = con
+        return con
+
+    def _transacao(self):
+        motor = self
+
+        class _Transacao:
+            def __enter__(self):
+                self.con = motor._conexao()
+                self.con.execute("BEGIN IMMEDIATE")
+                return self.con
+
+            def __exit__(self, tipo, valor, tb):
+                self.con.execute("COMMIT" if tipo is None else "ROLLBACK")
+                return False
+        return _Transacao()
+
+    def _versao(self, con, tipo):
+        linha = con.execute("SELECT valor FROM meta WHERE chave = ?", (tipo,)).fetchone()
+        return linha[0] if linha else 0
+
+    def _incrementar_versao(self, con, tipo):
+        con.execute("INSERT INTO meta (chave, valor) VALUES (?, 1) "
+                    "ON CONFLICT(chave) DO UPDATE SET valor = valor + 1", (tipo,))
+        return self._versao(con, tipo)
+
+    # --- leitura ---
+    def _montar(self, con, tipo):
+        if tipo == "usuarios":
+            pastas = {}
+            for usuario, pasta in con.execute("SELECT usuario, pasta FROM usuario_pastas ORDER BY usuario, posicao"):
+                pastas.setdefault(usuario, []).append(pasta)
+            dados = {}
+            for nome, emb, extra in con.execute("SELECT nome, embedding, extra FROM usuarios ORDER BY rowid"):
+                info = json.loads(extra) if extra else {}
+                info["pastas"] = pastas.get(nome, [])
+                info["embedding"] = np.frombuffer(emb, dtype=np.float64).tolist() if emb is not None else None
+                dados[nome] = info
+            return dados
+        if tipo == "pastas":
+            return [c for (c,) in con.execute("SELECT caminho FROM pastas ORDER BY posicao")]
+        colunas = self.COLUNAS[tipo]
+        dados = {}
+        for linha in con.execute(f"SELECT {self.CHAVES[tipo]}, {', '.join(colunas)}, extra FROM {tipo} ORDER BY rowid"):
+            info = json.loads(linha[-1]) if linha[-1] else {}
+            info.update({c: v for c, v in zip(colunas, linha[1:-1]) if v is not None})
+            dados[linha[0]] = info
+        return dados
+
+    def ler(self, tipo):
+        con = self._conexao()
+        with self._lock:
+            versao = self._versao(con, tipo)
+            guardado = self._cache.get(tipo)
+            if guardado is None or guardado[0] != versao:
+                con.execute("BEGIN")
+                try:
+                    versao = self._versao(con, tipo)
+                    guardado = self._cache[tipo] = (versao, self._montar(con, tipo))
+                finally:
+                    con.execute("COMMIT")
+            return _entregar(guardado[1], guardado[1])
+
+    # --- gravação ---
+    def _linha_usuario(self, con, nome, info):
+        emb = info.get("embedding")
+        blob = np.asarray(emb, dtype=np.float64).tobytes() if emb is not None else None
+        extra = {k: v for k, v in info.items() if k not in ("pastas", "embedding")}
+        con.execute("INSERT INTO usuarios (nome, embedding, extra) VALUES (?, ?, ?) "
+                    "ON CONFLICT(nome) DO UPDATE SET embedding = excluded.embedding, extra = excluded.extra",
+                    (nome, blob, json.dumps(extra, ensure_ascii=False) if extra else None))
+        con.execute("DELETE FROM usuario_pastas WHERE usuario = ?", (nome,))
+        con.executemany("INSERT INTO usuario_pastas (usuario, posicao, pasta) VALUES (?, ?, ?)",
+                        [(nome, i, p) for i, p in enumerate(info.get("pastas") or [])])
+
+    def _linha_registro(self, con, tipo, chave, info):
+        colunas = self.COLUNAS[tipo]
+        extra = {k: v for k, v in info.items() if k not in colunas}
+        valores = [chave] + [info.get(c) for c in colunas] + [json.dumps(extra, ensure_ascii=False) if extra else None]
+        nomes = (self.CHAVES[tipo],) + colunas + ("extra",)
+        atualizacao = ", ".join(f"{c} = excluded.{c}" for c in nomes[1:])
+        con.execute(f"INSERT INTO {tipo} ({', '.join(nomes)}) VALUES ({', '.join('?' * len(nomes))}) "
+                    f"ON CONFLICT({nomes[0]}) DO UPDATE SET {atualizacao}", valores)
+
+    def _gravar_linhas(self, con, tipo, alterados, removidos, dados):
+        if tipo == "usuarios":
+            con.executemany("DELETE FROM usuarios WHERE nome = ?", [(k,) for k in removidos])
+            for chave in alterados:
+                self._linha_usuario(con, chave, dados[chave])
+        else:
+            con.executemany(f"DELETE FROM {tipo} WHERE {self.CHAVES[tipo]} = ?", [(k,) for k in removidos])
+            for chave in alterados:
+                self._linha_registro(con, tipo, chave, dados[chave])
+
+    def gravar(self, tipo, dados):
+        """Grava apenas as diferenças entre a cópia e a base de onde ela saiu.
+
+        As diferenças são calculadas contra a leitura do chamador, não contra o banco atual:
+        linhas que outro processo (ou outra cópia) mudou e este chamador não ficam intactas.
+        Sem base (dicionário montado à mão), só insere/atualiza, nunca apaga.
+        """
+        with self._lock:
+            base = _base_de(dados, list if tipo == "pastas" else dict)
+            guardado = self._cache.get(tipo)
+            with self._transacao() as con:
+                antes = self._versao(con, tipo)
+                if tipo == "pastas":
+                    atuais = self._montar(con, tipo)
+                    referencia = _reaplicar_alteracoes(base, dados, atuais)
+                    if referencia != atuais:
+                        con.execute("DELETE FROM pastas")
+                        con.executemany("INSERT INTO pastas (posicao, caminho) VALUES (?, ?)", list(enumerate(referencia)))
+                else:
+                    removidos = [k for k in base if k not in dados]
+                    alterados = [k for k, v in dados.items() if base.get(k) != v]
+                    self._gravar_linhas(con, tipo, alterados, removidos, dados)
+                    referencia = None
+                    if guardado is not None and guardado[0] == antes:
+                        # Ninguém gravou desde o nosso cache: atualiza em vez de remontar
+                        referencia = dict(guardado[1])
+                        for chave in removidos:
+                            referencia.pop(chave, None)
+                        for chave in alterados:
+                            referencia[chave] = _copiar_json(dados[chave])
+                versao = self._incrementar_versao(con, tipo)
+            if referencia is not None:
+                self._cache[tipo] = (versao, referencia)
+            else:
+                self._cache.pop(tipo, None)
+            _rebasear(dados)
+
+    def versao(self, tipo):
+        return self._versao(self._conexao(), tipo)
+
+    def gravar_item(self, tipo, chave, valor):
+        """Grava um único registro (usuário, admin ou sessão) sem comparar os demais"""
+        with self._lock:
+            with self._transacao() as con:
+                if tipo == "usuarios":
+                    self._linha_usuario(con, chave, valor)
+                else:
+                    self._linha_registro(con, tipo, chave, valor)
+                versao = self._incrementar_versao(con, tipo)
+            guardado = self._cache.get(tipo)
+            if guardado is not None and guardado[0] == versao - 1:
+                # Nenhuma outra gravação no meio: atualiza o cache em vez de remontar
+                referencia = dict(guardado[1])
+                referencia[chave] = _copiar_json(valor)
+                self._cache[tipo] = (versao, referencia)
+            else:
+                self._cache.pop(tipo, None)
+            return versao - 1, versao
+
+    def remover_itens(self, tipo, chaves):
+        """Apaga registros pela chave numa única transação"""
+        chaves = list(chaves)
+        with self._lock:
+            with self._transacao() as con:
+                con.executemany(f"DELETE FROM {tipo} WHERE {self.CHAVES.get(tipo, 'nome')} = ?", [(k,) for k in chaves])
+                versao = self._incrementar_versao(con, tipo)
+            guardado = self._cache.get(tipo)
+            if guardado is not None and guardado[0] == versao - 1:
+                referencia = dict(guardado[1])
+                for chave in chaves:
+                    referencia.pop(chave, None)
+                self._cache[tipo] = (versao, referencia)
+            else:
+                self._cache.pop(tipo, None)
+            return versao - 1, versao
+
+    def assinatura_usuarios(self):
+        return ["sqlite", self._versao(self._conexao(), "usuarios")]
+
+_armazenamento = None
+_lock_armazenamento = threading.Lock()
+
+def obter_armazenamento():
+    global _armazenamento
+    if _armazenamento is None:
+        with _lock_armazenamento:
+            if _armazenamento is None:
+                motor = MOTOR_ARMAZENAMENTO
+                if motor == "auto":
+                    motor = "sqlite" if os.path.exists(BANCO_FILE) else "json"
+                _armazenamento = ArmazenamentoSQLite() if motor == "sqlite" else ArmazenamentoJSON()
+    return _armazenamento
+
+def migrar_para_sqlite(banco=BANCO_FILE, forcar=False):
+    """Copia os JSON atuais (usuários, pastas, admins, sessões) para um banco SQLite novo"""
+    global _armazenamento
+    if os.path.exists(banco):
+        if not forcar:
+            print(f"{banco} já existe (use --forcar para recriar).")
+            return None
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(banco + sufixo):
+                os.remove(banco + sufixo)
+    origem = ArmazenamentoJSON()
+    destino = ArmazenamentoSQLite(banco)
+    contagem = {}
+    for tipo in ("usuarios", "pastas", "admins", "sessoes"):
+        dados = origem.ler(tipo)
+        destino.gravar(tipo, list(dados) if tipo == "pastas" else dict(dados))  # sem base: grava tudo
+        if len(destino._montar(destino._conexao(), tipo)) != len(dados):
+            raise Exception(f"Migração de {tipo} incompleta")
+        contagem[tipo] = len(dados)
+    if banco == BANCO_FILE:
+        _armazenamento = destino
+        salvar_galeria()  # a origem da galeria passa a ser o banco
+    salvar_log(f"Dados migrados para SQLite ({banco}): " + ", ".join(f"{n} {t}" for t, n in contagem.items()))
+    return contagem
+
+def benchmark_armazenamento(tamanhos=(100, 1000, 10000), repeticoes=5):
+    """Custo de gravar um usuário novo com N usuários já cadastrados: JSON inteiro x SQLite"""
+    rng = np.random.default_rng(0)
+    resultados = []
+    print(f"{'usuários':>9} {'JSON ms':>9} {'SQLite dict ms':>15} {'SQLite linha ms':>16}")
+    for n in tamanhos:
+        usuarios = {f"usuario{i}": {"pastas": ["/dados/compartilhado"], "embedding": rng.normal(0, 0.1, DIMENSAO_EMBEDDING).tolist()}
+                    for i in range(n)}
+        with tempfile.TemporaryDirectory() as pasta:
+            motor_json = ArmazenamentoJSON(usuarios=ArquivoJSON(os.path.join(pasta, "usuarios.json"), dict))
+            motor_sqlite = ArmazenamentoSQLite(os.path.join(pasta, "cofre.db"))
+            tempos = {}
+            for rotulo, motor, por_linha in (("json", motor_json, False), ("sqlite", motor_sqlite, False),
+                                             ("sqlite_linha", motor_sqlite, True)):
+                motor.gravar("usuarios", dict(usuarios))
+                medidas = []
+                for r in range(repeticoes):
+                    dados = motor.ler("usuarios")
+                    nome = f"novo_{rotulo}_{r}"
+                    info = {"pastas": [], "embedding": rng.normal(0, 0.1, DIMENSAO_EMBEDDING).tolist()}
+                    inicio = time.perf_counter()
+                    if por_linha:
+                        motor.gravar_item("usuarios", nome, info)
+                    else:
+                        dados[nome] = info
+                        motor.gravar("usuarios", dados)
+                    medidas.append(time.perf_counter() - inicio)
+                tempos[rotulo] = sorted(medidas)[len(medidas) // 2] * 1000
+            motor_sqlite._conexao().close()
+        resultados.append({"usuarios": n, **tempos})
+        print(f"{n:>9} {tempos['json']:>9.2f} {tempos['sqlite']:>15.2f} {tempos['sqlite_linha']:>16.2f}")
+    return resultados
 
 def carregar_usuarios():
-    try:
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return {}
-            return json.loads(content)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
+    return obter_armazenamento().ler("usuarios")
 
 def salvar_usuarios(data):
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    obter_armazenamento().gravar("usuarios", data)
+    salvar_galeria()  # relê: inclui alterações de outros processos reaplicadas na gravação
+
+def salvar_usuario(nome, info):
+    """Grava um único usuário (no SQLite, uma linha; no JSON, o arquivo inteiro)"""
+    obter_armazenamento().gravar_item("usuarios", nome, info)
+    salvar_galeria()
 
 def carregar_pastas():
-    try:
-        with open(PASTAS_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return []
-            return json.loads(content)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
+    return obter_armazenamento().ler("pastas")
 
 def salvar_pastas(lista):
-    with open(PASTAS_FILE, "w", encoding="utf-8") as f:
-        json.dump(lista, f, indent=4, ensure_ascii=False)
+    obter_armazenamento().gravar("pastas", lista)
 
 # ------------------------- Funções de Sessão -------------------------
 def carregar_sessoes():
-    try:
-        with open(SESSOES_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return {}
-            return json.loads(content)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
+    return obter_armazenamento().ler("sessoes")
+
+# ------------------------- Armazenamento de Sessões -------------------------
+DURACAO_SESSAO = 15 * 60     # segundos
+INTERVALO_LIMPEZA_SESSOES = 60
+LOTE_LIMPEZA_SESSOES = 256
+
+class ArmazemSessoes:
+    """Sessões em memória: validar é uma consulta ao dicionário, sem ler arquivo.
+
+    Cada sessão guarda o prazo numérico (expira_ts) além do texto expira_em. Os prazos ficam
+    num heap; uma thread de limpeza acorda no próximo vencimento (ou a cada
+    INTERVALO_LIMPEZA_SESSOES) e remove as vencidas em lotes. Há também um índice por
+    usuário para revogar todas as sessões de alguém. A persistência é por registro:
+    criar grava uma sessão, encerrar/expirar apaga só as chaves afetadas.
+
+    Cada operação confere a versão do armazenamento (no diário, inode + tamanho; no SQLite,
+    o contador): se outro processo gravou sessões, os índices são reconstruídos.
+    """
+
+    def __init__(self, duracao=DURACAO_SESSAO, intervalo=INTERVALO_LIMPEZA_SESSOES, lote=LOTE_LIMPEZA_SESSOES):
+        self.duracao = duracao
+        self.intervalo = intervalo
+        self.lote = lote
+        self._sessoes = None      # id -> registro
+        self._versao = None       # versão do armazenamento refletida nos índices
+        self._por_usuario = {}    # usuario -> {ids}
+        self._prazos = []         # heap (expira_ts, id); entradas de sessões já removidas são ignoradas
+        self._cond = threading.Condition()
+        self._limpeza = None
+        self.expiradas = 0
+
+    @staticmethod
+    def _prazo(registro):
+        if "expira_ts" in registro:
+            return float(registro["expira_ts"])
+        try:
+            return datetime.datetime.strptime(registro["expira_em"], '%Y-%m-%d %H:%M:%S').timestamp()
+        except (KeyError, ValueError):
+            return 0.0
+
+    def _carregar(self):
+        # Chamado com self._cond adquirido
+        versao = obter_armazenamento().versao("sessoes")
+        if self._sessoes is not None and versao == self._versao:
+            return
+        self._sessoes = dict(carregar_sessoes())
+        self._por_usuario = {}
+        self._prazos = []
+        for sessao_id, registro in self._sessoes.items():
+            self._por_usuario.setdefault(registro.get("usuario"), set()).add(sessao_id)
+            self._prazos.append((self._prazo(registro), sessao_id))
+        heapq.heapify(self._prazos)
+        self._versao = versao
+        if self._limpeza is None:
+            self._limpeza = threading.Thread(target=self._executar_limpeza, name="limpeza-sessoes", daemon=True)
+            self._limpeza.start()
+
+    def _gravado(self, versoes):
+        # Se ninguém gravou entre a nossa última leitura e esta gravação, os índices seguem válidos
+        antes, depois = versoes
+        self._versao = depois if antes is not None and antes == self._versao else None
+
+    def _retirar(self, sessao_id):
+        registro = self._sessoes.pop(sessao_id, None)
+        if registro is not None:
+            ids = self._por_usuario.get(registro.get("usuario"))
+            if ids is not None:
+                ids.discard(sessao_id)
+                if not ids:
+                    del self._por_usuario[registro.get("usuario")]
+        return registro
+
+    def criar(self, usuario, metodo="facial"):
+        sessao_id = str(uuid.uuid4())
+        agora = datetime.datetime.now()
+        expira = agora + datetime.timedelta(seconds=self.duracao)
+        registro = {
+            "usuario": usuario,
+            "autenticado_em": agora.strftime('%Y-%m-%d %H:%M:%S'),
+            "expira_em": expira.strftime('%Y-%m-%d %H:%M:%S'),
+            "expira_ts": expira.timestamp(),
+            "metodo": metodo
+        }
+        with self._cond:
+            self._carregar()
+            self._sessoes[sessao_id] = registro
+            self._por_usuario.setdefault(usuario, set()).add(sessao_id)
+            heapq.heappush(self._prazos, (registro["expira_ts"], sessao_id))
+            self._gravado(obter_armazenamento().gravar_item("sessoes", sessao_id, registro))
+            self._cond.notify()
+        return sessao_id
+
+    def obter(self, sessao_id):
+        """Registro da sessão se ainda válida; a vencida é removida na hora"""
+        if not sessao_id:
+            return None
+        with self._cond:
+            self._carregar()
+            registro = self._sessoes.get(sessao_id)
+            if registro is None:
+                return None
+            if time.time() <= self._prazo(registro):
+                return registro
+            self._retirar(sessao_id)
+            self._gravado(obter_armazenamento().remover_itens("sessoes", [sessao_id]))
+            self.expiradas += 1
+        salvar_log(f"Sessão {sessao_id} expirou")
+        return None
 
-def salvar_sessoes(data):
-    with open(SESSOES_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    def encerrar(self, sessao_id):
+        if not sessao_id:
+            return None
+        with self._cond:
+            self._carregar()
+            registro = self._retirar(sessao_id)
+            if registro is not None:
+                self._gravado(obter_armazenamento().remover_itens("sessoes", [sessao_id]))
+        return registro
+
+    def revogar_usuario(self, usuario):
+        """Encerra todas as sessões do usuário; devolve quantas eram"""
+        with self._cond:
+            self._carregar()
+            ids = list(self._por_usuario.get(usuario, ()))
+            for sessao_id in ids:
+                self._retirar(sessao_id)
+            if ids:
+                self._gravado(obter_armazenamento().remover_itens("sessoes", ids))
+        return len(ids)
+
+    def limpar_expiradas(self, agora=None):
+        """Remove até self.lote sessões vencidas; devolve quantas removeu"""
+        agora = time.time() if agora is None else agora
+        removidas = []
+        with self._cond:
+            self._carregar()
+            while self._prazos and self._prazos[0][0] < agora and len(removidas) < self.lote:
+                _, sessao_id = heapq.heappop(self._prazos)
+                registro = self._sessoes.get(sessao_id)
+                # Entrada obsoleta (sessão já encerrada) ou prazo diferente: só descarta do heap
+                if registro is not None and self._prazo(registro) < agora:
+                    self._retirar(sessao_id)
+                    removidas.append(sessao_id)
+            if removidas:
+                self._gravado(obter_armazenamento().remover_itens("sessoes", removidas))
+                self.expiradas += len(removidas)
+        if removidas:
+            salvar_log(f"{len(removidas)} sessões expiradas removidas")
+        return len(removidas)
+
+    def _executar_limpeza(self):
+        while True:
+            try:
+                while self.limpar_expiradas() >= self.lote:
+                    pass  # ainda há vencidas: continua no próximo lote
+            except Exception as e:
+                salvar_log(f"Erro na limpeza de sessões: {e}")
+            with self._cond:
+                espera = self.intervalo
+                if self._prazos:
+                    espera = min(espera, max(0.0, self._prazos[0][0] - time.time()) + 0.01)
+                self._cond.wait(espera)
+
+    def estatisticas(self):
+        with self._cond:
+            self._carregar()
+            return {"ativas": len(self._sessoes), "usuarios": len(self._por_usuario),
+                    "heap": len(self._prazos), "expiradas": self.expiradas}
+
+SESSOES = ArmazemSessoes()
 
 def criar_sessao(usuario):
-    import uuid
-    sessoes = carregar_sessoes()
-    sessao_id = str(uuid.uuid4())
-    agora = datetime.datetime.now()
-    expira = agora + datetime.timedelta(minutes=15)
-    sessoes[sessao_id] = {
-        "usuario": usuario,
-        "autenticado_em": agora.strftime('%Y-%m-%d %H:%M:%S'),
-        "expira_em": expira.strftime('%Y-%m-%d %H:%M:%S'),
-        "metodo": "facial"
-    }
-    salvar_sessoes(sessoes)
-    salvar_log(f"Sessão criada para '{usuario}' (ID: {sessao_id}, expira em 15min)")
+    sessao_id = SESSOES.criar(usuario)
+    salvar_log(f"Sessão criada para '{usuario}' (ID: {sessao_id}, expira em {int(SESSOES.duracao // 60)}min)")
     return sessao_id
 
+def obter_sessao(sessao_id):
+    return SESSOES.obter(sessao_id)
+
 def validar_sessao(sessao_id):
-    if not sessao_id:
-        return None
-    sessoes = carregar_sessoes()
-    if sessao_id not in sessoes:
-        return None
-    sessao = sessoes[sessao_id]
-    expira = datetime.datetime.strptime(sessao["expira_em"], '%Y-%m-%d %H:%M:%S')
-    if datetime.datetime.now() > expira:
-        del sessoes[sessao_id]
-        salvar_sessoes(sessoes)
-        salvar_log(f"Sessão {sessao_id} expirou")
-        return None
-    return sessao["usuario"]
+    sessao = SESSOES.obter(sessao_id)
+    return sessao["usuario"] if sessao else None
 
 def encerrar_sessao(sessao_id):
-    if not sessao_id:
-        return
-    sessoes = carregar_sessoes()
-    if sessao_id in sessoes:
-        usuario = sessoes[sessao_id]["usuario"]
-        del sessoes[sessao_id]
-        salvar_sessoes(sessoes)
-        salvar_log(f"Sessão encerrada para '{usuario}' (ID: {sessao_id})")
+    sessao = SESSOES.encerrar(sessao_id)
+    if sessao is not None:
+        salvar_log(f"Sessão encerrada para '{sessao['usuario']}' (ID: {sessao_id})")
+
+def revogar_sessoes_usuario(usuario):
+    quantidade = SESSOES.revogar_usuario(usuario)
+    if quantidade:
+        salvar_log(f"{quantidade} sessão(ões) de '{usuario}' revogada(s)")
+    return quantidade
 
 # ------------------------- Funções de Cofre -------------------------
 def obter_cofre_usuario(usuario):
@@ -143,35 +1284,192 @@ def obter_cofre_usuario(usuario):
     os.makedirs(cofre_path, exist_ok=True)
     return cofre_path
 
+# metadata.json é o snapshot e metadata.jsonl o diário; o estado é indexado pelo nome do arquivo
+_diarios_metadata = {}
+_lock_diarios_metadata = threading.Lock()
+
+def _metadata_para_estado(metadata):
+    return {a["nome"]: a for a in metadata.get("arquivos", [])}
+
+def _estado_para_metadata(estado):
+    return {"arquivos": list(estado.values())}
+
+def diario_metadata(usuario):
+    with _lock_diarios_metadata:
+        diario = _diarios_metadata.get(usuario)
+        if diario is None:
+            cofre_path = obter_cofre_usuario(usuario)
+            diario = DiarioJSONL(os.path.join(cofre_path, "metadata.json"), os.path.join(cofre_path, "metadata.jsonl"),
+                                 de_snapshot=_metadata_para_estado, para_snapshot=_estado_para_metadata)
+            _diarios_metadata[usuario] = diario
+        return diario
+
 def obter_metadata_cofre(usuario):
-    metadata_file = os.path.join(obter_cofre_usuario(usuario), "metadata.json")
-    if not os.path.exists(metadata_file):
-        return {"arquivos": []}
-    try:
-        with open(metadata_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except:
-        return {"arquivos": []}
+    return _estado_para_metadata(diario_metadata(usuario).ler())
 
 def salvar_metadata_cofre(usuario, metadata):
-    metadata_file = os.path.join(obter_cofre_usuario(usuario), "metadata.json")
-    with open(metadata_file, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=4, ensure_ascii=False)
+    diario_metadata(usuario).gravar(_metadata_para_estado(metadata))
+
+def registrar_arquivo_cofre(usuario, entrada):
+    """Adiciona (ou substitui, pelo nome) um arquivo na metadata do cofre"""
+    diario_metadata(usuario).anexar([("set", entrada["nome"], entrada)])
+
+def remover_arquivo_cofre(usuario, nome_arquivo):
+    diario_metadata(usuario).anexar([("del", nome_arquivo, None)])
+
+# ------------------------- Teste de Concorrência -------------------------
+COFRE_TESTE_CONCORRENCIA = "compartilhado"
+
+def _embedding_teste(nome):
+    """Embedding fixo por nome, para conferir cada linha da galeria contra o seu usuário"""
+    semente = int(hashlib.sha256(nome.encode()).hexdigest()[:8], 16)
+    return np.random.default_rng(semente).normal(size=DIMENSAO_EMBEDDING).round(6).tolist()
+
+def _trabalhador_concorrencia(indice, operacoes):
+    """Um quiosque do teste: cria/encerra sessões, envia arquivos e altera pastas e usuários"""
+    criadas, encerradas, erros = [], [], []
+    parar = threading.Event()
+
+    def leitor():
+        # Como o aquecimento e o login: lê usuários e galeria enquanto o quiosque grava.
+        # O teste só acrescenta usuários, então a galeria aceita por carregar_galeria tem de
+        # conter todos os lidos antes dela, cada um com o próprio embedding
+        while not parar.is_set():
+            try:
+                usuarios = carregar_usuarios()
+                GaleriaFacial.de_usuarios(usuarios)
+                galeria = carregar_galeria()
+            except Exception as e:
+                erros.append(repr(e))
+                return
+            faltando = set(usuarios) - set(galeria.nomes)
+            trocadas = [nome for nome, linha in zip(galeria.nomes, galeria.matriz)
+                        if not np.array_equal(linha, np.asarray(_embedding_teste(nome), dtype=np.float32))]
+            if faltando or trocadas:
+                erros.append(f"galeria carregada sem {len(faltando)} usuários e com {len(trocadas)} linhas trocadas")
+                return
+
+    thread_leitora = threading.Thread(target=leitor, daemon=True)
+    thread_leitora.start()
+    # Cópias seguradas o teste inteiro, como um diálogo do painel deixado aberto: gravadas
+    # no fim, não podem desfazer o que este e os outros processos gravaram no meio tempo
+    usuarios_antigos, pastas_antigas = carregar_usuarios(), carregar_pastas()
+    for k in range(operacoes):
+        sessao_id = criar_sessao(f"quiosque{indice}")
+        criadas.append(sessao_id)
+        registrar_arquivo_cofre(COFRE_TESTE_CONCORRENCIA, {
+            "nome": f"q{indice}_{k}.bin", "tamanho": k,
+            "data_upload": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        if k % 2:
+            encerrar_sessao(sessao_id)
+            encerradas.append(sessao_id)
+        if k % 5 == 0:
+            # Ciclo carregar -> alterar -> salvar, como no painel de administrador
+            pastas = carregar_pastas()
+            pastas.append(f"/quiosque{indice}/{k}")
+            salvar_pastas(pastas)
+            usuarios = carregar_usuarios()
+            usuarios[f"q{indice}_{k}"] = {"pastas": [], "embedding": _embedding_teste(f"q{indice}_{k}")}
+            salvar_usuarios(usuarios)
+    usuarios_antigos[f"q{indice}_antigo"] = {"pastas": [], "embedding": _embedding_teste(f"q{indice}_antigo")}
+    salvar_usuarios(usuarios_antigos)
+    pastas_antigas.append(f"/quiosque{indice}/antigo")
+    salvar_pastas(pastas_antigas)
+    parar.set()
+    thread_leitora.join()
+    print(json.dumps({"criadas": criadas, "encerradas": encerradas, "erros": erros}))
+
+def _conferir_galeria(pasta, motor):
+    """Problemas da galeria gravada em `pasta`: par matriz/índice misturado, desatualizada ou trocada"""
+    usuarios = motor.ler("usuarios")
+    try:
+        with open(os.path.join(pasta, os.path.basename(GALERIA_INDICE_FILE)), "r", encoding="utf-8") as f:
+            indice = json.load(f)
+        matriz, marca = _ler_matriz_galeria(os.path.join(pasta, os.path.basename(GALERIA_FILE)))
+    except (OSError, ValueError) as e:
+        return [f"galeria ilegível: {e}"]
+    problemas = []
+    if marca != indice.get("marca"):
+        problemas.append("matriz e índice de gravações diferentes")
+    if indice.get("origem") != motor.assinatura_usuarios():
+        problemas.append("galeria gravada a partir de usuários desatualizados")
+    divergentes = set(usuarios) ^ set(indice.get("nomes", []))
+    if divergentes:
+        problemas.append(f"{len(divergentes)} usuários divergentes entre galeria e cadastro")
+    trocadas = sum(1 for nome, linha in zip(indice.get("nomes", []), matriz) if nome in usuarios
+                   and not np.array_equal(linha, np.asarray(usuarios[nome]["embedding"], dtype=np.float32)))
+    if trocadas:
+        problemas.append(f"{trocadas} linhas da galeria com embedding de outro usuário")
+    return problemas
+
+def teste_concorrencia(processos=8, operacoes=50, armazenamento="json", limite_diario=4096):
+    """Vários processos sobre o mesmo data/ temporário; confere que nenhuma alteração se perdeu"""
+    pasta = tempfile.mkdtemp(prefix="cofre_concorrencia_")
+    ambiente = dict(os.environ, COFRE_DATA_DIR=pasta, COFRE_ARMAZENAMENTO=armazenamento,
+                    COFRE_LIMITE_DIARIO=str(limite_diario))
+    print(f"{processos} processos x {operacoes} operações ({armazenamento}) em {pasta}")
+    inicio = time.perf_counter()
+    filhos = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "trabalhador-concorrencia", str(i), str(operacoes)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=ambiente)
+              for i in range(processos)]
+    criadas, encerradas, erros = set(), set(), []
+    for filho in filhos:
+        saida, erro = filho.communicate()
+        if filho.returncode != 0:
+            print(f"Processo falhou:\n{erro}")
+            return None
+        resultado = json.loads(saida.strip().splitlines()[-1])
+        criadas.update(resultado["criadas"])
+        encerradas.update(resultado["encerradas"])
+        erros.extend(resultado["erros"])
+    duracao = time.perf_counter() - inicio
+
+    # Relê tudo do disco com objetos novos, como um processo recém-iniciado
+    if armazenamento == "sqlite":
+        motor = ArmazenamentoSQLite(os.path.join(pasta, "cofre.db"))
+    else:
+        motor = ArmazenamentoJSON(usuarios=ArquivoJSON(os.path.join(pasta, "usuarios.json"), dict),
+                                  pastas=ArquivoJSON(os.path.join(pasta, "pastas.json"), list),
+                                  sessoes=DiarioJSONL(os.path.join(pasta, "sessoes.json"), os.path.join(pasta, "sessoes.jsonl")),
+                                  admins=ArquivoJSON(os.path.join(pasta, "admins.json"), dict))
+    cofre = os.path.join(pasta, "cofres", COFRE_TESTE_CONCORRENCIA)
+    metadata = DiarioJSONL(os.path.join(cofre, "metadata.json"), os.path.join(cofre, "metadata.jsonl"),
+                           de_snapshot=_metadata_para_estado).ler()
+    esperados = {
+        "sessoes": criadas - encerradas,
+        "arquivos": {f"q{i}_{k}.bin" for i in range(processos) for k in range(operacoes)},
+        "pastas": {f"/quiosque{i}/{k}" for i in range(processos) for k in range(0, operacoes, 5)}
+                  | {f"/quiosque{i}/antigo" for i in range(processos)},
+        "usuarios": {f"q{i}_{k}" for i in range(processos) for k in range(0, operacoes, 5)}
+                    | {f"q{i}_antigo" for i in range(processos)},
+    }
+    encontrados = {"sessoes": set(motor.ler("sessoes")), "arquivos": set(metadata),
+                   "pastas": set(motor.ler("pastas")), "usuarios": set(motor.ler("usuarios"))}
+    ok = True
+    for tipo, esperado in esperados.items():
+        perdidos = esperado - encontrados[tipo]
+        sobrando = encontrados[tipo] - esperado
+        ok = ok and not perdidos and not sobrando
+        print(f"{tipo:<10} esperados {len(esperado):>6}  encontrados {len(encontrados[tipo]):>6}  "
+              f"perdidos {len(perdidos):>4}  sobrando {len(sobrando):>4}")
+    for problema in _conferir_galeria(pasta, motor) + [f"leitura concorrente: {e}" for e in erros]:
+        ok = False
+        print(f"galeria    {problema}")
+    total = processos * operacoes
+    print(f"{total} ciclos em {duracao:.1f} s ({total / duracao:.0f} ciclos/s)")
+    print("OK: nenhuma alteração perdida, galeria consistente" if ok else "FALHA: alterações perdidas ou galeria inconsistente")
+    if ok:
+        import shutil
+        shutil.rmtree(pasta, ignore_errors=True)
+    return ok
 
 # ------------------------- Funções de Administradores -------------------------
 def carregar_admins():
-    try:
-        with open(ADMINS_FILE, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return {}
-            return json.loads(content)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
+    return obter_armazenamento().ler("admins")
 
 def salvar_admins(admins):
-    with open(ADMINS_FILE, "w", encoding="utf-8") as f:
-        json.dump(admins, f, indent=4, ensure_ascii=False)
+    obter_armazenamento().gravar("admins", admins)
 
 def autenticar_admin(usuario, senha):
     admins = carregar_admins()
@@ -247,6 +1545,2949 @@ def alterar_senha_admin(usuario, senha_antiga, senha_nova):
     salvar_log(f"[ADMIN] Senha alterada para '{usuario}'")
     return True, "Senha alterada com sucesso"
 
+# ------------------------- Galeria Facial -------------------------
+TOLERANCIA_FACIAL = 0.6  # mesmo padrão de face_recognition.compare_faces
+DIMENSAO_EMBEDDING = 128
+
+Correspondencia = namedtuple("Correspondencia", ["nome", "distancia", "margem"])
+
+class GaleriaFacial:
+    """Embeddings cadastrados empilhados em uma matriz float32 contígua para busca vetorizada"""
+
+    def __init__(self, nomes, matriz, total_usuarios=None):
+        self.nomes = list(nomes)
+        self.total_usuarios = len(self.nomes) if total_usuarios is None else total_usuarios
+        self.matriz = np.ascontiguousarray(matriz, dtype=np.float32).reshape(-1, DIMENSAO_EMBEDDING)
+        # Normas ao quadrado pré-calculadas: |a - b|² = |a|² + |b|² - 2a·b
+        self.normas = np.einsum("ij,ij->i", self.matriz, self.matriz)
+
+    def __len__(self):
+        return len(self.nomes)
+
+    @classmethod
+    def de_usuarios(cls, usuarios):
+        """Monta a galeria a partir do dicionário de usuários, ignorando embeddings inválidos"""
+        nomes = []
+        linhas = []
+        for nome, info in usuarios.items():
+            emb = info.get("embedding", None)
+            if emb is None:
+                continue
+            try:
+                vetor = np.asarray(emb, dtype=np.float32)
+            except (TypeError, ValueError):
+                continue
+            if vetor.shape != (DIMENSAO_EMBEDDING,):
+                continue
+            nomes.append(nome)
+            linhas.append(vetor)
+        if linhas:
+            matriz = np.stack(linhas)
+        else:
+            matriz = np.empty((0, DIMENSAO_EMBEDDING), dtype=np.float32)
+        return cls(nomes, matriz, total_usuarios=len(usuarios))
+
+    def distancias(self, rostos, linhas=None):
+        """Distâncias euclidianas (rostos x usuários) calculadas em uma única operação"""
+        rostos = np.asarray(rostos, dtype=np.float32).reshape(-1, DIMENSAO_EMBEDDING)
+        matriz = self.matriz if linhas is None else self.matriz[linhas]
+        normas = self.normas if linhas is None else self.normas[linhas]
+        normas_rostos = np.einsum("ij,ij->i", rostos, rostos)
+        d2 = rostos @ matriz.T
+        d2 *= -2.0
+        d2 += normas_rostos[:, None]
+        d2 += normas[None, :]
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2, out=d2)
+
+    def _correspondencias(self, dist, linhas=None):
+        """Converte uma matriz de distâncias em Correspondencia (melhor + margem) por linha"""
+        if dist.shape[1] == 0:
+            return [None] * dist.shape[0]
+        if dist.shape[1] == 1:
+            nome = self.nomes[0 if linhas is None else linhas[0]]
+            return [Correspondencia(nome, float(d[0]), float("inf")) for d in dist]
+        # argpartition separa os dois menores sem ordenar a linha inteira
+        dois_menores = np.argpartition(dist, 1, axis=1)[:, :2]
+        resultados = []
+        for i, (a, b) in enumerate(dois_menores):
+            if dist[i, b] < dist[i, a]:
+                a, b = b, a
+            nome = self.nomes[a if linhas is None else linhas[a]]
+            resultados.append(Correspondencia(nome, float(dist[i, a]), float(dist[i, b] - dist[i, a])))
+        return resultados
+
+    def comparar(self, rostos):
+        """Retorna, para cada rosto, o usuário mais próximo com distância e margem para o segundo colocado"""
+        if len(self) == 0 or len(rostos) == 0:
+            return [None] * len(rostos)
+        return self._correspondencias(self.distancias(rostos))
+
+    def identificar(self, rostos, tolerancia=TOLERANCIA_FACIAL):
+        """Melhor correspondência entre todos os rostos do quadro dentro da tolerância, ou None"""
+        candidatos = [c for c in self.comparar(rostos) if c is not None and c.distancia <= tolerancia]
+        if not candidatos:
+            return None
+        return min(candidatos, key=lambda c: c.distancia)
+
+# Arquivo binário da galeria: matriz float32 (.npy, mapeável em memória) + índice JSON com
+# os nomes de cada linha e a assinatura (mtime/tamanho) do usuarios.json que a originou.
+# Logo após os dados da matriz vai uma marca aleatória (np.load ignora bytes finais) que
+# também fica no índice: um leitor que pegue a matriz de uma gravação e o índice de outra
+# percebe a diferença e reconstrói, em vez de associar nomes às linhas erradas.
+VERSAO_GALERIA = 2
+TAMANHO_MARCA_GALERIA = 32
+
+def _gravar_matriz_galeria(caminho, matriz, marca):
+    with open(caminho, "wb") as f:
+        np.save(f, matriz)
+        f.write(marca.encode("ascii"))
+        f.flush()
+        os.fsync(f.fileno())
+
+def _ler_matriz_galeria(caminho, mmap=False):
+    """Matriz e marca de galeria.npy, lidas do mesmo arquivo aberto (mesmo que seja substituído)"""
+    with open(caminho, "rb") as f:
+        f.seek(-TAMANHO_MARCA_GALERIA, os.SEEK_END)
+        marca = f.read().decode("ascii", "replace")
+        f.seek(0)
+        if not mmap:
+            return np.lib.format.read_array(f), marca
+        versao = np.lib.format.read_magic(f)
+        if versao == (1, 0):
+            forma, fortran, tipo = np.lib.format.read_array_header_1_0(f)
+        else:
+            forma, fortran, tipo = np.lib.format.read_array_header_2_0(f)
+        matriz = np.memmap(f, dtype=tipo, mode="r", offset=f.tell(), shape=forma, order="F" if fortran else "C")
+        return matriz, marca
+
+def _assinatura_usuarios():
+    """Identifica a versão dos usuários gravados (arquivo JSON ou contador do banco)"""
+    return obter_armazenamento().assinatura_usuarios()
+
+def _galeria_gravada():
+    """Galeria binária atual, mesmo que desatualizada (usada para atualizar o índice incrementalmente)"""
+    try:
+        with open(GALERIA_INDICE_FILE, "r", encoding="utf-8") as f:
+            indice = json.load(f)
+        matriz, marca = _ler_matriz_galeria(GALERIA_FILE)
+        if marca != indice.get("marca"):
+            return None
+        return GaleriaFacial(indice["nomes"], matriz)
+    except (OSError, ValueError, KeyError, EOFError):
+        return None
+
+def salvar_galeria(usuarios=None):
+    """Regrava o arquivo binário da galeria; sem argumento, lê os usuários atuais sob a trava"""
+    with TravaArquivo(GALERIA_FILE):
+        # A assinatura é tirada antes da leitura: se outro processo gravar no meio, a galeria
+        # fica marcada como mais antiga do que é e só é reconstruída no próximo login
+        origem = _assinatura_usuarios()
+        if usuarios is None:
+            usuarios = carregar_usuarios()
+        galeria = GaleriaFacial.de_usuarios(usuarios)
+        anterior = _galeria_gravada() if os.path.exists(INDICE_ANN_FILE) else None
+        marca = os.urandom(TAMANHO_MARCA_GALERIA // 2).hex()
+        indice = {
+            "versao": VERSAO_GALERIA,
+            "origem": origem,
+            "marca": marca,
+            "total_usuarios": galeria.total_usuarios,
+            "nomes": galeria.nomes
+        }
+        temporario = _caminho_temporario(GALERIA_FILE)
+        try:
+            # Grava primeiro a matriz e depois o índice: se algo falhar no meio,
+            # a marca não bate e a galeria é reconstruída no próximo login
+            _gravar_matriz_galeria(temporario, galeria.matriz, marca)
+            os.replace(temporario, GALERIA_FILE)
+            gravar_json_atomico(GALERIA_INDICE_FILE, indice, indent=None)
+        except OSError as e:
+            # Ex.: no Windows a galeria antiga pode estar mapeada por um login em andamento
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            salvar_log(f"Falha ao gravar galeria binária: {e}")
+        atualizar_indice_ann(galeria, anterior)
+    return galeria
+
+def carregar_galeria():
+    """Carrega a galeria binária sem ler o usuarios.json; reconstrói se estiver desatualizada"""
+    try:
+        with open(GALERIA_INDICE_FILE, "r", encoding="utf-8") as f:
+            indice = json.load(f)
+        if indice.get("versao") == VERSAO_GALERIA and indice.get("origem") == _assinatura_usuarios():
+            matriz, marca = _ler_matriz_galeria(GALERIA_FILE, mmap=True)
+            if marca == indice.get("marca") and matriz.shape == (len(indice["nomes"]), DIMENSAO_EMBEDDING):
+                return GaleriaFacial(indice["nomes"], matriz, total_usuarios=indice.get("total_usuarios"))
+    except (OSError, ValueError, KeyError, EOFError):  # EOFError: .npy truncado
+        pass
+    return salvar_galeria()
+
+# ------------------------- Índice Aproximado (IVF) -------------------------
+# Para galerias muito grandes a busca exata cresce linearmente com o número de usuários.
+# O índice IVF agrupa os embeddings em listas (k-means) e, no login, só compara o rosto
+# com os usuários das N listas cujos centróides estão mais próximos.
+LIMIAR_INDICE_ANN = 20000   # a partir deste tamanho de galeria o login usa o índice
+IVF_SONDAGENS = 8           # listas visitadas por consulta (maior = mais recall, mais lento)
+IVF_ITERACOES = 10
+
+def _mais_proximos(vetores, centroides, bloco=8192):
+    """Índice do centróide mais próximo de cada vetor, processado em blocos para limitar memória"""
+    normas_c = np.einsum("ij,ij->i", centroides, centroides)
+    rotulos = np.empty(len(vetores), dtype=np.int32)
+    for i in range(0, len(vetores), bloco):
+        parte = np.asarray(vetores[i:i + bloco], dtype=np.float32)
+        # |v|² é constante por linha e não altera o argmin
+        d2 = normas_c[None, :] - 2.0 * (parte @ centroides.T)
+        rotulos[i:i + bloco] = np.argmin(d2, axis=1)
+    return rotulos
+
+class IndiceIVF:
+    """Índice de arquivo invertido: centróides k-means + lista de cada usuário"""
+
+    def __init__(self, centroides, rotulos=None, treinado_com=0):
+        self.centroides = np.ascontiguousarray(centroides, dtype=np.float32)
+        self.rotulos = dict(rotulos or {})  # nome -> lista
+        self.treinado_com = treinado_com
+
+    @classmethod
+    def treinar(cls, matriz, nomes, n_listas=None, iteracoes=IVF_ITERACOES, semente=0):
+        n = len(matriz)
+        if n_listas is None:
+            n_listas = max(1, int(2 * np.sqrt(n)))
+        n_listas = min(n_listas, n)
+        rng = np.random.default_rng(semente)
+        # Treina em uma amostra (~40 pontos por lista) e depois atribui todos
+        amostra = np.asarray(matriz[rng.choice(n, size=min(n, 40 * n_listas), replace=False)], dtype=np.float32)
+        centroides = amostra[rng.choice(len(amostra), size=n_listas, replace=False)].copy()
+        for _ in range(iteracoes):
+            rotulos = _mais_proximos(amostra, centroides)
+            contagem = np.bincount(rotulos, minlength=n_listas)
+            somas = np.zeros_like(centroides)
+            np.add.at(somas, rotulos, amostra)
+            vazias = contagem == 0
+            centroides[~vazias] = somas[~vazias] / contagem[~vazias, None]
+            # Listas vazias são re-semeadas com pontos aleatórios da amostra
+            if vazias.any():
+                centroides[vazias] = amostra[rng.choice(len(amostra), size=int(vazias.sum()))]
+        rotulos = _mais_proximos(matriz, centroides)
+        return cls(centroides, zip(nomes, rotulos.tolist()), treinado_com=n)
+
+    def precisa_retreinar(self, n):
+        """Os centróides deixam de representar bem a galeria quando ela dobra ou cai pela metade"""
+        return n > 2 * self.treinado_com or n < self.treinado_com // 2
+
+    def sincronizar(self, galeria, anterior=None):
+        """Atualiza incrementalmente as listas: remove excluídos e (re)atribui novos ou alterados"""
+        atuais = set(galeria.nomes)
+        for nome in [n for n in self.rotulos if n not in atuais]:
+            del self.rotulos[nome]
+        linhas = [i for i, n in enumerate(galeria.nomes) if n not in self.rotulos]
+        if anterior is not None:
+            linha_anterior = {n: i for i, n in enumerate(anterior.nomes)}
+            comuns = [(i, linha_anterior[n]) for i, n in enumerate(galeria.nomes)
+                      if n in self.rotulos and n in linha_anterior]
+            if comuns:
+                novas, antigas = map(list, zip(*comuns))
+                alterados = np.any(galeria.matriz[novas] != anterior.matriz[antigas], axis=1)
+                linhas.extend(np.asarray(novas)[alterados].tolist())
+        if linhas:
+            rotulos = _mais_proximos(galeria.matriz[linhas], self.centroides)
+            for i, r in zip(linhas, rotulos.tolist()):
+                self.rotulos[galeria.nomes[i]] = r
+        return len(linhas)
+
+    def salvar(self, caminho=None):
+        caminho = caminho or INDICE_ANN_FILE
+        nomes = list(self.rotulos)
+        gravar_atomico(caminho, lambda f: np.savez(
+            f, centroides=self.centroides, nomes=np.array(nomes, dtype=str),
+            rotulos=np.array([self.rotulos[n] for n in nomes], dtype=np.int32),
+            treinado_com=np.array(self.treinado_com)), binario=True)
+
+    @classmethod
+    def carregar(cls, caminho=None):
+        try:
+            with np.load(caminho or INDICE_ANN_FILE) as dados:
+                return cls(dados["centroides"], zip(dados["nomes"].tolist(), dados["rotulos"].tolist()),
+                           treinado_com=int(dados["treinado_com"]))
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+
+class BuscaIVF:
+    """Mesma interface de busca da GaleriaFacial, mas restrita às listas mais próximas do rosto"""
+
+    def __init__(self, galeria, indice, n_sondagens=IVF_SONDAGENS):
+        self.galeria = galeria
+        self.indice = indice
+        self.n_sondagens = min(n_sondagens, len(indice.centroides))
+        self.normas_centroides = np.einsum("ij,ij->i", indice.centroides, indice.centroides)
+        n_listas = len(indice.centroides)
+        # Usuários ainda não indexados (-1) são sempre comparados, para não perder ninguém
+        rotulos = np.array([indice.rotulos.get(n, -1) for n in galeria.nomes], dtype=np.int64)
+        self.sempre = np.flatnonzero(rotulos < 0)
+        rotulos[rotulos < 0] = n_listas
+        # Linhas da galeria ordenadas por lista; inicio[c]:inicio[c+1] são os membros da lista c
+        self.ordem = np.argsort(rotulos, kind="stable")
+        self.inicio = np.concatenate([[0], np.cumsum(np.bincount(rotulos, minlength=n_listas + 1))])
+
+    def __len__(self):
+        return len(self.galeria)
+
+    @property
+    def total_usuarios(self):
+        return self.galeria.total_usuarios
+
+    def candidatos(self, rosto):
+        """Linhas da galeria nas listas cujos centróides estão mais próximos do rosto"""
+        dc = self.normas_centroides - 2.0 * (self.indice.centroides @ rosto)
+        sondas = np.argpartition(dc, self.n_sondagens - 1)[:self.n_sondagens]
+        partes = [self.ordem[self.inicio[c]:self.inicio[c + 1]] for c in sondas]
+        partes.append(self.sempre)
+        return np.concatenate(partes)
+
+    def comparar(self, rostos):
+        resultados = []
+        for rosto in np.asarray(rostos, dtype=np.float32).reshape(-1, DIMENSAO_EMBEDDING):
+            linhas = self.candidatos(rosto)
+            if len(linhas) == 0:
+                resultados.append(None)
+                continue
+            dist = self.galeria.distancias(rosto, linhas)
+            resultados.extend(self.galeria._correspondencias(dist, linhas))
+        return resultados
+
+    identificar = GaleriaFacial.identificar
+
+def atualizar_indice_ann(galeria, anterior=None):
+    """Mantém o índice IVF em dia com a galeria; só é criado quando a galeria passa do limiar"""
+    existe = os.path.exists(INDICE_ANN_FILE)
+    if len(galeria) < LIMIAR_INDICE_ANN and not existe:
+        return None
+    try:
+        indice = IndiceIVF.carregar() if existe else None
+        if indice is None or indice.precisa_retreinar(len(galeria)):
+            indice = IndiceIVF.treinar(galeria.matriz, galeria.nomes)
+            salvar_log(f"Índice facial IVF treinado ({len(galeria)} usuários, {len(indice.centroides)} listas)")
+        else:
+            indice.sincronizar(galeria, anterior)
+        indice.salvar()
+        return indice
+    except (OSError, ValueError) as e:
+        salvar_log(f"Falha ao atualizar índice facial IVF: {e}")
+        return None
+
+def obter_buscador(galeria):
+    """Busca exata para galerias pequenas; índice IVF acima de LIMIAR_INDICE_ANN usuários"""
+    if len(galeria) < LIMIAR_INDICE_ANN:
+        return galeria
+    indice = IndiceIVF.carregar() or atualizar_indice_ann(galeria)
+    if indice is None:
+        return galeria
+    return BuscaIVF(galeria, indice)
+
+def benchmark_indice_ann(n_usuarios=100000, n_consultas=200, sondagens=(1, 2, 4, 8, 16, 32), n_listas=None, galeria=None):
+    """Compara recall@1 e latência do índice IVF com a busca exata"""
+    rng = np.random.default_rng(0)
+    if galeria is None:
+        # Galeria sintética com estrutura de agrupamentos, como embeddings reais
+        centros = rng.normal(0, 0.15, (max(1, n_usuarios // 50), DIMENSAO_EMBEDDING))
+        matriz = centros[rng.integers(len(centros), size=n_usuarios)] + rng.normal(0, 0.05, (n_usuarios, DIMENSAO_EMBEDDING))
+        galeria = GaleriaFacial([f"u{i}" for i in range(n_usuarios)], matriz)
+    n = len(galeria)
+    # Consultas: embeddings cadastrados com ruído, simulando uma nova captura da mesma pessoa
+    alvos = rng.integers(n, size=n_consultas)
+    consultas = galeria.matriz[alvos] + rng.normal(0, 0.035, (n_consultas, DIMENSAO_EMBEDDING)).astype(np.float32)
+
+    inicio = time.perf_counter()
+    exatos = [galeria.comparar(q)[0].nome for q in consultas]
+    ms_exato = (time.perf_counter() - inicio) * 1000 / n_consultas
+    print(f"Galeria: {n} usuários, {n_consultas} consultas")
+    print(f"Busca exata: {ms_exato:.3f} ms/consulta")
+
+    inicio = time.perf_counter()
+    indice = IndiceIVF.treinar(galeria.matriz, galeria.nomes, n_listas=n_listas)
+    print(f"Treino IVF ({len(indice.centroides)} listas): {time.perf_counter() - inicio:.2f} s")
+    print(f"{'sondagens':>10} {'recall@1':>9} {'ms/consulta':>12} {'aceleração':>11}")
+    for p in sondagens:
+        busca = BuscaIVF(galeria, indice, n_sondagens=p)
+        inicio = time.perf_counter()
+        aproximados = [busca.comparar(q)[0] for q in consultas]
+        ms = (time.perf_counter() - inicio) * 1000 / n_consultas
+        acertos = sum(1 for a, e in zip(aproximados, exatos) if a is not None and a.nome == e)
+        print(f"{busca.n_sondagens:>10} {acertos / n_consultas:>9.3f} {ms:>12.3f} {ms_exato / ms:>10.1f}x")
+
+# ------------------------- Métricas de Desempenho -------------------------
+JANELA_METRICAS = 512         # amostras mantidas por etapa (histograma móvel)
+INTERVALO_EXPORTACAO = 2.0    # segundos entre exportações automáticas para arquivo
+
+class _Cronometro:
+    __slots__ = ("metricas", "etapa", "inicio")
+
+    def __init__(self, metricas, etapa):
+        self.metricas = metricas
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metricas.registrar(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+class MetricasDesempenho:
+    """Tempos por etapa dos loops de câmera em janelas móveis, com FPS e contadores.
+
+    As etapas são nomeadas "loop/etapa" (ex.: "login/deteccao"). O resumo traz p50/p95/p99
+    em ms (da janela) e a contagem e a soma acumuladas desde o início do processo, e pode ser
+    exportado como JSON e no formato texto do Prometheus.
+    """
+
+    def __init__(self, janela=JANELA_METRICAS):
+        self.janela = janela
+        self._lock = threading.Lock()
+        self.tempos = {}
+        self.totais = {}          # etapa -> [medições, soma em s] desde o início; não giram com a janela
+        self.contadores = {}
+        self.quadros = {}
+        self._ultima_exportacao = 0.0
+
+    def medir(self, etapa):
+        """with METRICAS.medir("login/deteccao"): ..."""
+        return _Cronometro(self, etapa)
+
+    def registrar(self, etapa, segundos):
+        with self._lock:
+            amostras = self.tempos.get(etapa)
+            if amostras is None:
+                amostras = self.tempos[etapa] = deque(maxlen=self.janela)
+            amostras.append(segundos)
+            total = self.totais.get(etapa)
+            if total is None:
+                total = self.totais[etapa] = [0, 0.0]
+            total[0] += 1
+            total[1] += segundos
+
+    def contar(self, nome, n=1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def marcar_quadro(self, nome):
+        """Registra o instante de um quadro entregue, para calcular o FPS da janela"""
+        with self._lock:
+            instantes = self.quadros.get(nome)
+            if instantes is None:
+                instantes = self.quadros[nome] = deque(maxlen=self.janela)
+            instantes.append(time.monotonic())
+
+    def resumo(self):
+        with self._lock:
+            tempos = {k: list(v) for k, v in self.tempos.items()}
+            totais = {k: tuple(v) for k, v in self.totais.items()}
+            quadros = {k: list(v) for k, v in self.quadros.items()}
+            contadores = dict(self.contadores)
+        etapas = {}
+        for etapa, amostras in sorted(tempos.items()):
+            if not amostras:
+                continue
+            p50, p95, p99 = np.percentile(amostras, [50, 95, 99]) * 1000
+            medicoes, soma = totais[etapa]
+            etapas[etapa] = {"amostras": len(amostras), "media_ms": float(np.mean(amostras)) * 1000,
+                             "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99),
+                             "total": medicoes, "soma_ms": soma * 1000}
+        fps = {}
+        for nome, instantes in sorted(quadros.items()):
+            if len(instantes) >= 2 and instantes[-1] > instantes[0]:
+                fps[nome] = (len(instantes) - 1) / (instantes[-1] - instantes[0])
+        return {"gerado_em": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "pid": os.getpid(),
+                "etapas": etapas, "fps": fps, "contadores": contadores}
+
+    def texto_prometheus(self, resumo=None):
+        resumo = resumo or self.resumo()
+        linhas = ["# TYPE cofre_etapa_ms summary"]
+        for etapa, r in resumo["etapas"].items():
+            loop, _, nome = etapa.rpartition("/")
+            rotulos = f'loop="{loop}",etapa="{nome}"'
+            for q, chave in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                linhas.append(f'cofre_etapa_ms{{{rotulos},quantile="{q}"}} {r[chave]:.3f}')
+            # Quantis da janela móvel; _sum e _count acumulados, como o Prometheus espera
+            linhas.append(f"cofre_etapa_ms_sum{{{rotulos}}} {r['soma_ms']:.3f}")
+            linhas.append(f"cofre_etapa_ms_count{{{rotulos}}} {r['total']}")
+        linhas.append("# TYPE cofre_fps gauge")
+        for nome, valor in resumo["fps"].items():
+            linhas.append(f'cofre_fps{{fluxo="{nome}"}} {valor:.2f}')
+        linhas.append("# TYPE cofre_total counter")
+        for nome, valor in resumo["contadores"].items():
+            linhas.append(f'cofre_total{{contador="{nome}"}} {valor}')
+        return "\n".join(linhas) + "\n"
+
+    def exportar(self, arquivo_json=None, arquivo_prom=None):
+        """Grava o resumo em JSON e em texto Prometheus (substituição atômica)"""
+        resumo = self.resumo()
+        gravar_json_atomico(arquivo_json or DESEMPENHO_FILE, resumo)
+        texto = self.texto_prometheus(resumo)
+        gravar_atomico(arquivo_prom or DESEMPENHO_PROM_FILE, lambda f: f.write(texto))
+        self._ultima_exportacao = time.monotonic()
+        return resumo
+
+    def exportar_periodicamente(self):
+        """Exporta no máximo a cada INTERVALO_EXPORTACAO segundos (chamado pelos loops)"""
+        if time.monotonic() - self._ultima_exportacao >= INTERVALO_EXPORTACAO:
+            try:
+                self.exportar()
+            except OSError:
+                pass
+
+METRICAS = MetricasDesempenho()
+
+def carregar_desempenho():
+    try:
+        with open(DESEMPENHO_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# ------------------------- Fontes de Quadros -------------------------
+FONTE_CAMERA = 0  # índice da câmera, arquivo de vídeo, pasta de imagens ou "sintetico[:imagem]"
+
+class FonteQuadros:
+    """Mesma interface usada do cv2.VideoCapture (isOpened/read/release).
+
+    Fontes finitas marcam `terminou` quando acabam, para os loops saírem sem erro.
+    """
+    terminou = False
+
+    def isOpened(self):
+        return True
+
+    def instante(self):
+        """Posição (s) do último quadro lido dentro da gravação, quando a fonte souber"""
+        return None
+
+    def descricao(self):
+        """Identificação do último quadro lido (ex.: nome do arquivo), quando houver"""
+        return None
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+class _Ritmo:
+    """Entrega quadros no ritmo de uma câmera real (fps) em vez de o mais rápido possível"""
+
+    def __init__(self, fps):
+        self.intervalo = 1.0 / fps if fps and fps > 0 else 0.0
+        self.proximo = None
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        agora = time.monotonic()
+        if self.proximo is None or agora > self.proximo + self.intervalo:
+            self.proximo = agora
+        elif self.proximo > agora:
+            time.sleep(self.proximo - agora)
+        self.proximo += self.intervalo
+
+class FonteCamera(FonteQuadros):
+    def __init__(self, indice=0):
+        self.captura = cv2.VideoCapture(indice)
+
+    def isOpened(self):
+        return self.captura.isOpened()
+
+    def read(self):
+        return self.captura.read()
+
+    def release(self):
+        self.captura.release()
+
+class FonteVideo(FonteQuadros):
+    """Arquivo de vídeo gravado; com tempo_real=True reproduz no fps original, como a câmera"""
+
+    def __init__(self, caminho, tempo_real=True):
+        self.captura = cv2.VideoCapture(caminho)
+        fps = self.captura.get(cv2.CAP_PROP_FPS) or 30
+        self.ritmo = _Ritmo(fps if tempo_real else 0)
+
+    def isOpened(self):
+        return self.captura.isOpened()
+
+    def read(self):
+        self.ritmo.esperar()
+        ret, frame = self.captura.read()
+        if not ret:
+            self.terminou = True
+        return ret, frame
+
+    def instante(self):
+        return self.captura.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+    def release(self):
+        self.captura.release()
+
+class FonteImagens(FonteQuadros):
+    """Pasta com uma sequência de imagens (ordem alfabética)"""
+
+    def __init__(self, pasta, fps=30, tempo_real=True):
+        self.arquivos = [os.path.join(pasta, a) for a in sorted(os.listdir(pasta))
+                         if os.path.splitext(a)[1].lower() in EXTENSOES_IMAGEM]
+        self.posicao = 0
+        self.fps = fps
+        self.ritmo = _Ritmo(fps if tempo_real else 0)
+
+    def instante(self):
+        return (self.posicao - 1) / self.fps if self.fps else None
+
+    def descricao(self):
+        return os.path.basename(self.arquivos[self.posicao - 1]) if self.posicao else None
+
+    def isOpened(self):
+        return bool(self.arquivos)
+
+    def read(self):
+        while self.posicao < len(self.arquivos):
+            self.ritmo.esperar()
+            frame = cv2.imread(self.arquivos[self.posicao])
+            self.posicao += 1
+            if frame is not None:
+                return True, frame
+        self.terminou = True
+        return False, None
+
+class FonteSintetica(FonteQuadros):
+    """Gera quadros sem câmera: fundo com ruído e, opcionalmente, uma foto se movendo pela cena"""
+
+    def __init__(self, imagem=None, largura=640, altura=480, fps=30, n_quadros=300, tempo_real=True):
+        self.largura = largura
+        self.altura = altura
+        self.n_quadros = n_quadros
+        self.gerados = 0
+        self.ritmo = _Ritmo(fps if tempo_real else 0)
+        self.rng = np.random.default_rng(0)
+        self.fundo = self.rng.integers(40, 90, (altura, largura, 3), dtype=np.uint8)
+        self.foto = None
+        if imagem:
+            foto = cv2.imread(imagem)
+            if foto is None:
+                raise Exception(f"Imagem sintética não encontrada: {imagem}")
+            fator = min(1.0, 0.6 * altura / foto.shape[0], 0.6 * largura / foto.shape[1])
+            self.foto = cv2.resize(foto, (0, 0), fx=fator, fy=fator) if fator < 1.0 else foto
+
+    def read(self):
+        if self.n_quadros and self.gerados >= self.n_quadros:
+            self.terminou = True
+            return False, None
+        self.ritmo.esperar()
+        frame = self.fundo.copy()
+        if self.foto is not None:
+            # Leve vaivém horizontal, para exercitar rastreio e detector de movimento
+            h, w = self.foto.shape[:2]
+            folga = self.largura - w
+            x = int(folga / 2 + folga / 4 * np.sin(self.gerados / 15.0))
+            y = (self.altura - h) // 2
+            frame[y:y + h, x:x + w] = self.foto
+        self.gerados += 1
+        return True, frame
+
+def abrir_fonte(origem=FONTE_CAMERA, tempo_real=True):
+    """Cria a fonte a partir de índice de câmera, vídeo, pasta de imagens ou "sintetico[:imagem]".
+
+    Câmeras são compartilhadas: o retorno é uma assinatura do GerenciadorCamera do índice.
+    """
+    if isinstance(origem, int) or str(origem).isdigit():
+        return obter_gerenciador_camera(int(origem)).assinar()
+    origem = str(origem)
+    if origem.startswith("sintetico"):
+        return FonteSintetica(imagem=origem.partition(":")[2] or None, tempo_real=tempo_real)
+    if os.path.isdir(origem):
+        return FonteImagens(origem, tempo_real=tempo_real)
+    return FonteVideo(origem, tempo_real=tempo_real)
+
+# ------------------------- Câmera Compartilhada -------------------------
+TEMPO_OCIOSO_CAMERA = 30.0     # segundos sem assinantes antes de liberar o dispositivo
+TIMEOUT_ABERTURA_CAMERA = 10.0
+TIMEOUT_QUADRO_CAMERA = 2.0
+MAX_FALHAS_CAMERA = 30         # leituras seguidas sem quadro antes de considerar a câmera perdida
+
+class GerenciadorCamera:
+    """Mantém um único fluxo aberto por câmera e distribui cada quadro a todos os assinantes.
+
+    Login, cadastro e pré-visualização assinam a mesma câmera em vez de abrir um
+    VideoCapture cada. Sem assinantes, o dispositivo continua aberto (e com exposição
+    ajustada) por `tempo_ocioso` segundos, para o próximo login não pagar a abertura.
+    Os quadros entregues são compartilhados entre assinantes: não devem ser alterados.
+    """
+
+    def __init__(self, indice=0, tempo_ocioso=TEMPO_OCIOSO_CAMERA, abrir=FonteCamera):
+        self.indice = indice
+        self.tempo_ocioso = tempo_ocioso
+        self._abrir = abrir
+        self._cond = threading.Condition()
+        self._thread = None
+        self.estado = "fechada"        # "abrindo", "aberta", "falhou" ou "fechada"
+        self.erro = None
+        self.assinantes = 0
+        self._ocioso_desde = None
+        self._quadro = None
+        self._id_quadro = 0
+        self.aberturas = 0
+        self.latencia_abertura = None  # segundos até o primeiro quadro na última abertura
+        self.quadros_lidos = 0
+        self._instantes = deque(maxlen=JANELA_METRICAS)
+
+    def assinar(self):
+        with self._cond:
+            self.assinantes += 1
+            self._ocioso_desde = None
+            if self.estado in ("fechada", "falhou"):
+                anterior = self._thread
+                self.estado = "abrindo"
+                self.erro = None
+                self._thread = threading.Thread(target=self._executar, args=(anterior,), daemon=True,
+                                                name=f"camera-{self.indice}")
+                self._thread.start()
+            return AssinaturaCamera(self, self._id_quadro)
+
+    def _cancelar(self):
+        with self._cond:
+            self.assinantes -= 1
+            if self.assinantes == 0:
+                self._ocioso_desde = time.monotonic()
+            self._cond.notify_all()
+
+    def _encerrar(self, estado, erro=None):
+        with self._cond:
+            self.estado = estado
+            self.erro = erro
+            self._cond.notify_all()
+
+    def _executar(self, anterior):
+        if anterior is not None:
+            anterior.join()  # o fluxo anterior precisa soltar o dispositivo antes de reabrir
+        inicio = time.perf_counter()
+        try:
+            fonte = self._abrir(self.indice)
+        except Exception as e:
+            self._encerrar("falhou", e)
+            return
+        try:
+            if not fonte.isOpened():
+                self._encerrar("falhou", Exception(f"Câmera {self.indice} não pôde ser aberta"))
+                return
+            self.aberturas += 1
+            falhas = 0
+            primeiro = True
+            while True:
+                with self._cond:
+                    if (self.assinantes == 0 and self._ocioso_desde is not None
+                            and time.monotonic() - self._ocioso_desde >= self.tempo_ocioso):
+                        self.estado = "fechada"
+                        self._cond.notify_all()
+                        return
+                ret, frame = fonte.read()
+                if not ret:
+                    falhas += 1
+                    if falhas > MAX_FALHAS_CAMERA or getattr(fonte, "terminou", False):
+                        self._encerrar("falhou", Exception("Falha ao capturar frames da câmera. A câmera pode ter sido desconectada."))
+                        return
+                    time.sleep(0.01)
+                    continue
+                falhas = 0
+                agora = time.monotonic()
+                with self._cond:
+                    if primeiro:
+                        primeiro = False
+                        self.latencia_abertura = time.perf_counter() - inicio
+                        self.estado = "aberta"
+                        METRICAS.registrar(f"camera{self.indice}/abertura", self.latencia_abertura)
+                    self._quadro = frame
+                    self._id_quadro += 1
+                    self.quadros_lidos += 1
+                    self._instantes.append(agora)
+                    self._cond.notify_all()
+                METRICAS.marcar_quadro(f"camera{self.indice}/captura")
+        finally:
+            fonte.release()
+
+    def _aguardar_abertura(self, timeout=TIMEOUT_ABERTURA_CAMERA):
+        with self._cond:
+            self._cond.wait_for(lambda: self.estado != "abrindo", timeout)
+            return self.estado == "aberta"
+
+    def _ler(self, ultimo_id, timeout=TIMEOUT_QUADRO_CAMERA):
+        """Espera um quadro mais novo que `ultimo_id`; retorna (id, quadro) ou (ultimo_id, None)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._id_quadro > ultimo_id or self.estado in ("falhou", "fechada"), timeout)
+            if self._id_quadro > ultimo_id:
+                return self._id_quadro, self._quadro
+            return ultimo_id, None
+
+    def fps(self):
+        with self._cond:
+            instantes = list(self._instantes)
+        if len(instantes) < 2 or instantes[-1] <= instantes[0]:
+            return None
+        return (len(instantes) - 1) / (instantes[-1] - instantes[0])
+
+    def relatorio(self):
+        return {
+            "indice": self.indice,
+            "estado": self.estado,
+            "assinantes": self.assinantes,
+            "aberturas": self.aberturas,
+            "latencia_abertura_ms": self.latencia_abertura * 1000 if self.latencia_abertura is not None else None,
+            "fps": self.fps(),
+            "quadros_lidos": self.quadros_lidos,
+            "erro": str(self.erro) if self.erro else None
+        }
+
+class AssinaturaCamera(FonteQuadros):
+    """Fonte de quadros de um assinante do GerenciadorCamera; release() cancela a assinatura"""
+
+    def __init__(self, gerenciador, ultimo_id):
+        self.gerenciador = gerenciador
+        self.ultimo_id = ultimo_id
+        self.ativa = True
+
+    def isOpened(self):
+        return self.ativa and self.gerenciador._aguardar_abertura()
+
+    def read(self):
+        if not self.ativa:
+            return False, None
+        self.ultimo_id, frame = self.gerenciador._ler(self.ultimo_id)
+        return frame is not None, frame
+
+    def release(self):
+        if self.ativa:
+            self.ativa = False
+            self.gerenciador._cancelar()
+
+_gerenciadores_camera = {}
+_lock_gerenciadores_camera = threading.Lock()
+
+def obter_gerenciador_camera(indice=FONTE_CAMERA):
+    with _lock_gerenciadores_camera:
+        if indice not in _gerenciadores_camera:
+            _gerenciadores_camera[indice] = GerenciadorCamera(indice)
+        return _gerenciadores_camera[indice]
+
+# ------------------------- Pipeline de Captura -------------------------
+class PipelineCaptura:
+    """Produtor/consumidor para os loops de câmera.
+
+    Uma thread lê a câmera sem parar e guarda apenas o quadro mais recente (os antigos são
+    descartados, então o buffer da câmera nunca acumula quadros velhos). Outra thread roda
+    `processar(quadro)` sempre no quadro mais novo. A exibição usa `proximo_quadro()` no ritmo
+    da câmera junto com `ultimo_resultado()`, sem esperar a inferência terminar.
+    """
+
+    def __init__(self, video, processar, max_falhas=30, nome="camera", metricas=None):
+        self.video = video
+        self.processar = processar
+        self.max_falhas = max_falhas
+        self.nome = nome
+        self.metricas = metricas or METRICAS
+        self.erro = None
+        self.quadros_descartados = 0
+        self._cond = threading.Condition()
+        self._parar = threading.Event()
+        self._quadro = None
+        self._id_quadro = 0
+        self._id_exibido = 0
+        self._id_processado = 0
+        self._resultado = None
+        self._processando = False
+        self.terminou = False
+        self._threads = []
+
+    def iniciar(self):
+        for alvo, nome in ((self._capturar, "captura"), (self._inferir, "inferencia")):
+            t = threading.Thread(target=alvo, name=f"pipeline-{nome}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def parar(self):
+        self._parar.set()
+        with self._cond:
+            self._cond.notify_all()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout=2)
+        self._threads = []
+
+    def _falhar(self, erro):
+        with self._cond:
+            if self.erro is None:
+                self.erro = erro
+            self._parar.set()
+            self._cond.notify_all()
+
+    def _capturar(self):
+        falhas = 0
+        etapa_leitura = f"{self.nome}/leitura_camera"
+        while not self._parar.is_set():
+            with self.metricas.medir(etapa_leitura):
+                ret, frame = self.video.read()
+            if not ret and getattr(self.video, "terminou", False):
+                # Fonte finita (vídeo, pasta de imagens) chegou ao fim: não é erro
+                with self._cond:
+                    self.terminou = True
+                    self._cond.notify_all()
+                return
+            if not ret:
+                falhas += 1
+                if falhas > self.max_falhas:
+                    self._falhar(Exception("Falha ao capturar frames da câmera. A câmera pode ter sido desconectada."))
+                continue
+            falhas = 0
+            self.metricas.marcar_quadro(f"{self.nome}/captura")
+            with self._cond:
+                if self._id_processado < self._id_quadro:
+                    # A inferência não chegou a usar o quadro anterior
+                    self.quadros_descartados += 1
+                    self.metricas.contar(f"{self.nome}/quadros_descartados")
+                self._quadro = frame
+                self._id_quadro += 1
+                self._cond.notify_all()
+
+    def _inferir(self):
+        while True:
+            with self._cond:
+                while not self._parar.is_set() and self._id_processado == self._id_quadro:
+                    self._cond.wait()
+                if self._parar.is_set():
+                    return
+                frame, self._id_processado = self._quadro, self._id_quadro
+                self._processando = True
+            try:
+                with self.metricas.medir(f"{self.nome}/inferencia"):
+                    resultado = self.processar(frame)
+            except Exception as e:
+                self._falhar(e)
+                return
+            self.metricas.marcar_quadro(f"{self.nome}/inferencia")
+            with self._cond:
+                self._resultado = resultado
+                self._processando = False
+                self._cond.notify_all()
+
+    def _esgotado(self):
+        return (self.terminou and not self._processando and self._id_processado == self._id_quadro
+                and self._id_exibido == self._id_quadro)
+
+    def esgotado(self):
+        """True quando a fonte acabou e o último quadro já foi exibido e processado"""
+        with self._cond:
+            return self._esgotado()
+
+    def proximo_quadro(self, timeout=1.0):
+        """Espera um quadro ainda não exibido; retorna None no timeout e relança erros das threads"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.erro is not None or self._parar.is_set() or self._esgotado()
+                                or self._id_exibido < self._id_quadro, timeout=timeout)
+            if self.erro is not None:
+                raise self.erro
+            if self._id_exibido == self._id_quadro:
+                return None
+            self._id_exibido = self._id_quadro
+            return self._quadro
+
+    def ultimo_resultado(self):
+        with self._cond:
+            return self._resultado
+
+# ------------------------- Detectores de Rosto -------------------------
+# "auto" escolhe por micro-benchmark; ou fixe um nome de CANDIDATOS_DETECTOR (ex.: "hog1")
+DETECTOR_PADRAO = "auto"
+PISO_ACURACIA_DETECCAO = 0.9   # F1 mínimo sobre as amostras para um detector ser elegível
+DNN_PROTOTXT = os.path.join(MODELOS_DIR, "deploy.prototxt")
+DNN_PESOS = os.path.join(MODELOS_DIR, "res10_300x300_ssd_iter_140000.caffemodel")
+
+class DetectorFacial:
+    """Interface comum: detector(rgb) -> lista de caixas (top, right, bottom, left)"""
+    nome = "base"
+
+    def __call__(self, rgb):
+        raise NotImplementedError
+
+    def detectar_lote(self, rgbs):
+        """Detecção em vários quadros de uma vez (backends com suporte a lote sobrescrevem)"""
+        return [self(rgb) for rgb in rgbs]
+
+    def disponivel(self):
+        return True
+
+class DetectorHOG(DetectorFacial):
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+        self.nome = f"hog{upsample}"
+
+    def __call__(self, rgb):
+        return face_recognition.face_locations(rgb, number_of_times_to_upsample=self.upsample, model="hog")
+
+class DetectorCNN(DetectorFacial):
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+        self.nome = f"cnn{upsample}"
+
+    def __call__(self, rgb):
+        return face_recognition.face_locations(rgb, number_of_times_to_upsample=self.upsample, model="cnn")
+
+    def detectar_lote(self, rgbs):
+        # batch_face_locations exige quadros do mesmo tamanho (caso de um mesmo vídeo)
+        if len({rgb.shape for rgb in rgbs}) > 1:
+            return super().detectar_lote(rgbs)
+        return face_recognition.batch_face_locations(rgbs, number_of_times_to_upsample=self.upsample,
+                                                     batch_size=len(rgbs))
+
+    def disponivel(self):
+        # Sem GPU o detector CNN do dlib leva segundos por quadro
+        try:
+            import dlib
+            return bool(dlib.DLIB_USE_CUDA)
+        except (ImportError, AttributeError):
+            return False
+
+class DetectorHaar(DetectorFacial):
+    nome = "haar"
+
+    def __init__(self, fator_escala=1.1, vizinhos=5, tamanho_minimo=30):
+        self.fator_escala = fator_escala
+        self.vizinhos = vizinhos
+        self.tamanho_minimo = tamanho_minimo
+        self._classificador = None
+
+    def _carregar(self):
+        if self._classificador is None:
+            self._classificador = cv2.CascadeClassifier(
+                os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+        return self._classificador
+
+    def disponivel(self):
+        try:
+            return not self._carregar().empty()
+        except (AttributeError, cv2.error):
+            return False
+
+    def __call__(self, rgb):
+        cinza = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        rostos = self._carregar().detectMultiScale(cinza, scaleFactor=self.fator_escala, minNeighbors=self.vizinhos,
+                                                   minSize=(self.tamanho_minimo, self.tamanho_minimo))
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in rostos]
+
+class DetectorDNN(DetectorFacial):
+    """SSD ResNet-10 do módulo dnn do OpenCV (modelo em data/modelos)"""
+    nome = "dnn"
+
+    def __init__(self, confianca=0.5, prototxt=DNN_PROTOTXT, pesos=DNN_PESOS):
+        self.confianca = confianca
+        self.prototxt = prototxt
+        self.pesos = pesos
+        self._rede = None
+
+    def disponivel(self):
+        return os.path.exists(self.prototxt) and os.path.exists(self.pesos)
+
+    def __call__(self, rgb):
+        if self._rede is None:
+            self._rede = cv2.dnn.readNetFromCaffe(self.prototxt, self.pesos)
+        altura, largura = rgb.shape[:2]
+        bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self._rede.setInput(blob)
+        saida = self._rede.forward()[0, 0]
+        caixas = []
+        for deteccao in saida[saida[:, 2] >= self.confianca]:
+            left, top, right, bottom = deteccao[3:7] * np.array([largura, altura, largura, altura])
+            caixas.append(_limitar_caixa(top, right, bottom, left, altura, largura))
+        return caixas
+
+CANDIDATOS_DETECTOR = {
+    "hog0": lambda: DetectorHOG(0),
+    "hog1": lambda: DetectorHOG(1),
+    "hog2": lambda: DetectorHOG(2),
+    "cnn0": lambda: DetectorCNN(0),
+    "cnn1": lambda: DetectorCNN(1),
+    "haar": lambda: DetectorHaar(),
+    "dnn": lambda: DetectorDNN(),
+}
+REFERENCIA_DETECTOR = "hog1"  # comportamento original; padrão sem amostras anotadas e gabarito das imagens sem anotação
+
+def _iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area = lambda c: (c[1] - c[3]) * (c[2] - c[0])
+    uniao = area(a) + area(b) - inter
+    return inter / uniao if uniao > 0 else 0.0
+
+def _f1_deteccao(previstas, esperadas, limiar_iou=0.5):
+    """Pontuação F1 casando caixas previstas e esperadas por IoU"""
+    if not previstas and not esperadas:
+        return 1.0
+    restantes = list(esperadas)
+    acertos = 0
+    for caixa in previstas:
+        melhor = max(restantes, key=lambda e: _iou(caixa, e), default=None)
+        if melhor is not None and _iou(caixa, melhor) >= limiar_iou:
+            restantes.remove(melhor)
+            acertos += 1
+    if acertos == 0:
+        return 0.0
+    precisao = acertos / len(previstas)
+    recall = acertos / len(esperadas)
+    return 2 * precisao * recall / (precisao + recall)
+
+def _anotacoes_deteccao(pasta=AMOSTRAS_DETECCAO_DIR):
+    caminho = os.path.join(pasta, "anotacoes.json")
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def carregar_amostras_deteccao(pasta=AMOSTRAS_DETECCAO_DIR, so_anotadas=False):
+    """Imagens de amostra (RGB) e caixas esperadas.
+
+    As caixas vêm de anotacoes.json ({"arquivo.jpg": [[top, right, bottom, left], ...]}) quando
+    existir; senão o detector de referência define o gabarito (ou a imagem é pulada, com
+    so_anotadas).
+    """
+    if not os.path.isdir(pasta):
+        return []
+    anotacoes = _anotacoes_deteccao(pasta)
+    referencia = None
+    amostras = []
+    for arquivo in sorted(os.listdir(pasta)):
+        if os.path.splitext(arquivo)[1].lower() not in EXTENSOES_IMAGEM:
+            continue
+        if so_anotadas and arquivo not in anotacoes:
+            continue
+        imagem = cv2.imread(os.path.join(pasta, arquivo))
+        if imagem is None:
+            continue
+        rgb = cv2.cvtColor(imagem, cv2.COLOR_BGR2RGB)
+        if arquivo in anotacoes:
+            esperadas = [tuple(c) for c in anotacoes[arquivo]]
+        else:
+            referencia = referencia or CANDIDATOS_DETECTOR[REFERENCIA_DETECTOR]()
+            esperadas = referencia(rgb)
+        amostras.append((rgb, esperadas))
+    return amostras
+
+def benchmark_detectores(amostras, nomes=None, repeticoes=3):
+    """Latência média (ms/imagem) e F1 de cada detector disponível sobre as amostras"""
+    resultados = []
+    for nome in nomes or CANDIDATOS_DETECTOR:
+        detector = CANDIDATOS_DETECTOR[nome]()
+        if not detector.disponivel():
+            continue
+        detector(amostras[0][0])  # aquecimento (carrega modelos)
+        f1 = sum(_f1_deteccao(detector(rgb), esperadas) for rgb, esperadas in amostras) / len(amostras)
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            for rgb, _esperadas in amostras:
+                detector(rgb)
+        ms = (time.perf_counter() - inicio) * 1000 / (repeticoes * len(amostras))
+        resultados.append({"detector": nome, "ms": ms, "f1": f1})
+    return resultados
+
+def _assinatura_amostras(pasta=AMOSTRAS_DETECCAO_DIR):
+    if not os.path.isdir(pasta):
+        return None
+    return sorted([a, os.path.getsize(os.path.join(pasta, a))] for a in os.listdir(pasta))
+
+def selecionar_detector(piso=PISO_ACURACIA_DETECCAO, forcar=False):
+    """Nome do detector mais rápido com F1 >= piso nas amostras (resultado guardado por máquina).
+
+    Só entram amostras anotadas: com o detector de referência como gabarito ele sempre teria
+    F1 = 1 e a escolha não mediria nada. Sem anotações fica o REFERENCIA_DETECTOR.
+    """
+    import platform
+    maquina = platform.node()
+    assinatura = _assinatura_amostras()
+    if not forcar and os.path.exists(DETECTOR_FILE):
+        try:
+            with open(DETECTOR_FILE, "r", encoding="utf-8") as f:
+                escolha = json.load(f)
+            if (escolha.get("maquina") == maquina and escolha.get("amostras") == assinatura
+                    and escolha.get("piso") == piso and escolha.get("anotadas")
+                    and escolha.get("detector") in CANDIDATOS_DETECTOR):
+                return escolha["detector"]
+        except (OSError, ValueError):
+            pass
+    amostras = carregar_amostras_deteccao(so_anotadas=True)
+    if not amostras:
+        salvar_log(f"Seleção automática do detector ignorada: nenhuma amostra anotada em "
+                   f"{AMOSTRAS_DETECCAO_DIR}; usando {REFERENCIA_DETECTOR}")
+        return REFERENCIA_DETECTOR
+    resultados = benchmark_detectores(amostras)
+    elegiveis = [r for r in resultados if r["f1"] >= piso]
+    escolhido = min(elegiveis, key=lambda r: r["ms"])["detector"] if elegiveis else REFERENCIA_DETECTOR
+    gravar_json_atomico(DETECTOR_FILE, {"maquina": maquina, "amostras": assinatura, "piso": piso,
+                                        "anotadas": len(amostras), "detector": escolhido, "resultados": resultados})
+    salvar_log(f"Detector facial selecionado: {escolhido} ({len(amostras)} amostras)")
+    return escolhido
+
+_detector_atual = None
+
+def obter_detector():
+    """Detector compartilhado por login, cadastro e ferramentas (configurado em DETECTOR_PADRAO)"""
+    global _detector_atual
+    if _detector_atual is None:
+        nome = selecionar_detector() if DETECTOR_PADRAO == "auto" else DETECTOR_PADRAO
+        detector = CANDIDATOS_DETECTOR[nome]()
+        _detector_atual = detector if detector.disponivel() else CANDIDATOS_DETECTOR[REFERENCIA_DETECTOR]()
+    return _detector_atual
+
+# ------------------------- Perfis de Codificação -------------------------
+# modelo: landmarks usados no alinhamento ("small" = 5 pontos, "large" = 68 pontos)
+# jitters: reamostragens por rosto (custo cresce linearmente)
+# max_rostos: quantos rostos por quadro são codificados (maiores e mais centrais primeiro)
+PERFIS_CODIFICACAO = {
+    "rapido": {"modelo": "small", "jitters": 1, "max_rostos": 1},
+    "equilibrado": {"modelo": "large", "jitters": 1, "max_rostos": 2},
+    "preciso": {"modelo": "large", "jitters": 10, "max_rostos": 1},
+}
+PERFIL_LOGIN = "rapido"
+PERFIL_CADASTRO = "preciso"
+
+class PerfilCodificacao:
+    """Parâmetros de face_encodings com medição do custo por rosto"""
+
+    def __init__(self, nome, modelo="small", jitters=1, max_rostos=None):
+        self.nome = nome
+        self.modelo = modelo
+        self.jitters = jitters
+        self.max_rostos = max_rostos
+        self.rostos_codificados = 0
+        self.custo_medio_ms = None
+
+    def selecionar(self, faces, altura, largura):
+        """Ordena por área (maior primeiro) e distância ao centro, limitando a max_rostos"""
+        cy, cx = altura / 2, largura / 2
+
+        def prioridade(caixa):
+            top, right, bottom, left = caixa
+            area = (bottom - top) * (right - left)
+            centro = ((top + bottom) / 2 - cy) ** 2 + ((left + right) / 2 - cx) ** 2
+            return (-area, centro)
+
+        ordenadas = sorted(faces, key=prioridade)
+        return ordenadas if self.max_rostos is None else ordenadas[:self.max_rostos]
+
+    def codificar(self, rgb, faces):
+        """Retorna (caixas codificadas, embeddings) para os rostos escolhidos pelo perfil"""
+        escolhidas = self.selecionar(faces, *rgb.shape[:2])
+        if not escolhidas:
+            return [], []
+        inicio = time.perf_counter()
+        embeddings = face_recognition.face_encodings(rgb, escolhidas, num_jitters=self.jitters, model=self.modelo)
+        custo = (time.perf_counter() - inicio) * 1000 / len(escolhidas)
+        self.custo_medio_ms = custo if self.custo_medio_ms is None else 0.9 * self.custo_medio_ms + 0.1 * custo
+        self.rostos_codificados += len(escolhidas)
+        return escolhidas, embeddings
+
+    def relatorio(self):
+        return {
+            "perfil": self.nome,
+            "modelo": self.modelo,
+            "jitters": self.jitters,
+            "max_rostos": self.max_rostos,
+            "rostos_codificados": self.rostos_codificados,
+            "custo_medio_ms": self.custo_medio_ms
+        }
+
+_perfis = {}
+
+def obter_perfil(nome):
+    """Instância compartilhada do perfil, para acumular a medição de custo"""
+    if nome not in _perfis:
+        _perfis[nome] = PerfilCodificacao(nome, **PERFIS_CODIFICACAO[nome])
+    return _perfis[nome]
+
+# ------------------------- Buffers Reutilizáveis -------------------------
+REUTILIZAR_BUFFERS = True  # False volta a alocar a cada quadro (usado no benchmark de comparação)
+
+class BuffersQuadro:
+    """Arrays pré-alocados para o caminho do quadro, reaproveitados enquanto a forma não muda.
+
+    obter() devolve sempre o mesmo array para o mesmo nome, então o conteúdo só vale até a
+    próxima chamada: quem precisa guardar uma imagem (templates, fundo) faz a própria cópia.
+    Desativado, obter() retorna None e as funções do OpenCV alocam normalmente (dst=None).
+    """
+
+    def __init__(self, ativo=None):
+        self.ativo = REUTILIZAR_BUFFERS if ativo is None else ativo
+        self._buffers = {}
+        self.alocacoes = 0
+
+    def obter(self, nome, forma, dtype=None):
+        if not self.ativo:
+            return None
+        dtype = np.dtype(dtype or np.uint8)
+        buf = self._buffers.get(nome)
+        if buf is None or buf.shape != tuple(forma) or buf.dtype != dtype:
+            buf = self._buffers[nome] = np.empty(forma, dtype=dtype)
+            self.alocacoes += 1
+        return buf
+
+    def copiar(self, nome, imagem):
+        """Cópia de `imagem` num buffer reaproveitado (equivale a imagem.copy())"""
+        buf = self.obter(nome, imagem.shape, imagem.dtype)
+        if buf is None:
+            return imagem.copy()
+        np.copyto(buf, imagem)
+        return buf
+
+# ------------------------- Rastreamento Facial -------------------------
+INTERVALO_DETECCAO = 5        # quadros entre detecções (as do meio só rastreiam)
+INTERVALO_DETECCAO_COMPLETA = 20  # a cada tantos quadros a detecção cobre a imagem toda
+CONFIANCA_RASTREAMENTO = 0.6  # correlação mínima do template para confiar no rastreio
+MARGEM_ROI = 0.6              # expansão da caixa (fração do tamanho) para a região de busca
+
+def _limitar_caixa(top, right, bottom, left, altura, largura):
+    return (max(0, int(top)), min(largura, int(right)), min(altura, int(bottom)), max(0, int(left)))
+
+def _expandir_caixa(caixa, margem, altura, largura):
+    top, right, bottom, left = caixa
+    dy = (bottom - top) * margem
+    dx = (right - left) * margem
+    return _limitar_caixa(top - dy, right + dx, bottom + dy, left - dx, altura, largura)
+
+class RastreadorFacial:
+    """Substitui a detecção em todo quadro por detecção a cada N quadros + rastreio por template.
+
+    Entre detecções cada rosto é procurado (cv2.matchTemplate) apenas numa janela ao redor da
+    última posição. Quando há rosto conhecido, a própria detecção roda só na região de interesse
+    em volta dele; a imagem inteira é varrida periodicamente, quando a ROI não acha nada ou
+    quando o rastreio perde confiança.
+    """
+
+    def __init__(self, detectar=None, intervalo=INTERVALO_DETECCAO, intervalo_completo=INTERVALO_DETECCAO_COMPLETA,
+                 confianca_minima=CONFIANCA_RASTREAMENTO, margem_roi=MARGEM_ROI):
+        self.detectar = detectar or obter_detector()
+        self.intervalo = max(1, intervalo)
+        self.intervalo_completo = max(self.intervalo, intervalo_completo)
+        self.confianca_minima = confianca_minima
+        self.margem_roi = margem_roi
+        self.caixas = []
+        self.templates = []
+        self.quadros_desde_deteccao = 0
+        self.quadros_desde_completa = 0
+        self.deteccoes_completas = 0
+        self.deteccoes_roi = 0
+        self.quadros_rastreados = 0
+        self.ultima_operacao = None  # "completa", "roi" ou "rastreio"
+        self.buffers = BuffersQuadro()
+
+    def reiniciar(self):
+        """Esquece os rostos conhecidos (ex.: mudou a resolução de processamento)"""
+        self.caixas = []
+        self.templates = []
+
+    def localizar(self, rgb):
+        """Caixas (top, right, bottom, left) dos rostos no quadro, no mesmo formato de face_locations"""
+        cinza = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY, dst=self.buffers.obter("cinza", rgb.shape[:2]))
+        self.quadros_desde_deteccao += 1
+        self.quadros_desde_completa += 1
+        if self.caixas and self.quadros_desde_deteccao < self.intervalo:
+            caixas = self._rastrear(cinza)
+            if caixas is not None:
+                self.quadros_rastreados += 1
+                self.ultima_operacao = "rastreio"
+                self.caixas = caixas
+                return list(caixas)
+        return self._detectar(rgb, cinza)
+
+    def _detectar(self, rgb, cinza):
+        caixas = []
+        if self.caixas and self.quadros_desde_completa < self.intervalo_completo:
+            caixas = self._detectar_roi(rgb)
+            self.deteccoes_roi += 1
+            self.ultima_operacao = "roi"
+        if not caixas:
+            caixas = [tuple(int(v) for v in c) for c in self.detectar(rgb)]
+            self.deteccoes_completas += 1
+            self.ultima_operacao = "completa"
+            self.quadros_desde_completa = 0
+        self.quadros_desde_deteccao = 0
+        self.caixas = caixas
+        self.templates = [cinza[t:b, l:r].copy() for (t, r, b, l) in caixas]
+        return list(caixas)
+
+    def _detectar_roi(self, rgb):
+        altura, largura = rgb.shape[:2]
+        tops, rights, bottoms, lefts = zip(*[_expandir_caixa(c, self.margem_roi, altura, largura) for c in self.caixas])
+        top, right, bottom, left = min(tops), max(rights), max(bottoms), min(lefts)
+        recorte = np.ascontiguousarray(rgb[top:bottom, left:right])
+        return [(t + top, r + left, b + top, l + left) for (t, r, b, l) in self.detectar(recorte)]
+
+    def _rastrear(self, cinza):
+        """Nova posição de cada rosto por correlação; None se algum rosto perdeu confiança"""
+        altura, largura = cinza.shape[:2]
+        novas = []
+        for caixa, template in zip(self.caixas, self.templates):
+            th, tw = template.shape[:2]
+            if th < 8 or tw < 8:
+                return None
+            top, right, bottom, left = _expandir_caixa(caixa, self.margem_roi, altura, largura)
+            janela = cinza[top:bottom, left:right]
+            if janela.shape[0] < th or janela.shape[1] < tw:
+                return None
+            mapa = cv2.matchTemplate(janela, template, cv2.TM_CCOEFF_NORMED)
+            _, confianca, _, (x, y) = cv2.minMaxLoc(mapa)
+            if confianca < self.confianca_minima:
+                return None
+            novas.append((top + y, left + x + tw, top + y + th, left + x))
+        return novas
+
+# ------------------------- Escala Adaptativa -------------------------
+LARGURAS_PROCESSAMENTO = (160, 240, 320, 400, 480, 640, 800, 960, 1280)
+LARGURA_INICIAL = 320          # equivale ao antigo fx=0.5 numa câmera 640x480
+ORCAMENTO_DETECCAO_MS = 80     # latência máxima desejada para uma detecção completa
+ALTURA_MINIMA_ROSTO = 50       # altura (px processados) abaixo da qual o HOG começa a perder rostos
+TENTATIVAS_SEM_ROSTO = 3       # detecções vazias antes de tentar uma resolução maior
+
+def ampliar_caixas(faces, fator):
+    """Converte caixas da imagem reduzida para o quadro original"""
+    return [(int(top * fator), int(right * fator), int(bottom * fator), int(left * fator))
+            for (top, right, bottom, left) in faces]
+
+class EscalaAdaptativa:
+    """Escolhe a menor resolução de processamento que ainda detecta o rosto dentro do orçamento.
+
+    Mede o custo por pixel das detecções (média móvel) para prever a latência de cada nível e
+    o tamanho dos rostos encontrados para saber até onde dá para reduzir. Sem rosto, sobe de
+    nível aos poucos enquanto a latência prevista couber no orçamento.
+    """
+
+    def __init__(self, orcamento_ms=ORCAMENTO_DETECCAO_MS, altura_minima=ALTURA_MINIMA_ROSTO,
+                 larguras=LARGURAS_PROCESSAMENTO, largura_inicial=LARGURA_INICIAL):
+        self.orcamento = orcamento_ms / 1000.0
+        self.altura_minima = altura_minima
+        self.candidatas = sorted(larguras)
+        self.larguras = list(self.candidatas)
+        self.nivel = min(range(len(self.larguras)), key=lambda i: abs(self.larguras[i] - largura_inicial))
+        self.custo_por_pixel = None
+        self.sem_rosto = 0
+        self.largura_quadro = None
+        self.buffers = BuffersQuadro()
+
+    def _niveis_validos(self):
+        # Nunca amplia além do quadro original; filtra sempre a lista completa, para que um
+        # quadro menor não elimine de vez os níveis altos de uma câmera maior trocada depois
+        validos = [l for l in self.candidatas if l < self.largura_quadro] + [self.largura_quadro]
+        return sorted(set(validos))
+
+    def reduzir(self, frame):
+        """Retorna (imagem reduzida, fator para voltar às coordenadas originais).
+
+        A imagem reduzida é um buffer reaproveitado: vale só até a próxima chamada.
+        """
+        altura, largura = frame.shape[:2]
+        if largura != self.largura_quadro:
+            self.largura_quadro = largura
+            atual = self.larguras[self.nivel]
+            self.larguras = self._niveis_validos()
+            # Mantém a largura de processamento atual (ou a maior abaixo dela) no novo conjunto
+            self.nivel = max([i for i, l in enumerate(self.larguras) if l <= atual], default=0)
+        alvo = self.larguras[self.nivel]
+        if alvo >= largura:
+            return frame, 1.0
+        alvo_altura = max(1, round(altura * alvo / largura))
+        destino = self.buffers.obter("reduzido", (alvo_altura, alvo) + frame.shape[2:], frame.dtype)
+        return cv2.resize(frame, (alvo, alvo_altura), dst=destino, interpolation=cv2.INTER_AREA), largura / alvo
+
+    def latencia_prevista(self, nivel, proporcao):
+        if self.custo_por_pixel is None:
+            return 0.0
+        largura = self.larguras[nivel]
+        return self.custo_por_pixel * largura * largura * proporcao
+
+    def registrar(self, segundos, imagem, faces, deteccao_completa=True):
+        """Atualiza o nível a partir da latência da detecção e das alturas dos rostos; True se mudou"""
+        altura, largura = imagem.shape[:2]
+        proporcao = altura / largura
+        if deteccao_completa:
+            custo = segundos / (altura * largura)
+            self.custo_por_pixel = custo if self.custo_por_pixel is None else 0.8 * self.custo_por_pixel + 0.2 * custo
+        anterior = self.nivel
+        if faces:
+            self.sem_rosto = 0
+            menor = min(bottom - top for (top, right, bottom, left) in faces)
+            # Menor nível em que o rosto mais baixo continua acima da altura mínima
+            alvo = self.nivel
+            for i in range(len(self.larguras)):
+                if menor * self.larguras[i] / largura >= self.altura_minima:
+                    alvo = i
+                    break
+            else:
+                alvo = len(self.larguras) - 1
+            while alvo > self.nivel and self.latencia_prevista(alvo, proporcao) > self.orcamento:
+                alvo -= 1
+            self.nivel = alvo
+        elif deteccao_completa:
+            self.sem_rosto += 1
+            if self.latencia_prevista(self.nivel, proporcao) > self.orcamento and self.nivel > 0:
+                self.nivel -= 1
+            elif (self.sem_rosto >= TENTATIVAS_SEM_ROSTO and self.nivel < len(self.larguras) - 1
+                  and self.latencia_prevista(self.nivel + 1, proporcao) <= self.orcamento):
+                self.nivel += 1
+                self.sem_rosto = 0
+        return self.nivel != anterior
+
+# ------------------------- Detector de Movimento -------------------------
+LIMIAR_MOVIMENTO = 0.01       # fração de pixels alterados que conta como movimento
+LIMIAR_PIXEL_MOVIMENTO = 25   # diferença de intensidade (0-255) para um pixel contar como alterado
+INTERVALO_BATIMENTO = 1.0     # segundos entre detecções com a cena parada
+LARGURA_MOVIMENTO = 96        # largura da miniatura usada na comparação
+
+class DetectorMovimento:
+    """Porteiro barato para a inferência: com a cena parada só deixa passar um quadro por batimento.
+
+    Compara uma miniatura em tons de cinza com um fundo de média móvel. Havendo movimento (ou
+    rosto visto no último quadro processado) a inferência roda em todos os quadros; caso
+    contrário apenas a cada INTERVALO_BATIMENTO segundos.
+    """
+
+    def __init__(self, limiar=LIMIAR_MOVIMENTO, limiar_pixel=LIMIAR_PIXEL_MOVIMENTO,
+                 intervalo_batimento=INTERVALO_BATIMENTO, largura=LARGURA_MOVIMENTO):
+        self.limiar = limiar
+        self.limiar_pixel = limiar_pixel
+        self.intervalo_batimento = intervalo_batimento
+        self.largura = largura
+        self.fundo = None
+        self.ultimo_processado = 0.0
+        self.quadros_processados = 0
+        self.quadros_ignorados = 0
+        self.batimentos = 0
+        self.quadros_com_movimento = 0
+        self.buffers = BuffersQuadro()
+
+    def movimento(self, frame):
+        """Fração de pixels da miniatura que mudaram em relação ao fundo"""
+        b = self.buffers
+        altura = max(1, frame.shape[0] * self.largura // frame.shape[1])
+        forma = (altura, self.largura)
+        mini = cv2.resize(frame, (self.largura, altura), dst=b.obter("mini", forma + frame.shape[2:]),
+                          interpolation=cv2.INTER_AREA)
+        cinza8 = cv2.cvtColor(mini, cv2.COLOR_BGR2GRAY, dst=b.obter("cinza8", forma))
+        cinza8 = cv2.GaussianBlur(cinza8, (5, 5), 0, dst=b.obter("suave8", forma))
+        cinza = b.obter("cinza", forma, np.float32)
+        if cinza is None:
+            cinza = cinza8.astype(np.float32)
+        else:
+            np.copyto(cinza, cinza8)
+        if self.fundo is None or self.fundo.shape != cinza.shape:
+            self.fundo = cinza.copy()
+            return 1.0
+        diferenca = cv2.absdiff(cinza, self.fundo, dst=b.obter("diferenca", forma, np.float32))
+        cv2.accumulateWeighted(cinza, self.fundo, 0.2)
+        alterados = b.obter("alterados", forma, np.bool_)
+        alterados = np.greater(diferenca, self.limiar_pixel, out=alterados)
+        return float(np.count_nonzero(alterados)) / diferenca.size
+
+    def deve_processar(self, frame, rosto_presente=False):
+        """True se o quadro deve passar pela detecção/codificação"""
+        agora = time.monotonic()
+        ha_movimento = self.movimento(frame) >= self.limiar
+        if ha_movimento:
+            self.quadros_com_movimento += 1
+        elif not rosto_presente:
+            if agora - self.ultimo_processado < self.intervalo_batimento:
+                self.quadros_ignorados += 1
+                return False
+            self.batimentos += 1
+        self.ultimo_processado = agora
+        self.quadros_processados += 1
+        return True
+
+    def contadores(self):
+        return {
+            "processados": self.quadros_processados,
+            "ignorados": self.quadros_ignorados,
+            "batimentos": self.batimentos,
+            "com_movimento": self.quadros_com_movimento
+        }
+
+# ------------------------- Loops de Reconhecimento -------------------------
+# Os mesmos loops atendem a interface (com janela) e as execuções sem tela (benchmarks/CI).
+
+class ProcessadorLogin:
+    """Etapa de inferência do login: movimento -> escala -> detecção/rastreio -> codificação -> galeria"""
+
+    def __init__(self, buscador, detector=None, perfil=PERFIL_LOGIN):
+        self.buscador = buscador
+        self.rastreador = RastreadorFacial(detectar=detector)
+        self.escala = EscalaAdaptativa()
+        self.perfil = obter_perfil(perfil)
+        self.porteiro = DetectorMovimento()
+        self.ultimo = ([], None)
+        self.quadros_processados = 0
+        self.buffers = BuffersQuadro()
+
+    def __call__(self, frame):
+        self.quadros_processados += 1
+        # Cena parada e sem rosto: reaproveita o último resultado sem rodar o dlib
+        with METRICAS.medir("login/movimento"):
+            processar = self.porteiro.deve_processar(frame, rosto_presente=bool(self.ultimo[0]))
+        if not processar:
+            METRICAS.contar("login/quadros_ignorados_movimento")
+            return self.ultimo
+
+        # redimensiona frame para acelerar (resolução escolhida pela escala adaptativa)
+        with METRICAS.medir("login/redimensionar"):
+            small_frame, fator = self.escala.reduzir(frame)
+            rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB, dst=self.buffers.obter("rgb", small_frame.shape))
+
+        # Detecta (ou rastreia entre detecções) rostos e gera embeddings
+        try:
+            inicio = time.perf_counter()
+            faces = self.rastreador.localizar(rgb)
+            segundos = time.perf_counter() - inicio
+            etapa = {"completa": "deteccao", "roi": "deteccao_roi"}.get(self.rastreador.ultima_operacao, "rastreio")
+            METRICAS.registrar(f"login/{etapa}", segundos)
+            if self.rastreador.ultima_operacao != "rastreio":
+                if self.escala.registrar(segundos, rgb, faces,
+                                         deteccao_completa=self.rastreador.ultima_operacao == "completa"):
+                    # As caixas rastreadas estão na resolução antiga
+                    self.rastreador.reiniciar()
+        except Exception as e:
+            raise Exception(f"Erro no processamento de reconhecimento facial: {str(e)}")
+
+        self.ultimo = (ampliar_caixas(faces, fator), self._reconhecer(rgb, faces))
+        return self.ultimo
+
+    def _reconhecer(self, rgb, faces):
+        """Codifica os rostos priorizados pelo perfil e compara com a galeria"""
+        try:
+            with METRICAS.medir("login/codificacao"):
+                _, embeddings = self.perfil.codificar(rgb, faces)
+        except Exception as e:
+            raise Exception(f"Erro no processamento de reconhecimento facial: {str(e)}")
+
+        # compara todos os rostos com toda a galeria de uma vez
+        with METRICAS.medir("login/comparacao"):
+            return self.buscador.identificar(embeddings)
+
+class ProcessadorCadastro:
+    """Etapa de inferência do cadastro: só detecta; o embedding é gerado uma vez, ao capturar"""
+
+    def __init__(self, detector=None):
+        self.escala = EscalaAdaptativa()
+        self.detector = detector or obter_detector()
+        self.quadros_processados = 0
+        self.buffers = BuffersQuadro()
+
+    def __call__(self, frame):
+        self.quadros_processados += 1
+        # Redimensiona para processar mais rápido (resolução escolhida pela escala adaptativa)
+        with METRICAS.medir("cadastro/redimensionar"):
+            small_frame, fator = self.escala.reduzir(frame)
+            rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB, dst=self.buffers.obter("rgb", small_frame.shape))
+        try:
+            inicio = time.perf_counter()
+            faces = self.detector(rgb)
+            segundos = time.perf_counter() - inicio
+            METRICAS.registrar("cadastro/deteccao", segundos)
+            self.escala.registrar(segundos, rgb, faces)
+        except Exception as e:
+            # Erro no reconhecimento facial
+            raise Exception(f"Erro no processamento de reconhecimento facial: {str(e)}")
+        return ampliar_caixas(faces, fator), frame
+
+class JanelaOpenCV:
+    """Exibição numa janela própria do OpenCV (ferramentas de linha de comando)"""
+
+    def __init__(self, titulo):
+        self.titulo = titulo
+
+    def mostrar(self, frame, espera_ms=1):
+        """Mostra o quadro e retorna a tecla pressionada (-1/255 se nenhuma)"""
+        try:
+            cv2.imshow(self.titulo, frame)
+        except Exception as e:
+            raise Exception(f"Erro ao exibir janela de vídeo: {str(e)}")
+        return cv2.waitKey(espera_ms) & 0xFF
+
+    def fechar(self):
+        cv2.destroyAllWindows()
+
+def _janela_loop(exibir, titulo):
+    """exibir=True abre uma JanelaOpenCV; False/None não exibe; outro objeto é usado como janela"""
+    if exibir is True:
+        return JanelaOpenCV(titulo)
+    return exibir or None
+
+def _estatisticas_loop(inicio, quadros_exibidos, pipeline, processador, instante_resultado):
+    duracao = time.perf_counter() - inicio
+    return {
+        "duracao_s": duracao,
+        "quadros_exibidos": quadros_exibidos,
+        "quadros_processados": processador.quadros_processados,
+        "quadros_descartados": pipeline.quadros_descartados,
+        "fps_exibicao": quadros_exibidos / duracao if duracao > 0 else 0.0,
+        "fps_inferencia": processador.quadros_processados / duracao if duracao > 0 else 0.0,
+        "tempo_ate_resultado_s": instante_resultado - inicio if instante_resultado else None
+    }
+
+def _compor_exibicao_login(frame, faces, status_msg, buffers):
+    """Desenha status e caixas sobre uma cópia do quadro (o original é compartilhado com a inferência)"""
+    display_frame = buffers.copiar("exibicao", frame)
+    color = (0, 255, 0) if "✅" in status_msg else (0, 0, 255)
+    cv2.putText(display_frame, status_msg, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+    # Desenha retângulos ao redor dos rostos
+    for (top, right, bottom, left) in faces:
+        cv2.rectangle(display_frame, (left, top), (right, bottom), (255, 0, 0), 2)
+    return display_frame
+
+def executar_login(fonte, buscador, exibir=True, tempo_limite=None, processador=None):
+    """Loop de reconhecimento sobre uma fonte de quadros.
+
+    Retorna (Correspondencia ou None, estatísticas). Com exibir=False não abre janela e só
+    termina ao reconhecer, no tempo limite ou quando a fonte acaba. `exibir` também aceita
+    uma janela com mostrar(quadro)/fechar() (ex.: JanelaQt da interface). `processador`
+    substitui o ProcessadorLogin local (ex.: ProcessadorLoginRemoto).
+    """
+    janela = _janela_loop(exibir, "Reconhecimento Facial")
+    buffers = BuffersQuadro()
+    processador = processador or ProcessadorLogin(buscador)
+    pipeline = PipelineCaptura(fonte, processador, nome="login")
+    correspondencia = None
+    quadros_exibidos = 0
+    instante_resultado = None
+    inicio = time.perf_counter()
+    pipeline.iniciar()
+    try:
+        while True:
+            frame = pipeline.proximo_quadro()
+
+            # O resultado pode ser de um quadro anterior: a exibição não espera a inferência
+            resultado = pipeline.ultimo_resultado()
+            if resultado is None:
+                faces = []
+                status_msg = "🔍 Procurando rostos..."
+            else:
+                faces, correspondencia = resultado
+                if correspondencia:
+                    instante_resultado = instante_resultado or time.perf_counter()
+                    status_msg = f"✅ {correspondencia.nome} reconhecido!"
+                elif len(faces) == 0:
+                    status_msg = "❌ Nenhum rosto detectado"
+                else:
+                    status_msg = "🔍 Rosto detectado, verificando..."
+
+            key = -1
+            if frame is not None:
+                quadros_exibidos += 1
+                METRICAS.marcar_quadro("login/exibicao")
+                METRICAS.exportar_periodicamente()
+                if janela is not None:
+                    inicio_exibicao = time.perf_counter()
+                    # desenha mensagem sobre o frame
+                    display_frame = _compor_exibicao_login(frame, faces, status_msg, buffers)
+                    key = janela.mostrar(display_frame)
+                    METRICAS.registrar("login/exibicao", time.perf_counter() - inicio_exibicao)
+            elif pipeline.esgotado():
+                break
+
+            if correspondencia or key == ord('q'):
+                break
+            if tempo_limite and time.perf_counter() - inicio > tempo_limite:
+                break
+    finally:
+        pipeline.parar()
+        if janela is not None:
+            janela.fechar()
+        METRICAS.exportar_periodicamente()
+    estatisticas = _estatisticas_loop(inicio, quadros_exibidos, pipeline, processador, instante_resultado)
+    estatisticas["quadros_ignorados_movimento"] = processador.porteiro.quadros_ignorados
+    return correspondencia, estatisticas
+
+def executar_cadastro(fonte, nome, exibir=True, automatico=False, tempo_limite=None, perfil=PERFIL_CADASTRO):
+    """Loop de captura do cadastro; retorna (embedding ou None, estatísticas).
+
+    Com janela, ESPAÇO captura e Q cancela. Com automatico=True captura no primeiro quadro
+    com exatamente um rosto (usado sem tela). `exibir` aceita uma janela como em executar_login.
+    """
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    janela = _janela_loop(exibir, "Cadastro Facial")
+    buffers = BuffersQuadro()
+    processador = ProcessadorCadastro()
+    perfil = obter_perfil(perfil)
+    pipeline = PipelineCaptura(fonte, processador, nome="cadastro")
+    embedding_capturado = None
+    quadros_exibidos = 0
+    instante_resultado = None
+    inicio = time.perf_counter()
+    pipeline.iniciar()
+    try:
+        while True:
+            frame = pipeline.proximo_quadro()
+            faces, frame_faces = pipeline.ultimo_resultado() or ([], None)
+
+            key = -1
+            display_frame = None
+            if frame is not None:
+                quadros_exibidos += 1
+                METRICAS.marcar_quadro("cadastro/exibicao")
+                METRICAS.exportar_periodicamente()
+                if janela is not None:
+                    inicio_exibicao = time.perf_counter()
+                    # Frame para exibição (tamanho original, num buffer reaproveitado)
+                    display_frame = buffers.copiar("exibicao", frame)
+
+                    # Determina status
+                    if len(faces) == 0:
+                        status_msg = "Nenhum rosto detectado"
+                        color = (0, 0, 255)  # Vermelho
+                    elif len(faces) > 1:
+                        status_msg = "Multiplos rostos - apenas 1 permitido"
+                        color = (0, 165, 255)  # Laranja
+                    else:
+                        status_msg = "Rosto detectado - Pressione ESPACO"
+                        color = (0, 255, 0)  # Verde
+
+                        # Desenha retângulo ao redor do rosto (caixas já no tamanho original)
+                        for (top, right, bottom, left) in faces:
+                            cv2.rectangle(display_frame, (left, top), (right, bottom), color, 3)
+
+                    # Adiciona texto de status
+                    cv2.putText(display_frame, status_msg, (10, 30), font, 0.9, color, 2)
+                    cv2.putText(display_frame, f"Usuario: {nome}", (10, 70), font, 0.7, (255, 255, 255), 2)
+                    cv2.putText(display_frame, "Q = Cancelar", (10, display_frame.shape[0] - 10), font, 0.6, (255, 255, 255), 1)
+
+                    key = janela.mostrar(display_frame)
+                    METRICAS.registrar("cadastro/exibicao", time.perf_counter() - inicio_exibicao)
+            elif pipeline.esgotado() and not (automatico and len(faces) == 1):
+                break
+
+            # Captura com ESPAÇO (ou automaticamente) se houver exatamente 1 rosto
+            if (key == ord(' ') or automatico) and len(faces) == 1:
+                # Codifica em resolução original com o perfil de cadastro (mais preciso)
+                try:
+                    rgb = cv2.cvtColor(frame_faces, cv2.COLOR_BGR2RGB)
+                    _, embeddings = perfil.codificar(rgb, faces)
+                except Exception as e:
+                    raise Exception(f"Erro no processamento de reconhecimento facial: {str(e)}")
+                embedding_capturado = embeddings[0]
+                instante_resultado = time.perf_counter()
+                if display_frame is not None:
+                    # Feedback visual
+                    cv2.putText(display_frame, "CAPTURADO!", (display_frame.shape[1]//2 - 100, display_frame.shape[0]//2),
+                               font, 1.5, (0, 255, 0), 3)
+                    janela.mostrar(display_frame, 1000)  # Mostra por 1 segundo
+                break
+            elif key == ord('q'):
+                break
+            if tempo_limite and time.perf_counter() - inicio > tempo_limite:
+                break
+    finally:
+        pipeline.parar()
+        if janela is not None:
+            janela.fechar()
+        METRICAS.exportar_periodicamente()
+    return embedding_capturado, _estatisticas_loop(inicio, quadros_exibidos, pipeline, processador, instante_resultado)
+
+def benchmark_buffers(origem="sintetico", n_quadros=300, largura=1920, altura=1080):
+    """Tempo e pico de memória transitória por quadro no caminho do quadro, alocando x com buffers.
+
+    A detecção é substituída por uma função vazia para isolar redimensionamento, conversões,
+    porteiro de movimento e composição da exibição do custo do dlib.
+    """
+    import tracemalloc
+    global REUTILIZAR_BUFFERS
+    if str(origem).startswith("sintetico"):
+        fonte = FonteSintetica(imagem=str(origem).partition(":")[2] or None, largura=largura, altura=altura,
+                               n_quadros=n_quadros, tempo_real=False)
+    else:
+        fonte = abrir_fonte(origem, tempo_real=False)
+    quadros = []
+    try:
+        while len(quadros) < n_quadros:
+            ret, frame = fonte.read()
+            if not ret:
+                break
+            quadros.append(frame)
+    finally:
+        fonte.release()
+    if not quadros:
+        print(f"Nenhum quadro lido de {origem}")
+        return None
+
+    galeria = GaleriaFacial([], np.empty((0, DIMENSAO_EMBEDDING), dtype=np.float32))
+    caixas = [(altura // 4, largura // 2, altura // 2, largura // 4)]
+    resultados = {}
+    for modo, ativo in (("alocando", False), ("buffers", True)):
+        anterior = REUTILIZAR_BUFFERS
+        REUTILIZAR_BUFFERS = ativo
+        try:
+            processador = ProcessadorLogin(galeria, detector=lambda rgb: [])
+            buffers = BuffersQuadro()
+        finally:
+            REUTILIZAR_BUFFERS = anterior
+        processador.porteiro.intervalo_batimento = 0  # todo quadro percorre o caminho completo
+
+        def passo(frame):
+            processador(frame)
+            _compor_exibicao_login(frame, caixas, "Procurando rostos...", buffers)
+
+        for frame in quadros[:5]:
+            passo(frame)  # primeiros quadros alocam os buffers
+        inicio = time.perf_counter()
+        for frame in quadros:
+            passo(frame)
+        ms_quadro = (time.perf_counter() - inicio) * 1000 / len(quadros)
+
+        # Segunda passada só para memória (o tracemalloc atrasa as alocações)
+        tracemalloc.start()
+        picos = []
+        for frame in quadros:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            passo(frame)
+            picos.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        resultados[modo] = {"ms_quadro": ms_quadro, "pico_kb_quadro": float(np.mean(picos)) / 1024,
+                            "mb_s_a_30fps": float(np.mean(picos)) * 30 / 1e6}
+
+    h, w = quadros[0].shape[:2]
+    print(f"{len(quadros)} quadros {w}x{h}")
+    print(f"{'modo':>10} {'ms/quadro':>10} {'KB/quadro':>10} {'MB/s @30fps':>12}")
+    for modo, r in resultados.items():
+        print(f"{modo:>10} {r['ms_quadro']:>10.2f} {r['pico_kb_quadro']:>10.1f} {r['mb_s_a_30fps']:>12.1f}")
+    return resultados
+
+# ------------------------- Aquecimento dos Modelos -------------------------
+class AquecimentoModelos(threading.Thread):
+    """Carrega cv2/dlib, o detector e o codificador em segundo plano e roda uma inferência vazia.
+
+    Iniciado quando o menu aparece; o primeiro login facial só espera o que ainda faltar.
+    """
+
+    def __init__(self, perfil=PERFIL_LOGIN):
+        super().__init__(daemon=True, name="aquecimento-modelos")
+        self.perfil = perfil
+        self.concluido = threading.Event()
+        self.etapas = {}
+        self.erro = None
+
+    def _etapa(self, nome, funcao):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        self.etapas[nome] = time.perf_counter() - inicio
+        METRICAS.registrar(f"inicializacao/{nome}", self.etapas[nome])
+        return resultado
+
+    def run(self):
+        try:
+            self._etapa("importar_numpy", lambda: np.zeros(1))
+            self._etapa("importar_cv2", lambda: cv2.__version__)
+            self._etapa("importar_face_recognition", lambda: face_recognition.face_locations)
+            detector = self._etapa("carregar_detector", obter_detector)
+            perfil = obter_perfil(self.perfil)
+            # Quadro vazio: a primeira chamada real já encontra os modelos alocados
+            rgb = np.zeros((LARGURA_INICIAL * 3 // 4, LARGURA_INICIAL, 3), dtype=np.uint8)
+            self._etapa("inferencia_deteccao", lambda: detector(rgb))
+            caixa = [(20, 120, 120, 20)]
+            self._etapa("inferencia_codificacao",
+                        lambda: face_recognition.face_encodings(rgb, caixa, model=perfil.modelo))
+            self._etapa("carregar_galeria", carregar_galeria)
+        except Exception as e:
+            # Sem aquecimento o login continua funcionando, apenas carrega tudo na primeira vez
+            self.erro = e
+            salvar_log(f"Falha no aquecimento dos modelos: {e}")
+        finally:
+            self.concluido.set()
+
+_aquecimento = None
+
+def iniciar_aquecimento():
+    global _aquecimento
+    if _aquecimento is None:
+        _aquecimento = AquecimentoModelos()
+        _aquecimento.start()
+    return _aquecimento
+
+def aguardar_aquecimento(timeout=None):
+    """Espera o aquecimento em andamento (evita carregar os modelos duas vezes ao mesmo tempo)"""
+    if _aquecimento is not None:
+        _aquecimento.concluido.wait(timeout)
+
+def _copiar_dados_aquecimento(destino):
+    """Copia para `destino` o que o aquecimento lê (usuários, galeria, detector, amostras)"""
+    import shutil, sqlite3
+    for caminho in (USERS_FILE, GALERIA_FILE, GALERIA_INDICE_FILE, INDICE_ANN_FILE, DETECTOR_FILE):
+        if os.path.exists(caminho):
+            shutil.copy2(caminho, destino)  # preserva o mtime usado na assinatura da galeria
+    if os.path.exists(BANCO_FILE):
+        origem = sqlite3.connect(BANCO_FILE)
+        copia = sqlite3.connect(os.path.join(destino, os.path.basename(BANCO_FILE)))
+        try:
+            origem.backup(copia)
+        finally:
+            copia.close()
+            origem.close()
+    if os.path.isdir(AMOSTRAS_DETECCAO_DIR):
+        shutil.copytree(AMOSTRAS_DETECCAO_DIR, os.path.join(destino, os.path.basename(AMOSTRAS_DETECCAO_DIR)))
+
+def benchmark_inicializacao(repeticoes=3):
+    """Mede, em processos novos, a importação deste módulo, dos módulos pesados e o aquecimento.
+
+    Os processos rodam sobre uma cópia temporária dos dados: se a galeria ou o detector
+    precisarem ser refeitos, nada é gravado no data/ real.
+    """
+    import shutil
+    codigo = (
+        "import sys, time, json\n"
+        "inicio = time.perf_counter()\n"
+        "import CodigoCorreto as C\n"
+        "importacao = time.perf_counter() - inicio\n"
+        "inicio = time.perf_counter()\n"
+        "a = C.iniciar_aquecimento(); a.concluido.wait()\n"
+        "aquecimento = time.perf_counter() - inicio\n"
+        "print(json.dumps({'importar_modulo': importacao, 'aquecimento': aquecimento,\n"
+        "                  'erro': str(a.erro) if a.erro else None,\n"
+        "                  **{'aquecimento/' + k: v for k, v in a.etapas.items()}}))\n"
+    )
+    # Referência: o que a importação custava quando os módulos pesados eram carregados no topo
+    codigo_imediato = (
+        "import time, json\n"
+        "inicio = time.perf_counter()\n"
+        "import numpy, cv2, face_recognition\n"
+        "print(json.dumps({'importar_modulos_pesados': time.perf_counter() - inicio}))\n"
+    )
+    pasta = tempfile.mkdtemp(prefix="cofre_benchmark_")
+    ambiente = dict(os.environ, COFRE_DATA_DIR=pasta)
+    ambiente["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.abspath(BASE_DIR), ambiente.get("PYTHONPATH")]))
+    medicoes = []
+    try:
+        _copiar_dados_aquecimento(pasta)
+        # A primeira rodada não entra na conta: refaz na cópia o que estiver desatualizado
+        for rodada in range(repeticoes + 1):
+            medicao = {}
+            for trecho in (codigo_imediato, codigo):
+                saida = subprocess.run([sys.executable, "-c", trecho], capture_output=True, text=True, env=ambiente)
+                if saida.returncode != 0:
+                    print(saida.stderr)
+                    return None
+                medicao.update(json.loads(saida.stdout.strip().splitlines()[-1]))
+            if rodada:
+                medicoes.append(medicao)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    erros = {m["erro"] for m in medicoes if m["erro"]}
+    if erros:
+        print(f"Aquecimento falhou: {', '.join(erros)}")
+    print(f"{'etapa':<42}{'mediana ms':>12}")
+    for chave in medicoes[0]:
+        if chave != "erro":
+            print(f"{chave:<42}{statistics.median(m[chave] for m in medicoes) * 1000:>12.1f}")
+    return medicoes
+
+# ------------------------- Cadastro em Lote -------------------------
+LADO_MAXIMO_LOTE = 1024  # fotos maiores são reduzidas antes da detecção
+
+def listar_imagens_lote(origem):
+    """Pares (nome, caminho) a partir de uma pasta ou de um CSV "nome,caminho".
+
+    Na pasta, cada imagem solta vira um usuário com o nome do arquivo e cada subpasta vira
+    um usuário com todas as suas imagens.
+    """
+    pares = []
+    if os.path.isdir(origem):
+        for item in sorted(os.listdir(origem)):
+            caminho = os.path.join(origem, item)
+            if os.path.isdir(caminho):
+                for arquivo in sorted(os.listdir(caminho)):
+                    if os.path.splitext(arquivo)[1].lower() in EXTENSOES_IMAGEM:
+                        pares.append((item, os.path.join(caminho, arquivo)))
+            elif os.path.splitext(item)[1].lower() in EXTENSOES_IMAGEM:
+                pares.append((os.path.splitext(item)[0], caminho))
+    else:
+        import csv
+        base = os.path.dirname(os.path.abspath(origem))
+        with open(origem, "r", encoding="utf-8", newline="") as f:
+            for linha in csv.reader(f):
+                if len(linha) < 2 or not linha[0].strip() or linha[0].strip().lower() == "nome":
+                    continue
+                caminho = linha[1].strip()
+                pares.append((linha[0].strip(), caminho if os.path.isabs(caminho) else os.path.join(base, caminho)))
+    return pares
+
+_lote_detector = None
+_lote_perfil = None
+
+def _iniciar_trabalhador_lote(nome_perfil):
+    global _lote_detector, _lote_perfil
+    _lote_detector = obter_detector()
+    _lote_perfil = obter_perfil(nome_perfil)
+
+def _codificar_imagem_lote(tarefa):
+    """Roda no processo trabalhador: (nome, caminho) -> (nome, caminho, embedding ou None, motivo)"""
+    nome, caminho = tarefa
+    try:
+        imagem = cv2.imread(caminho)
+        if imagem is None:
+            return nome, caminho, None, "imagem ilegível"
+        maior = max(imagem.shape[:2])
+        if maior > LADO_MAXIMO_LOTE:
+            fator = LADO_MAXIMO_LOTE / maior
+            imagem = cv2.resize(imagem, (0, 0), fx=fator, fy=fator, interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(imagem, cv2.COLOR_BGR2RGB)
+        faces = _lote_detector(rgb)
+        if len(faces) == 0:
+            return nome, caminho, None, "nenhum rosto"
+        if len(faces) > 1:
+            return nome, caminho, None, f"{len(faces)} rostos"
+        _, embeddings = _lote_perfil.codificar(rgb, faces)
+        return nome, caminho, np.asarray(embeddings[0], dtype=np.float64), None
+    except Exception as e:
+        return nome, caminho, None, f"erro: {e}"
+
+def cadastrar_lote(origem, processos=None, perfil=PERFIL_CADASTRO):
+    """Codifica as imagens em paralelo e grava todos os usuários com um único salvar_usuarios"""
+    from concurrent.futures import ProcessPoolExecutor
+    pares = listar_imagens_lote(origem)
+    if not pares:
+        print(f"Nenhuma imagem encontrada em {origem}")
+        return None
+    obter_detector()  # faz a seleção automática uma vez antes de abrir os processos
+    processos = processos or os.cpu_count() or 1
+    print(f"{len(pares)} imagens de {len(set(n for n, _ in pares))} usuários, {processos} processos")
+
+    inicio = time.perf_counter()
+    embeddings_por_nome = {}
+    rejeitadas = []
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_trabalhador_lote,
+                             initargs=(perfil,)) as executor:
+        for i, (nome, caminho, embedding, motivo) in enumerate(
+                executor.map(_codificar_imagem_lote, pares, chunksize=4), 1):
+            if embedding is None:
+                rejeitadas.append((nome, caminho, motivo))
+            else:
+                embeddings_por_nome.setdefault(nome, []).append(embedding)
+            if i % 100 == 0:
+                print(f"  {i}/{len(pares)} imagens ({i / (time.perf_counter() - inicio):.1f} img/s)")
+    duracao = time.perf_counter() - inicio
+
+    usuarios = carregar_usuarios()
+    novos = 0
+    for nome, embeddings in embeddings_por_nome.items():
+        # Várias fotos da mesma pessoa: usa o embedding médio
+        embedding = np.mean(embeddings, axis=0)
+        if nome not in usuarios:
+            usuarios[nome] = {"pastas": []}
+            novos += 1
+        usuarios[nome]["embedding"] = embedding.tolist()
+    if embeddings_por_nome:
+        salvar_usuarios(usuarios)
+
+    for nome, caminho, motivo in rejeitadas:
+        print(f"  rejeitada: {caminho} ({nome}): {motivo}")
+    print(f"{len(pares) - len(rejeitadas)} imagens aceitas, {len(rejeitadas)} rejeitadas")
+    print(f"{len(embeddings_por_nome)} usuários gravados ({novos} novos)")
+    print(f"Tempo: {duracao:.1f} s ({len(pares) / duracao:.1f} imagens/s)")
+    salvar_log(f"Cadastro em lote de '{origem}': {len(embeddings_por_nome)} usuários ({novos} novos), "
+               f"{len(rejeitadas)} imagens rejeitadas")
+    return embeddings_por_nome
+
+# ------------------------- Reidentificação em Gravações -------------------------
+LARGURA_REIDENTIFICACAO = 640   # largura de processamento dos quadros gravados
+PERFIL_REIDENTIFICACAO = "equilibrado"
+
+_reid_detector = None
+_reid_perfil = None
+
+def _iniciar_trabalhador_reid(nome_perfil):
+    global _reid_detector, _reid_perfil
+    _reid_detector = obter_detector()
+    # Em gravações todos os rostos do quadro interessam, não só o principal
+    _reid_perfil = PerfilCodificacao(nome_perfil, **dict(PERFIS_CODIFICACAO[nome_perfil], max_rostos=None))
+
+def _analisar_lote_quadros(rgbs):
+    """Roda no processo trabalhador: para cada quadro, (caixas, embeddings float32)"""
+    resultados = []
+    for rgb, faces in zip(rgbs, _reid_detector.detectar_lote(rgbs)):
+        caixas, embeddings = _reid_perfil.codificar(rgb, faces)
+        resultados.append((caixas, np.asarray(embeddings, dtype=np.float32).reshape(-1, DIMENSAO_EMBEDDING)))
+    return resultados
+
+def reidentificar_arquivo(entrada, saida, passo=1, lote=8, processos=None, largura=LARGURA_REIDENTIFICACAO,
+                          perfil=PERFIL_REIDENTIFICACAO, tolerancia=TOLERANCIA_FACIAL, incluir_desconhecidos=False):
+    """Procura os usuários cadastrados em um vídeo ou pasta de imagens e grava os avistamentos em JSONL.
+
+    Os quadros são lidos em fluxo, enviados em micro-lotes a um pool de processos e comparados
+    com a galeria em uma única operação por lote. No máximo 2 lotes por processo ficam em voo,
+    então a memória não cresce com a duração da gravação.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    galeria = carregar_galeria()
+    if not len(galeria):
+        print("Nenhum usuário possui reconhecimento facial cadastrado.")
+        return None
+    buscador = obter_buscador(galeria)
+    fonte = abrir_fonte(entrada, tempo_real=False)
+    if not fonte.isOpened():
+        print(f"Não foi possível abrir: {entrada}")
+        return None
+    obter_detector()  # seleção automática uma vez, antes dos processos
+    processos = processos or os.cpu_count() or 1
+    estatisticas = {"quadros_lidos": 0, "quadros_analisados": 0, "rostos": 0, "avistamentos": 0}
+    em_voo = deque()
+    inicio = time.perf_counter()
+
+    def gravar(futuro, metadados, arquivo):
+        resultados = futuro.result()
+        todos = [emb for _, embs in resultados for emb in embs]
+        correspondencias = iter(buscador.comparar(np.asarray(todos)) if todos else [])
+        for (indice, instante, descricao, fator), (caixas, embeddings) in zip(metadados, resultados):
+            estatisticas["quadros_analisados"] += 1
+            for caixa, _ in zip(caixas, embeddings):
+                estatisticas["rostos"] += 1
+                c = next(correspondencias)
+                conhecido = c is not None and c.distancia <= tolerancia
+                if not conhecido and not incluir_desconhecidos:
+                    continue
+                registro = {"quadro": indice, "tempo_s": round(instante, 3) if instante is not None else None}
+                if descricao:
+                    registro["arquivo"] = descricao
+                registro.update({
+                    "usuario": c.nome if conhecido else None,
+                    "distancia": round(c.distancia, 4) if c else None,
+                    "margem": round(c.margem, 4) if c and c.margem != float("inf") else None,
+                    "caixa": ampliar_caixas([caixa], fator)[0]
+                })
+                arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                estatisticas["avistamentos"] += conhecido
+
+    try:
+        with open(saida, "w", encoding="utf-8") as arquivo, \
+                ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_trabalhador_reid,
+                                    initargs=(perfil,)) as executor:
+            rgbs, metadados = [], []
+            while True:
+                ret, frame = fonte.read()
+                if ret:
+                    indice = estatisticas["quadros_lidos"]
+                    estatisticas["quadros_lidos"] += 1
+                    if indice % passo:
+                        continue
+                    fator = 1.0
+                    if frame.shape[1] > largura:
+                        fator = frame.shape[1] / largura
+                        frame = cv2.resize(frame, (largura, round(frame.shape[0] / fator)), interpolation=cv2.INTER_AREA)
+                    rgbs.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    metadados.append((indice, fonte.instante(), fonte.descricao(), fator))
+                elif not fonte.terminou:
+                    continue
+                if rgbs and (len(rgbs) >= lote or not ret):
+                    em_voo.append((executor.submit(_analisar_lote_quadros, rgbs), metadados))
+                    rgbs, metadados = [], []
+                # Resultados saem na ordem dos quadros; limita o que fica em memória
+                while em_voo and (len(em_voo) >= 2 * processos or not ret):
+                    gravar(*em_voo.popleft(), arquivo)
+                if estatisticas["quadros_lidos"] % 500 == 0 and ret:
+                    decorrido = time.perf_counter() - inicio
+                    print(f"  {estatisticas['quadros_lidos']} quadros ({estatisticas['quadros_lidos'] / decorrido:.1f} q/s), "
+                          f"{estatisticas['avistamentos']} avistamentos")
+                if not ret:
+                    break
+    finally:
+        fonte.release()
+    estatisticas["duracao_s"] = time.perf_counter() - inicio
+    estatisticas["quadros_analisados_por_s"] = estatisticas["quadros_analisados"] / estatisticas["duracao_s"]
+    salvar_log(f"Reidentificação de '{entrada}': {estatisticas['avistamentos']} avistamentos em "
+               f"{estatisticas['quadros_analisados']} quadros")
+    return estatisticas
+
+# ------------------------- Reconhecimento Multicâmera -------------------------
+# Várias câmeras por porta: cada fonte tem sua PipelineCaptura (captura + inferência), mas a
+# detecção/codificação roda num pool de processos compartilhado. Como cada câmera tem no
+# máximo um quadro na fila do pool (sua thread de inferência espera o resultado) e a fila é
+# FIFO, o pool atende as câmeras em rodízio. A galeria é uma só, em memória, no processo principal.
+INTERVALO_REPETICAO_EVENTO = 5.0  # segundos antes de a mesma câmera anunciar o mesmo usuário de novo
+
+_multi_detector = None
+_multi_perfil = None
+
+def _iniciar_trabalhador_multicamera(nome_perfil):
+    global _multi_detector, _multi_perfil
+    _multi_detector = obter_detector()
+    _multi_perfil = obter_perfil(nome_perfil)
+
+def _detectar_codificar_quadro(rgb):
+    """Roda no processo trabalhador: (caixas, embeddings float32, segundos de detecção)"""
+    inicio = time.perf_counter()
+    faces = _multi_detector(rgb)
+    segundos = time.perf_counter() - inicio
+    _, embeddings = _multi_perfil.codificar(rgb, faces)
+    return faces, np.asarray(embeddings, dtype=np.float32).reshape(-1, DIMENSAO_EMBEDDING), segundos
+
+class ProcessadorCamera:
+    """Inferência de uma câmera no modo multicâmera: porteiro e escala locais, dlib no pool"""
+
+    def __init__(self, nome, buscador, pool, ao_reconhecer=None):
+        self.nome = nome
+        self.buscador = buscador
+        self.pool = pool
+        self.ao_reconhecer = ao_reconhecer
+        self.escala = EscalaAdaptativa()
+        self.porteiro = DetectorMovimento()
+        self.ultimo = ([], None)
+        self.quadros_processados = 0
+        self.quadros_inferidos = 0
+        self.latencias = deque(maxlen=JANELA_METRICAS)
+        self.reconhecimentos = []
+        self._ultimo_evento = {}
+
+    def __call__(self, frame):
+        self.quadros_processados += 1
+        if not self.porteiro.deve_processar(frame, rosto_presente=bool(self.ultimo[0])):
+            return self.ultimo
+        inicio = time.perf_counter()
+        small_frame, fator = self.escala.reduzir(frame)
+        # Array novo (não buffer): o pool serializa o quadro depois, em outra thread
+        rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        faces, embeddings, segundos = self.pool.submit(_detectar_codificar_quadro, rgb).result()
+        self.escala.registrar(segundos, rgb, faces)
+        correspondencia = self.buscador.identificar(embeddings)
+        latencia = time.perf_counter() - inicio
+        self.quadros_inferidos += 1
+        self.latencias.append(latencia)
+        METRICAS.registrar(f"{self.nome}/reconhecimento", latencia)
+        if correspondencia:
+            agora = time.monotonic()
+            if agora - self._ultimo_evento.get(correspondencia.nome, -INTERVALO_REPETICAO_EVENTO) >= INTERVALO_REPETICAO_EVENTO:
+                self._ultimo_evento[correspondencia.nome] = agora
+                self.reconhecimentos.append((correspondencia.nome, latencia))
+                if self.ao_reconhecer:
+                    self.ao_reconhecer(self.nome, correspondencia, latencia)
+        self.ultimo = (ampliar_caixas(faces, fator), correspondencia)
+        return self.ultimo
+
+def executar_multicamera(origens, buscador, processos=None, tempo_limite=None, tempo_real=True, ao_reconhecer=None):
+    """Reconhecimento simultâneo em várias fontes; retorna o relatório por câmera.
+
+    Termina no tempo limite, quando todas as fontes acabam ou com Ctrl+C.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    processos = processos or os.cpu_count() or 1
+    cameras = []
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_trabalhador_multicamera,
+                             initargs=(PERFIL_LOGIN,)) as pool:
+        # Sobe todos os trabalhadores antes de medir (cada um carrega os modelos uma vez)
+        vazio = np.zeros((LARGURA_INICIAL * 3 // 4, LARGURA_INICIAL, 3), dtype=np.uint8)
+        for futuro in [pool.submit(_detectar_codificar_quadro, vazio) for _ in range(processos)]:
+            futuro.result()
+
+        for i, origem in enumerate(origens):
+            fonte = abrir_fonte(origem, tempo_real=tempo_real)
+            if not fonte.isOpened():
+                print(f"Fonte não pôde ser aberta: {origem}")
+                fonte.release()
+                continue
+            nome = f"camera{i}"
+            processador = ProcessadorCamera(nome, buscador, pool, ao_reconhecer)
+            cameras.append((origem, fonte, processador, PipelineCaptura(fonte, processador, nome=nome)))
+        if not cameras:
+            return None
+
+        inicio = time.perf_counter()
+        for _, _, _, pipeline in cameras:
+            pipeline.iniciar()
+        try:
+            while True:
+                time.sleep(0.1)
+                for origem, _, _, pipeline in cameras:
+                    if pipeline.erro is not None:
+                        raise Exception(f"{origem}: {pipeline.erro}")
+                if all(pipeline.esgotado() for _, _, _, pipeline in cameras):
+                    break
+                if tempo_limite and time.perf_counter() - inicio > tempo_limite:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for _, fonte, _, pipeline in cameras:
+                pipeline.parar()
+                fonte.release()
+            duracao = time.perf_counter() - inicio
+            METRICAS.exportar_periodicamente()
+
+    relatorio = []
+    for origem, _, processador, pipeline in cameras:
+        latencias = sorted(processador.latencias)
+        relatorio.append({
+            "camera": processador.nome,
+            "origem": str(origem),
+            "fps_processado": processador.quadros_processados / duracao,
+            "fps_inferencia": processador.quadros_inferidos / duracao,
+            "quadros_descartados": pipeline.quadros_descartados,
+            "latencia_p50_ms": latencias[len(latencias) // 2] * 1000 if latencias else None,
+            "latencia_p95_ms": latencias[int(0.95 * (len(latencias) - 1))] * 1000 if latencias else None,
+            "reconhecimentos": [nome for nome, _ in processador.reconhecimentos]
+        })
+    return relatorio
+
+def _imprimir_relatorio_multicamera(relatorio):
+    print(f"{'câmera':>8} {'FPS proc':>9} {'FPS inf':>8} {'p50 ms':>8} {'p95 ms':>8}  reconhecidos")
+    for r in relatorio:
+        p50 = f"{r['latencia_p50_ms']:.1f}" if r["latencia_p50_ms"] is not None else "-"
+        p95 = f"{r['latencia_p95_ms']:.1f}" if r["latencia_p95_ms"] is not None else "-"
+        print(f"{r['camera']:>8} {r['fps_processado']:>9.1f} {r['fps_inferencia']:>8.1f} {p50:>8} {p95:>8}  "
+              f"{', '.join(r['reconhecimentos']) or '-'}")
+    print(f"{'total':>8} {sum(r['fps_processado'] for r in relatorio):>9.1f} "
+          f"{sum(r['fps_inferencia'] for r in relatorio):>8.1f}")
+
+# ------------------------- Serviço de Reconhecimento -------------------------
+# Vários quiosques (instâncias da GUI) na mesma máquina podem compartilhar um único processo
+# com os modelos e a galeria carregados. Cada quiosque detecta/rastreia localmente e envia só
+# os recortes dos rostos; o serviço junta os pedidos que chegam juntos em um micro-lote.
+SERVICO_RECONHECIMENTO = os.environ.get("COFRE_SERVICO_RECONHECIMENTO")  # "host:porta" ou vazio (local)
+ENDERECO_SERVICO = ("127.0.0.1", 8765)
+TAMANHO_LOTE_SERVICO = 16       # rostos no máximo por micro-lote
+ESPERA_LOTE_MS = 5              # quanto o primeiro pedido espera por companhia
+LADO_RECORTE = 200              # recortes maiores são reduzidos antes do envio
+MARGEM_RECORTE = 0.25
+TIMEOUT_SERVICO = 5.0
+
+def _endereco_servico(texto):
+    host, _, porta = str(texto).rpartition(":")
+    return (host or ENDERECO_SERVICO[0], int(porta))
+
+def recortar_rostos(rgb, faces, margem=MARGEM_RECORTE, lado=LADO_RECORTE):
+    """Recorta cada rosto com margem; retorna [(recorte, caixa relativa ao recorte)]"""
+    altura, largura = rgb.shape[:2]
+    recortes = []
+    for caixa in faces:
+        top, right, bottom, left = [int(round(v)) for v in _expandir_caixa(caixa, margem, altura, largura)]
+        recorte = rgb[top:bottom, left:right]
+        relativa = (caixa[0] - top, caixa[1] - left, caixa[2] - top, caixa[3] - left)
+        fator = min(1.0, lado / max(recorte.shape[:2]))
+        if fator < 1.0:
+            recorte = cv2.resize(recorte, (0, 0), fx=fator, fy=fator)
+            relativa = tuple(v * fator for v in relativa)
+        recortes.append((np.ascontiguousarray(recorte), tuple(int(round(v)) for v in relativa)))
+    return recortes
+
+def montar_mosaico(recortes):
+    """Junta recortes em uma única imagem (grade) para codificar todos numa só chamada"""
+    celula_h = max(r.shape[0] for r, _ in recortes)
+    celula_w = max(r.shape[1] for r, _ in recortes)
+    colunas = int(np.ceil(np.sqrt(len(recortes))))
+    linhas = int(np.ceil(len(recortes) / colunas))
+    mosaico = np.zeros((linhas * celula_h, colunas * celula_w, 3), dtype=np.uint8)
+    caixas = []
+    for i, (recorte, (top, right, bottom, left)) in enumerate(recortes):
+        y, x = (i // colunas) * celula_h, (i % colunas) * celula_w
+        mosaico[y:y + recorte.shape[0], x:x + recorte.shape[1]] = recorte
+        caixas.append((top + y, right + x, bottom + y, left + x))
+    return mosaico, caixas
+
+class _PedidoServico:
+    __slots__ = ("recortes", "tolerancia", "resultado", "erro", "pronto")
+
+    def __init__(self, recortes, tolerancia):
+        self.recortes = recortes
+        self.tolerancia = tolerancia
+        self.resultado = None
+        self.erro = None
+        self.pronto = threading.Event()
+
+class ServicoReconhecimento:
+    """Codificação e busca na galeria compartilhadas, com micro-lotes entre clientes concorrentes"""
+
+    def __init__(self, tamanho_lote=TAMANHO_LOTE_SERVICO, espera_ms=ESPERA_LOTE_MS, perfil=PERFIL_LOGIN):
+        import queue
+        self.fila = queue.Queue()
+        self._vazia = queue.Empty
+        self.tamanho_lote = tamanho_lote
+        self.espera = espera_ms / 1000.0
+        self.perfil = obter_perfil(perfil)
+        self._assinatura = None
+        self.buscador = None
+        self.pedidos = 0
+        self.lotes = 0
+        self.rostos = 0
+        self._thread = threading.Thread(target=self._loop_lotes, daemon=True, name="servico-lotes")
+        self._thread.start()
+
+    def _atualizar_galeria(self):
+        """Recarrega a galeria quando o usuarios.json mudar (cadastros feitos por outro processo)"""
+        assinatura = _assinatura_usuarios()
+        if self.buscador is None or assinatura != self._assinatura:
+            self.buscador = obter_buscador(carregar_galeria())
+            self._assinatura = assinatura
+
+    def identificar(self, recortes, tolerancia=TOLERANCIA_FACIAL, timeout=TIMEOUT_SERVICO):
+        """Chamado pelas threads de conexão; bloqueia até o lote do pedido ser processado"""
+        if not recortes:
+            return None
+        # A tolerância vem do cliente: só pode ficar mais rígida que o padrão, nunca mais frouxa
+        pedido = _PedidoServico(recortes, min(tolerancia, TOLERANCIA_FACIAL))
+        self.fila.put(pedido)
+        if not pedido.pronto.wait(timeout):
+            raise TimeoutError("Serviço de reconhecimento sobrecarregado")
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+    def _loop_lotes(self):
+        while True:
+            lote = [self.fila.get()]
+            n_rostos = len(lote[0].recortes)
+            prazo = time.monotonic() + self.espera
+            while n_rostos < self.tamanho_lote:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self.fila.get(timeout=restante)
+                except self._vazia:
+                    break
+                lote.append(pedido)
+                n_rostos += len(pedido.recortes)
+            try:
+                self._processar_lote(lote)
+            except Exception as e:
+                for pedido in lote:
+                    pedido.erro = e
+            for pedido in lote:
+                pedido.pronto.set()
+
+    def _processar_lote(self, lote):
+        self._atualizar_galeria()
+        recortes = [r for pedido in lote for r in pedido.recortes]
+        with METRICAS.medir("servico/codificacao"):
+            mosaico, caixas = montar_mosaico(recortes)
+            embeddings = face_recognition.face_encodings(mosaico, caixas, num_jitters=self.perfil.jitters,
+                                                         model=self.perfil.modelo)
+        # Uma só comparação contra a galeria para os rostos de todos os pedidos do lote
+        with METRICAS.medir("servico/comparacao"):
+            correspondencias = self.buscador.comparar(embeddings) if len(self.buscador) else [None] * len(recortes)
+        inicio = 0
+        for pedido in lote:
+            fim = inicio + len(pedido.recortes)
+            candidatos = [c for c in correspondencias[inicio:fim] if c is not None and c.distancia <= pedido.tolerancia]
+            pedido.resultado = min(candidatos, key=lambda c: c.distancia) if candidatos else None
+            inicio = fim
+        self.pedidos += len(lote)
+        self.lotes += 1
+        self.rostos += len(recortes)
+        METRICAS.contar("servico/pedidos", len(lote))
+        METRICAS.contar("servico/lotes")
+
+    def estado(self):
+        return {
+            "pedidos": self.pedidos,
+            "lotes": self.lotes,
+            "rostos": self.rostos,
+            "pedidos_por_lote": self.pedidos / self.lotes if self.lotes else None,
+            "usuarios_galeria": len(self.buscador) if self.buscador is not None else None,
+            "fila": self.fila.qsize()
+        }
+
+def _codificar_recorte(recorte):
+    ok, dados = cv2.imencode(".jpg", cv2.cvtColor(recorte, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if not ok:
+        raise Exception("Falha ao codificar recorte do rosto")
+    return base64.b64encode(dados.tobytes()).decode("ascii")
+
+def _decodificar_recorte(texto):
+    dados = np.frombuffer(base64.b64decode(texto), dtype=np.uint8)
+    imagem = cv2.imdecode(dados, cv2.IMREAD_COLOR)
+    if imagem is None:
+        raise ValueError("Recorte inválido")
+    return cv2.cvtColor(imagem, cv2.COLOR_BGR2RGB)
+
+def servir_reconhecimento(endereco=ENDERECO_SERVICO, tamanho_lote=TAMANHO_LOTE_SERVICO, espera_ms=ESPERA_LOTE_MS):
+    """HTTP local: POST /identificar {"rostos": [{"imagem": jpeg base64, "caixa": [t, r, b, l]}]}, GET /estado"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    servico = ServicoReconhecimento(tamanho_lote, espera_ms)
+    servico._atualizar_galeria()
+    # Uma inferência vazia para os modelos já estarem carregados no primeiro pedido
+    servico.perfil.codificar(np.zeros((150, 150, 3), dtype=np.uint8), [(20, 130, 130, 20)])
+
+    class Tratador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # conexões persistentes entre pedidos do mesmo quiosque
+        disable_nagle_algorithm = True  # cabeçalho e corpo vão em envios separados
+
+        def _responder(self, codigo, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path == "/estado":
+                self._responder(200, servico.estado())
+            else:
+                self._responder(404, {"erro": "caminho desconhecido"})
+
+        def do_POST(self):
+            if self.path != "/identificar":
+                self._responder(404, {"erro": "caminho desconhecido"})
+                return
+            try:
+                corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                recortes = [(_decodificar_recorte(r["imagem"]), tuple(r["caixa"])) for r in corpo.get("rostos", [])]
+                tolerancia = float(corpo.get("tolerancia", TOLERANCIA_FACIAL))
+            except (ValueError, KeyError, TypeError) as e:
+                self._responder(400, {"erro": str(e)})
+                return
+            try:
+                c = servico.identificar(recortes, tolerancia)
+            except Exception as e:
+                self._responder(503, {"erro": str(e)})
+                return
+            self._responder(200, {"correspondencia": c._asdict() if c else None})
+
+        def log_message(self, formato, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(endereco, Tratador)
+    servidor.daemon_threads = True
+    print(f"Serviço de reconhecimento em http://{endereco[0]}:{endereco[1]} "
+          f"(lote até {tamanho_lote} rostos, espera {espera_ms} ms)")
+    salvar_log(f"Serviço de reconhecimento iniciado em {endereco[0]}:{endereco[1]}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return servico
+
+class ClienteReconhecimento:
+    """Cliente HTTP do serviço local (uma conexão persistente por cliente)"""
+
+    def __init__(self, endereco=ENDERECO_SERVICO, timeout=TIMEOUT_SERVICO):
+        self.endereco = _endereco_servico(endereco) if isinstance(endereco, str) else endereco
+        self.timeout = timeout
+        self._conexao = None
+        self._lock = threading.Lock()
+
+    def _pedir(self, metodo, caminho, corpo=None):
+        import http.client
+        dados = json.dumps(corpo).encode("utf-8") if corpo is not None else None
+        cabecalhos = {"Content-Type": "application/json"} if dados is not None else {}
+        with self._lock:
+            for tentativa in range(2):
+                if self._conexao is None:
+                    self._conexao = http.client.HTTPConnection(*self.endereco, timeout=self.timeout)
+                try:
+                    self._conexao.request(metodo, caminho, body=dados, headers=cabecalhos)
+                    resposta = self._conexao.getresponse()
+                    conteudo = json.loads(resposta.read())
+                    break
+                except (OSError, http.client.HTTPException):
+                    # Conexão persistente fechada pelo servidor: reabre uma vez
+                    self._conexao.close()
+                    self._conexao = None
+                    if tentativa:
+                        raise
+        if resposta.status != 200:
+            raise Exception(f"Serviço de reconhecimento: {conteudo.get('erro', resposta.status)}")
+        return conteudo
+
+    def disponivel(self):
+        try:
+            self._pedir("GET", "/estado")
+            return True
+        except Exception:
+            return False
+
+    def estado(self):
+        return self._pedir("GET", "/estado")
+
+    def identificar(self, recortes, tolerancia=TOLERANCIA_FACIAL):
+        corpo = {"tolerancia": tolerancia,
+                 "rostos": [{"imagem": _codificar_recorte(r), "caixa": list(c)} for r, c in recortes]}
+        c = self._pedir("POST", "/identificar", corpo)["correspondencia"]
+        return Correspondencia(**c) if c else None
+
+    def fechar(self):
+        with self._lock:
+            if self._conexao is not None:
+                self._conexao.close()
+                self._conexao = None
+
+class ProcessadorLoginRemoto(ProcessadorLogin):
+    """Detecção e rastreio no quiosque; codificação e galeria no serviço de reconhecimento"""
+
+    def __init__(self, cliente, detector=None, perfil=PERFIL_LOGIN):
+        super().__init__(None, detector, perfil)
+        self.cliente = cliente
+
+    def _reconhecer(self, rgb, faces):
+        escolhidas = self.perfil.selecionar(faces, *rgb.shape[:2])
+        if not escolhidas:
+            return None
+        with METRICAS.medir("login/servico"):
+            return self.cliente.identificar(recortar_rostos(rgb, escolhidas))
+
+def teste_carga_servico(endereco, imagem, clientes=(1, 2, 4, 8), duracao=10.0):
+    """Simula N quiosques enviando o mesmo rosto sem parar; mede vazão e latência por N"""
+    bgr = cv2.imread(imagem)
+    if bgr is None:
+        print(f"Imagem não encontrada: {imagem}")
+        return None
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    faces = obter_detector()(rgb)
+    if not faces:
+        print("Nenhum rosto encontrado na imagem de teste.")
+        return None
+    recortes = recortar_rostos(rgb, obter_perfil(PERFIL_LOGIN).selecionar(faces, *rgb.shape[:2]))
+    resultados = []
+    print(f"{'quiosques':>9} {'pedidos/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'pedidos/lote':>13}")
+    for n in clientes:
+        antes = ClienteReconhecimento(endereco).estado()
+        latencias = [[] for _ in range(n)]
+        erros = [0] * n
+        fim = time.monotonic() + duracao
+
+        def quiosque(i):
+            cliente = ClienteReconhecimento(endereco)
+            while time.monotonic() < fim:
+                inicio = time.perf_counter()
+                try:
+                    cliente.identificar(recortes)
+                except Exception:
+                    erros[i] += 1
+                    continue
+                latencias[i].append(time.perf_counter() - inicio)
+            cliente.fechar()
+
+        threads = [threading.Thread(target=quiosque, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        depois = ClienteReconhecimento(endereco).estado()
+        todas = sorted(l for lista in latencias for l in lista)
+        if not todas:
+            print(f"{n:>9} sem respostas ({sum(erros)} erros)")
+            continue
+        lotes = depois["lotes"] - antes["lotes"]
+        r = {
+            "quiosques": n,
+            "pedidos_s": len(todas) / duracao,
+            "p50_ms": statistics.median(todas) * 1000,
+            "p95_ms": todas[int(0.95 * (len(todas) - 1))] * 1000,
+            "pedidos_por_lote": (depois["pedidos"] - antes["pedidos"]) / lotes if lotes else None,
+            "erros": sum(erros)
+        }
+        resultados.append(r)
+        por_lote = f"{r['pedidos_por_lote']:.2f}" if r["pedidos_por_lote"] else "-"
+        print(f"{n:>9} {r['pedidos_s']:>10.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {por_lote:>13}")
+    return resultados
+
+# ------------------------- Pré-visualização da Câmera -------------------------
+class JanelaQt(QObject):
+    """Janela dos loops de câmera que entrega os quadros à interface Qt.
+
+    mostrar() roda na thread do trabalhador: guarda só o quadro mais recente e avisa a
+    interface uma vez (quadros que chegam antes de a interface desenhar substituem o
+    anterior, então a fila de eventos nunca acumula). Botões da interface viram teclas.
+    """
+    quadro_disponivel = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._quadro = None
+        self._pendente = False
+        self._tecla = -1
+        self._buffers = BuffersQuadro()
+
+    def mostrar(self, frame, espera_ms=1):
+        # O loop reaproveita o buffer de exibição no quadro seguinte: guarda uma cópia própria
+        with self._lock:
+            self._quadro = self._buffers.copiar("quadro", frame)
+            avisar = not self._pendente
+            self._pendente = True
+        if avisar:
+            self.quadro_disponivel.emit()
+        if espera_ms > 1:
+            time.sleep(espera_ms / 1000.0)
+        with self._lock:
+            tecla, self._tecla = self._tecla, -1
+        return tecla
+
+    def pegar_quadro(self, buffers=None):
+        """Quadro mais recente convertido para RGB (num buffer de `buffers`, se informado)"""
+        with self._lock:
+            self._pendente = False
+            if self._quadro is None:
+                return None
+            destino = buffers.obter("rgb", self._quadro.shape) if buffers is not None else None
+            return cv2.cvtColor(self._quadro, cv2.COLOR_BGR2RGB, dst=destino)
+
+    def pressionar(self, tecla):
+        with self._lock:
+            self._tecla = ord(tecla)
+
+    def fechar(self):
+        pass
+
+class TrabalhadorCamera(QThread):
+    """Roda funcao(janela) — executar_login/executar_cadastro — fora da thread da interface"""
+    concluido = pyqtSignal(object)
+    falhou = pyqtSignal(str)
+
+    def __init__(self, funcao):
+        super().__init__()
+        self.funcao = funcao
+        self.janela = JanelaQt()
+
+    def run(self):
+        try:
+            self.concluido.emit(self.funcao(self.janela))
+        except Exception as e:
+            self.falhou.emit(str(e))
+
+class TrabalhadorTarefa(QThread):
+    """Roda funcao() fora da thread da interface (ex.: a preparação do login facial)"""
+    concluido = pyqtSignal(object)
+    falhou = pyqtSignal(object)
+
+    def __init__(self, funcao):
+        super().__init__()
+        self.funcao = funcao
+
+    def run(self):
+        try:
+            self.concluido.emit(self.funcao())
+        except Exception as e:
+            self.falhou.emit(e)
+
+def executar_em_segundo_plano(funcao):
+    """Roda funcao() numa QThread e retorna o resultado; a exceção dela é relançada aqui.
+
+    Como em PreviewCamera.executar, a espera é num QEventLoop: a interface segue respondendo.
+    """
+    trabalhador = TrabalhadorTarefa(funcao)
+    resultado = {}
+    laco = QEventLoop()
+    trabalhador.concluido.connect(lambda r: resultado.update(valor=r))
+    trabalhador.falhou.connect(lambda e: resultado.update(erro=e))
+    trabalhador.finished.connect(laco.quit)
+    trabalhador.start()
+    laco.exec_()
+    trabalhador.wait()
+    if "erro" in resultado:
+        raise resultado["erro"]
+    return resultado["valor"]
+
+class PreviewCamera(QWidget):
+    """Área de vídeo embutida no painel, com botões de captura/cancelamento"""
+
+    def __init__(self, captura=False):
+        super().__init__()
+        self.trabalhador = None
+        self.buffers = BuffersQuadro()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.video = QLabel()
+        self.video.setAlignment(Qt.AlignCenter)
+        self.video.setMinimumSize(320, 240)
+        self.video.setStyleSheet("background-color: black; border-radius: 6px;")
+        layout.addWidget(self.video)
+
+        botoes = QHBoxLayout()
+        self.btn_capturar = QPushButton("📸 Capturar (Espaço)")
+        self.btn_capturar.setStyleSheet(GerenciarUsuarios.botao_style(self))
+        self.btn_capturar.setVisible(captura)
+        self.btn_cancelar = QPushButton("Cancelar (Q)")
+        self.btn_cancelar.setStyleSheet("""
+            QPushButton {
+                background-color: #d9534f;
+                color: white;
+                border-radius: 6px;
+                padding: 6px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #c9302c;
+            }
+        """)
+        botoes.addWidget(self.btn_capturar)
+        botoes.addWidget(self.btn_cancelar)
+        layout.addLayout(botoes)
+        self.setLayout(layout)
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setVisible(False)
+
+        self.btn_capturar.clicked.connect(self.capturar)
+        self.btn_cancelar.clicked.connect(self.cancelar)
+
+    def ativo(self):
+        return self.trabalhador is not None
+
+    def executar(self, funcao):
+        """Roda funcao(janela) numa QThread mostrando os quadros aqui e retorna o resultado.
+
+        Enquanto espera, o laço de eventos do Qt continua rodando (como num QDialog.exec_),
+        então timers de sessão e logs seguem atualizando. Erros do loop são relançados.
+        """
+        trabalhador = TrabalhadorCamera(funcao)
+        self.trabalhador = trabalhador
+        resultado = {}
+        laco = QEventLoop()
+        trabalhador.janela.quadro_disponivel.connect(self._mostrar_quadro)
+        trabalhador.concluido.connect(lambda r: resultado.update(valor=r))
+        trabalhador.falhou.connect(lambda msg: resultado.update(erro=msg))
+        trabalhador.finished.connect(laco.quit)
+        self.setVisible(True)
+        self.setFocus()
+        trabalhador.start()
+        laco.exec_()
+        trabalhador.wait()
+        self.trabalhador = None
+        self.video.clear()
+        self.setVisible(False)
+        if "erro" in resultado:
+            raise Exception(resultado["erro"])
+        return resultado["valor"]
+
+    def capturar(self):
+        if self.trabalhador is not None:
+            self.trabalhador.janela.pressionar(" ")
+
+    def cancelar(self):
+        if self.trabalhador is not None:
+            self.trabalhador.janela.pressionar("q")
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Q or event.key() == Qt.Key_Escape:
+            self.cancelar()
+        elif event.key() == Qt.Key_Space and self.btn_capturar.isVisible():
+            self.capturar()
+        else:
+            super().keyPressEvent(event)
+
+    def _mostrar_quadro(self):
+        if self.trabalhador is None:
+            return
+        rgb = self.trabalhador.janela.pegar_quadro(self.buffers)
+        if rgb is None:
+            return
+        altura, largura = rgb.shape[:2]
+        imagem = QImage(rgb.data, largura, altura, 3 * largura, QImage.Format_RGB888)
+        self.video.setPixmap(QPixmap.fromImage(imagem).scaled(self.video.size(), Qt.KeepAspectRatio,
+                                                              Qt.SmoothTransformation))
+
 # ------------------------- Tela de Gerenciamento de Usuários -------------------------
 class GerenciarUsuarios(QWidget):
     def __init__(self):
@@ -291,6 +4532,10 @@ class GerenciarUsuarios(QWidget):
         btn_layout2.addWidget(self.btn_cadastrar_face)
         layout.addLayout(btn_layout2)
 
+        # Vídeo do cadastro facial (aparece só durante a captura)
+        self.preview = PreviewCamera(captura=True)
+        layout.addWidget(self.preview)
+
         self.setLayout(layout)
         self.carregar_lista()
 
@@ -347,7 +4592,7 @@ class GerenciarUsuarios(QWidget):
             "pastas": [],
             "embedding": embedding.tolist() if embedding is not None else None
         }
-        salvar_usuarios(usuarios)
+        salvar_usuario(nome, usuarios[nome])
         msg_embedding = "com reconhecimento facial" if embedding is not None else "sem reconhecimento facial"
         salvar_log(f"Usuário '{nome}' cadastrado {msg_embedding}.")
         QMessageBox.information(self, "Sucesso", f"Usuário cadastrado {msg_embedding}!")
@@ -355,11 +4600,13 @@ class GerenciarUsuarios(QWidget):
 
     def capturar_face_usuario(self, nome):
         """Captura a face do usuário usando webcam e retorna o embedding facial"""
+        if self.preview.ativo():
+            return None
         video = None
         try:
             # Tenta abrir a câmera
             try:
-                video = cv2.VideoCapture(0)
+                video = abrir_fonte(FONTE_CAMERA)
             except Exception as e:
                 QMessageBox.critical(self, "Erro ao Acessar Câmera",
                                    f"Não foi possível inicializar a câmera.\n\n"
@@ -385,96 +4632,24 @@ class GerenciarUsuarios(QWidget):
                                    "Instruções:\n"
                                    "• Posicione seu rosto no centro da tela\n"
                                    "• Aguarde o rosto ser detectado (retângulo verde)\n"
-                                   "• Pressione ESPAÇO para capturar\n"
-                                   "• Pressione Q para cancelar")
-
-            embedding_capturado = None
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            frame_count = 0
-            max_failed_frames = 30  # Máximo de frames consecutivos sem captura
-
-            while True:
-                try:
-                    ret, frame = video.read()
-                    if not ret:
-                        frame_count += 1
-                        if frame_count > max_failed_frames:
-                            raise Exception("Falha ao capturar frames da câmera. A câmera pode ter sido desconectada.")
-                        continue
-
-                    frame_count = 0  # Reset contador se frame for capturado com sucesso
-
-                    # Redimensiona para processar mais rápido
-                    small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-                    rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-
-                    # Detecta rostos e gera embeddings
-                    try:
-                        faces = face_recognition.face_locations(rgb)
-                        embeddings = face_recognition.face_encodings(rgb, faces)
-                    except Exception as e:
-                        # Erro no reconhecimento facial
-                        raise Exception(f"Erro no processamento de reconhecimento facial: {str(e)}")
-
-                    # Frame para exibição (tamanho original)
-                    display_frame = frame.copy()
-
-                    # Determina status
-                    if len(faces) == 0:
-                        status_msg = "Nenhum rosto detectado"
-                        color = (0, 0, 255)  # Vermelho
-                    elif len(faces) > 1:
-                        status_msg = "Multiplos rostos - apenas 1 permitido"
-                        color = (0, 165, 255)  # Laranja
-                    else:
-                        status_msg = "Rosto detectado - Pressione ESPACO"
-                        color = (0, 255, 0)  # Verde
-
-                        # Desenha retângulo ao redor do rosto (escala 2x pois redimensionamos)
-                        for (top, right, bottom, left) in faces:
-                            top *= 2
-                            right *= 2
-                            bottom *= 2
-                            left *= 2
-                            cv2.rectangle(display_frame, (left, top), (right, bottom), color, 3)
-
-                    # Adiciona texto de status
-                    cv2.putText(display_frame, status_msg, (10, 30), font, 0.9, color, 2)
-                    cv2.putText(display_frame, f"Usuario: {nome}", (10, 70), font, 0.7, (255, 255, 255), 2)
-                    cv2.putText(display_frame, "Q = Cancelar", (10, display_frame.shape[0] - 10), font, 0.6, (255, 255, 255), 1)
+                                   "• Pressione ESPAÇO (ou Capturar) para capturar\n"
+                                   "• Pressione Q (ou Cancelar) para cancelar")
 
-                    try:
-                        cv2.imshow("Cadastro Facial", display_frame)
-                    except Exception as e:
-                        raise Exception(f"Erro ao exibir janela de vídeo: {str(e)}")
-
-                    key = cv2.waitKey(1) & 0xFF
-
-                    # Captura com ESPAÇO se houver exatamente 1 rosto
-                    if key == ord(' ') and len(faces) == 1:
-                        embedding_capturado = embeddings[0]
-                        # Feedback visual
-                        cv2.putText(display_frame, "CAPTURADO!", (display_frame.shape[1]//2 - 100, display_frame.shape[0]//2),
-                                   font, 1.5, (0, 255, 0), 3)
-                        cv2.imshow("Cadastro Facial", display_frame)
-                        cv2.waitKey(1000)  # Mostra por 1 segundo
-                        break
-                    elif key == ord('q'):
-                        break
-
-                except Exception as e:
-                    # Erro durante o loop de captura
-                    if video is not None:
-                        video.release()
-                    cv2.destroyAllWindows()
-                    QMessageBox.critical(self, "Erro Durante Captura",
-                                       f"Ocorreu um erro durante a captura:\n\n{str(e)}")
-                    return None
+            # O loop roda numa QThread; o vídeo aparece no próprio painel
+            self.habilitar_botoes(False)
+            try:
+                embedding_capturado, _ = self.preview.executar(lambda janela: executar_cadastro(video, nome, exibir=janela))
+            except Exception as e:
+                # Erro durante o loop de captura
+                video.release()
+                QMessageBox.critical(self, "Erro Durante Captura",
+                                   f"Ocorreu um erro durante a captura:\n\n{str(e)}")
+                return None
+            finally:
+                self.habilitar_botoes(True)
 
             # Libera recursos
-            if video is not None:
-                video.release()
-            cv2.destroyAllWindows()
+            video.release()
 
             if embedding_capturado is not None:
                 QMessageBox.information(self, "Sucesso", f"✅ Face de '{nome}' capturada com sucesso!")
@@ -496,6 +4671,10 @@ class GerenciarUsuarios(QWidget):
                 pass
             return None
 
+    def habilitar_botoes(self, habilitado):
+        for btn in [self.btn_add, self.btn_remover, self.btn_pastas, self.btn_cadastrar_face]:
+            btn.setEnabled(habilitado)
+
     def atualizar_face_usuario(self):
         """Cadastra ou atualiza a face de um usuário existente"""
         item = self.lista_usuarios.currentItem()
@@ -529,7 +4708,7 @@ class GerenciarUsuarios(QWidget):
 
         # Atualiza no JSON
         usuarios[nome]["embedding"] = embedding.tolist()
-        salvar_usuarios(usuarios)
+        salvar_usuario(nome, usuarios[nome])
 
         acao = "atualizada" if tem_face else "cadastrada"
         salvar_log(f"Face do usuário '{nome}' {acao}.")
@@ -548,6 +4727,7 @@ class GerenciarUsuarios(QWidget):
             if reply == QMessageBox.Yes:
                 del usuarios[nome]
                 salvar_usuarios(usuarios)
+                revogar_sessoes_usuario(nome)
                 salvar_log(f"Usuário '{nome}' removido.")
                 QMessageBox.information(self, "Removido", "Usuário removido com sucesso.")
                 self.carregar_lista()
@@ -594,7 +4774,7 @@ class GerenciarUsuarios(QWidget):
         if dlg.exec_() == QDialog.Accepted:
             selecionadas = [i.text() for i in list_widget.selectedItems()]
             usuarios[nome]["pastas"] = selecionadas
-            salvar_usuarios(usuarios)
+            salvar_usuario(nome, usuarios[nome])
             salvar_log(f"Usuário '{nome}' teve acesso atualizado: {', '.join(selecionadas) if selecionadas else '(nenhuma)'}")
             QMessageBox.information(self, "Atualizado", "Acesso atualizado com sucesso.")
 
@@ -695,6 +4875,83 @@ class LogsTempoReal(QWidget):
             self.texto_log.setPlainText(conteudo)
             self.texto_log.moveCursor(self.texto_log.textCursor().End)
 
+# ------------------------- Desempenho em Tempo Real -------------------------
+class PainelDesempenho(QWidget):
+    def __init__(self):
+        super().__init__()
+        layout = QVBoxLayout()
+        self.setStyleSheet("background-color: #f0f4f7;")
+        self.label = QLabel("📈 Desempenho do Reconhecimento (tempo real)")
+        self.label.setStyleSheet("font-size: 18px; font-weight: bold; margin-bottom: 10px; color: #333;")
+        layout.addWidget(self.label)
+
+        self.texto = QTextEdit()
+        self.texto.setReadOnly(True)
+        self.texto.setStyleSheet("font-family: monospace; font-size: 12px;")
+        layout.addWidget(self.texto)
+
+        self.btn_exportar = QPushButton("Exportar Métricas (JSON/Prometheus)")
+        self.btn_exportar.setStyleSheet(GerenciarUsuarios.botao_style(self))
+        layout.addWidget(self.btn_exportar)
+        self.setLayout(layout)
+
+        self.btn_exportar.clicked.connect(self.exportar)
+        self.atualizar()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.atualizar)
+        self.timer.start(1000)
+
+    def _resumo(self):
+        # Métricas deste processo, ou as exportadas por outro processo (ex.: quiosque)
+        resumo = METRICAS.resumo()
+        if not resumo["etapas"]:
+            resumo = carregar_desempenho() or resumo
+        return resumo
+
+    def atualizar(self):
+        resumo = self._resumo()
+        linhas = [f"Atualizado em {resumo['gerado_em']} (processo {resumo['pid']})", ""]
+        if not resumo["etapas"]:
+            linhas.append("Nenhuma medição ainda. Faça um login ou cadastro facial.")
+        else:
+            linhas.append(f"{'etapa':<32}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for etapa, r in resumo["etapas"].items():
+            linhas.append(f"{etapa:<32}{r['amostras']:>6}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+        if resumo["fps"]:
+            linhas += ["", f"{'fluxo':<32}{'FPS':>6}"]
+            for nome, fps in resumo["fps"].items():
+                linhas.append(f"{nome:<32}{fps:>6.1f}")
+        if resumo["contadores"]:
+            linhas += ["", f"{'contador':<32}{'total':>6}"]
+            for nome, valor in resumo["contadores"].items():
+                linhas.append(f"{nome:<32}{valor:>6}")
+        linhas += ["", f"{'arquivo (cache)':<32}{'acertos':>8}{'faltas':>8}"]
+        for r in estatisticas_cache_json():
+            linhas.append(f"{r['arquivo']:<32}{r['acertos']:>8}{r['faltas']:>8}")
+        r = REGISTRO.estatisticas()
+        linhas += ["", f"Log: {r['gravadas']} linha(s) gravada(s) em {r['lotes']} lote(s), {r['pendentes']} pendente(s), "
+                       f"{r['descartadas']} descartada(s), {r['perdidas']} perdida(s)"]
+        r = SESSOES.estatisticas()
+        linhas += ["", f"Sessões: {r['ativas']} ativa(s) de {r['usuarios']} usuário(s), "
+                       f"{r['heap']} prazo(s) no heap, {r['expiradas']} expirada(s) removida(s)"]
+        for gerenciador in list(_gerenciadores_camera.values()):
+            r = gerenciador.relatorio()
+            abertura = f"{r['latencia_abertura_ms']:.0f} ms" if r["latencia_abertura_ms"] is not None else "-"
+            fps = f"{r['fps']:.1f}" if r["fps"] else "-"
+            linhas += ["", f"Câmera {r['indice']}: {r['estado']}, {r['assinantes']} assinante(s), "
+                           f"abertura {abertura}, {fps} FPS, {r['aberturas']} abertura(s)"]
+        self.texto.setPlainText("\n".join(linhas))
+
+    def exportar(self):
+        if not METRICAS.resumo()["etapas"]:
+            QMessageBox.information(self, "Desempenho", f"Sem medições neste processo.\nÚltima exportação: {DESEMPENHO_FILE}")
+            return
+        try:
+            METRICAS.exportar()
+            QMessageBox.information(self, "Desempenho", f"Métricas exportadas para:\n{DESEMPENHO_FILE}\n{DESEMPENHO_PROM_FILE}")
+        except OSError as e:
+            QMessageBox.critical(self, "Erro", f"Erro ao exportar métricas:\n{e}")
+
 # ------------------------- Tela de Gerenciamento de Administradores -------------------------
 class GerenciarAdmins(QWidget):
     def __init__(self, admin_logado):
@@ -838,8 +5095,9 @@ class AdminPanel(QWidget):
         self.btn_pastas = QPushButton("Gerenciar Pastas")
         self.btn_admins = QPushButton("Gerenciar Administradores")
         self.btn_logs = QPushButton("Ver Logs em Tempo Real")
+        self.btn_desempenho = QPushButton("Desempenho")
 
-        for btn in [self.btn_usuarios, self.btn_pastas, self.btn_admins, self.btn_logs]:
+        for btn in [self.btn_usuarios, self.btn_pastas, self.btn_admins, self.btn_logs, self.btn_desempenho]:
             btn.setStyleSheet("""
                 QPushButton {
                     padding:10px; font-size:15px; text-align:left; background-color:#0078d7; color:white; border-radius:6px;
@@ -855,11 +5113,13 @@ class AdminPanel(QWidget):
         self.tela_pastas = GerenciarPastas()
         self.tela_admins = GerenciarAdmins(admin_logado)
         self.tela_logs = LogsTempoReal()
+        self.tela_desempenho = PainelDesempenho()
 
         self.stack.addWidget(self.tela_usuarios)
         self.stack.addWidget(self.tela_pastas)
         self.stack.addWidget(self.tela_admins)
         self.stack.addWidget(self.tela_logs)
+        self.stack.addWidget(self.tela_desempenho)
 
         layout.addLayout(self.menu, 1)
         layout.addWidget(self.stack, 4)
@@ -869,6 +5129,12 @@ class AdminPanel(QWidget):
         self.btn_pastas.clicked.connect(lambda: self.stack.setCurrentWidget(self.tela_pastas))
         self.btn_admins.clicked.connect(lambda: self.stack.setCurrentWidget(self.tela_admins))
         self.btn_logs.clicked.connect(lambda: self.stack.setCurrentWidget(self.tela_logs))
+        self.btn_desempenho.clicked.connect(lambda: self.stack.setCurrentWidget(self.tela_desempenho))
+
+    def closeEvent(self, event):
+        # Fechar o painel no meio de um cadastro facial encerra o loop da câmera
+        self.tela_usuarios.preview.cancelar()
+        super().closeEvent(event)
 
 # ------------------------- Tela do Cofre -------------------------
 class CofrePanel(QWidget):
@@ -973,14 +5239,10 @@ class CofrePanel(QWidget):
         self.carregar_arquivos()
 
     def atualizar_info_sessao(self):
-        sessoes = carregar_sessoes()
-        if self.sessao_id in sessoes:
-            sessao = sessoes[self.sessao_id]
-            expira = datetime.datetime.strptime(sessao["expira_em"], '%Y-%m-%d %H:%M:%S')
-            agora = datetime.datetime.now()
-            tempo_restante = expira - agora
-            minutos = int(tempo_restante.total_seconds() / 60)
-            segundos = int(tempo_restante.total_seconds() % 60)
+        sessao = obter_sessao(self.sessao_id)
+        if sessao:
+            restante = max(0, int(ArmazemSessoes._prazo(sessao) - time.time()))
+            minutos, segundos = divmod(restante, 60)
             self.label_sessao.setText(f"⏱️ Sessão expira em: {minutos}m {segundos}s")
 
     def verificar_sessao(self):
@@ -1037,8 +5299,6 @@ class CofrePanel(QWidget):
                                          QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.No:
                 return
-            # Remove da metadata
-            metadata["arquivos"] = [a for a in metadata["arquivos"] if a["nome"] != nome_arquivo]
 
         # Copia arquivo
         try:
@@ -1048,13 +5308,13 @@ class CofrePanel(QWidget):
             # Atualiza metadata
             tamanho = os.path.getsize(destino)
             agora = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            metadata["arquivos"].append({
+            registrar_arquivo_cofre(self.usuario, {
                 "nome": nome_arquivo,
                 "tamanho": tamanho,
                 "data_upload": agora
             })
-            salvar_metadata_cofre(self.usuario, metadata)
-            salvar_log(f"[COFRE] '{self.usuario}' fez upload de '{nome_arquivo}' ({tamanho} bytes)")
+            salvar_log(f"[COFRE] '{self.usuario}' fez upload de '{nome_arquivo}' ({tamanho} bytes)",
+                       evento="upload", usuario=self.usuario, arquivo=nome_arquivo, tamanho=tamanho)
 
             QMessageBox.information(self, "Sucesso", f"Arquivo '{nome_arquivo}' enviado ao cofre!")
             self.carregar_arquivos()
@@ -1092,7 +5352,8 @@ class CofrePanel(QWidget):
         try:
             import shutil
             shutil.copy2(origem, destino)
-            salvar_log(f"[COFRE] '{self.usuario}' fez download de '{nome_arquivo}'")
+            salvar_log(f"[COFRE] '{self.usuario}' fez download de '{nome_arquivo}'",
+                       evento="download", usuario=self.usuario, arquivo=nome_arquivo)
             QMessageBox.information(self, "Sucesso", f"Arquivo baixado para:\n{destino}")
         except Exception as e:
             QMessageBox.critical(self, "Erro", f"Erro ao fazer download:\n{e}")
@@ -1159,11 +5420,10 @@ class CofrePanel(QWidget):
                 os.remove(arquivo)
 
             # Atualiza metadata
-            metadata = obter_metadata_cofre(self.usuario)
-            metadata["arquivos"] = [a for a in metadata["arquivos"] if a["nome"] != nome_arquivo]
-            salvar_metadata_cofre(self.usuario, metadata)
+            remover_arquivo_cofre(self.usuario, nome_arquivo)
 
-            salvar_log(f"[COFRE] '{self.usuario}' excluiu '{nome_arquivo}'")
+            salvar_log(f"[COFRE] '{self.usuario}' excluiu '{nome_arquivo}'",
+                       evento="exclusao", usuario=self.usuario, arquivo=nome_arquivo)
             QMessageBox.information(self, "Sucesso", f"Arquivo '{nome_arquivo}' excluído do cofre.")
             self.carregar_arquivos()
         except Exception as e:
@@ -1238,6 +5498,10 @@ class ColaboradorPanel(QWidget):
         self.btn_cofre.setVisible(False)
         layout.addWidget(self.btn_cofre)
 
+        # Vídeo do reconhecimento (aparece só durante o login facial)
+        self.preview = PreviewCamera()
+        layout.addWidget(self.preview)
+
         # Adiciona espaçamento para centralizar melhor
         layout.addStretch()
 
@@ -1247,47 +5511,75 @@ class ColaboradorPanel(QWidget):
         self.btn_cofre.clicked.connect(self.abrir_cofre)
 
     # ------------------------- Login por reconhecimento facial -------------------------
+    @staticmethod
+    def _preparar_login():
+        """Etapas lentas antes do loop: modelos, galeria, serviço e câmera.
+
+        Roda fora da thread da interface e não mexe em widgets; devolve (falha, detalhe) ou
+        (None, (buscador, processador, video)).
+        """
+        # Se o aquecimento ainda estiver carregando os modelos, espera por ele
+        aguardar_aquecimento()
+
+        # Carrega a galeria binária (só relê o JSON se ela estiver desatualizada)
+        galeria = carregar_galeria()
+        if not galeria.total_usuarios:
+            return "sem_usuarios", None
+        if not len(galeria):
+            return "sem_faces", None
+
+        # Acima do limiar configurado a busca usa o índice aproximado IVF
+        buscador = obter_buscador(galeria)
+        processador = None
+        if SERVICO_RECONHECIMENTO:
+            # Serviço local compartilhado entre quiosques; sem ele, reconhece neste processo
+            cliente = ClienteReconhecimento(SERVICO_RECONHECIMENTO)
+            if cliente.disponivel():
+                processador = ProcessadorLoginRemoto(cliente)
+            else:
+                salvar_log(f"Serviço de reconhecimento indisponível em {SERVICO_RECONHECIMENTO}; usando reconhecimento local.")
+
+        # Tenta abrir a câmera
+        try:
+            video = abrir_fonte(FONTE_CAMERA)
+        except Exception as e:
+            return "erro_camera", str(e)
+        if not video.isOpened():
+            video.release()
+            return "camera_fechada", None
+        return None, (buscador, processador, video)
+
     def login_facial(self):
+        if self.preview.ativo() or not self.btn_face.isEnabled():
+            return
         video = None
         try:
-            # Carrega usuários do JSON
-            usuarios = carregar_usuarios()
-            if not usuarios:
+            # Preparação numa QThread: a interface segue respondendo enquanto modelos e câmera carregam
+            self.btn_face.setEnabled(False)
+            try:
+                falha, detalhe = executar_em_segundo_plano(self._preparar_login)
+            finally:
+                self.btn_face.setEnabled(True)
+
+            if falha == "sem_usuarios":
                 QMessageBox.warning(self, "Erro", "Nenhum usuário cadastrado!")
                 return
 
-            # Converte embeddings armazenados para numpy arrays
-            usuarios_processados = []
-            for nome, info in usuarios.items():
-                try:
-                    emb = info.get("embedding", None)
-                    if emb is None:
-                        continue
-                    usuarios_processados.append({
-                        "nome": nome,
-                        "embedding": np.array(emb) if isinstance(emb, (list, np.ndarray)) else None
-                    })
-                except Exception:
-                    continue  # Pula usuários com embedding inválido
-
-            if not usuarios_processados:
+            if falha == "sem_faces":
                 QMessageBox.warning(self, "Erro", "Nenhum usuário possui reconhecimento facial cadastrado!\n\nCadastre a face dos usuários no Painel do Administrador.")
                 return
 
-            # Tenta abrir a câmera
-            try:
-                video = cv2.VideoCapture(0)
-            except Exception as e:
+            if falha == "erro_camera":
                 QMessageBox.critical(self, "Erro ao Acessar Câmera",
                                    f"Não foi possível inicializar a câmera.\n\n"
-                                   f"Erro: {str(e)}\n\n"
+                                   f"Erro: {detalhe}\n\n"
                                    f"Verifique se:\n"
                                    f"• A câmera está conectada\n"
                                    f"• Nenhum outro programa está usando a câmera\n"
                                    f"• Você tem permissão para acessar a câmera")
                 return
 
-            if not video.isOpened():
+            if falha == "camera_fechada":
                 QMessageBox.critical(self, "Erro ao Acessar Câmera",
                                    "Não foi possível abrir a câmera!\n\n"
                                    "Possíveis causas:\n"
@@ -1297,93 +5589,30 @@ class ColaboradorPanel(QWidget):
                                    "• Permissões de acesso à câmera negadas")
                 return
 
-            QMessageBox.information(self, "Reconhecimento Facial", "📸 Olhe para a câmera para autenticação.\nPressione 'Q' na janela da câmera para cancelar.")
-
-            usuario_identificado = None
-            status_msg = "🔍 Procurando rostos..."
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            frame_count = 0
-            max_failed_frames = 30
-
-            while True:
-                try:
-                    ret, frame = video.read()
-                    if not ret:
-                        frame_count += 1
-                        if frame_count > max_failed_frames:
-                            raise Exception("Falha ao capturar frames da câmera. A câmera pode ter sido desconectada.")
-                        continue
-
-                    frame_count = 0
-
-                    # redimensiona frame para acelerar
-                    small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-                    rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-
-                    # Detecta rostos e gera embeddings
-                    try:
-                        faces = face_recognition.face_locations(rgb)
-                        embeddings = face_recognition.face_encodings(rgb, faces)
-                    except Exception as e:
-                        raise Exception(f"Erro no processamento de reconhecimento facial: {str(e)}")
-
-                    if len(faces) == 0:
-                        status_msg = "❌ Nenhum rosto detectado"
-                    else:
-                        status_msg = "🔍 Rosto detectado, verificando..."
-
-                    # compara embeddings com os usuários carregados
-                    for rosto in embeddings:
-                        for u in usuarios_processados:
-                            if u["embedding"] is None:
-                                continue
-                            try:
-                                match = face_recognition.compare_faces([u["embedding"]], rosto)[0]
-                            except Exception:
-                                # segurança caso formatos divergentes
-                                match = False
-                            if match:
-                                usuario_identificado = u["nome"]
-                                status_msg = f"✅ {usuario_identificado} reconhecido!"
-                                break
-                        if usuario_identificado:
-                            break
+            buscador, processador, video = detalhe
+            if not self.isVisible():
+                video.release()  # painel fechado durante a preparação
+                return
 
-                    # desenha mensagem sobre o frame
-                    display_frame = cv2.resize(small_frame, (frame.shape[1], frame.shape[0]))
-                    color = (0, 255, 0) if "✅" in status_msg else (0, 0, 255)
-                    cv2.putText(display_frame, status_msg, (10, 30), font, 0.8, color, 2)
-
-                    # Desenha retângulos ao redor dos rostos
-                    for (top, right, bottom, left) in faces:
-                        top *= 2
-                        right *= 2
-                        bottom *= 2
-                        left *= 2
-                        cv2.rectangle(display_frame, (left, top), (right, bottom), (255, 0, 0), 2)
-
-                    try:
-                        cv2.imshow("Reconhecimento Facial", display_frame)
-                    except Exception as e:
-                        raise Exception(f"Erro ao exibir janela de vídeo: {str(e)}")
-
-                    key = cv2.waitKey(1) & 0xFF
-                    if usuario_identificado or key == ord('q'):
-                        break
+            QMessageBox.information(self, "Reconhecimento Facial", "📸 Olhe para a câmera para autenticação.\nPressione 'Q' ou Cancelar para desistir.")
 
-                except Exception as e:
-                    # Erro durante o loop
-                    if video is not None:
-                        video.release()
-                    cv2.destroyAllWindows()
-                    QMessageBox.critical(self, "Erro Durante Reconhecimento",
-                                       f"Ocorreu um erro durante o reconhecimento:\n\n{str(e)}")
-                    return
+            # O loop roda numa QThread; a interface (timers de sessão, logs) continua respondendo
+            self.btn_face.setEnabled(False)
+            try:
+                correspondencia, _ = self.preview.executar(
+                    lambda janela: executar_login(video, buscador, exibir=janela, processador=processador))
+            except Exception as e:
+                # Erro durante o loop
+                video.release()
+                QMessageBox.critical(self, "Erro Durante Reconhecimento",
+                                   f"Ocorreu um erro durante o reconhecimento:\n\n{str(e)}")
+                return
+            finally:
+                self.btn_face.setEnabled(True)
 
             # Libera recursos
-            if video is not None:
-                video.release()
-            cv2.destroyAllWindows()
+            video.release()
+            usuario_identificado = correspondencia.nome if correspondencia else None
 
             if usuario_identificado:
                 QMessageBox.information(self, "Acesso Liberado", f"✅ Acesso liberado para: {usuario_identificado}")
@@ -1400,7 +5629,8 @@ class ColaboradorPanel(QWidget):
                 self.btn_cofre.setVisible(True)
 
                 # Log de acesso
-                salvar_log(f"Colaborador '{usuario_identificado}' fez login facial.")
+                salvar_log(f"Colaborador '{usuario_identificado}' fez login facial "
+                           f"(distância {correspondencia.distancia:.3f}, margem {correspondencia.margem:.3f}).")
             else:
                 QMessageBox.warning(self, "Falha", "Rosto não reconhecido ou operação cancelada.")
 
@@ -1417,6 +5647,11 @@ class ColaboradorPanel(QWidget):
             except:
                 pass
 
+    def closeEvent(self, event):
+        # Fechar o painel no meio do reconhecimento encerra o loop da câmera
+        self.preview.cancelar()
+        super().closeEvent(event)
+
     # ------------------------- Abrir cofre -------------------------
     def abrir_cofre(self):
         if not self.sessao_id:
@@ -1582,9 +5817,234 @@ class MenuPrincipal(QWidget):
         self.colab = ColaboradorPanel()
         self.colab.show()
 
+# ------------------------- Linha de Comando -------------------------
+def executar_linha_comando(argv):
+    """Ferramentas sem interface gráfica: python CodigoCorreto.py <comando> [opções]"""
+    import argparse
+    parser = argparse.ArgumentParser(prog="CodigoCorreto.py", description="Ferramentas do Cofre Digital")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("benchmark-ann", help="Recall e latência do índice IVF contra a busca exata")
+    p.add_argument("--usuarios", type=int, default=100000, help="tamanho da galeria sintética")
+    p.add_argument("--consultas", type=int, default=200)
+    p.add_argument("--listas", type=int, default=None, help="número de listas IVF (padrão: 2*sqrt(n))")
+    p.add_argument("--sondagens", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    p.add_argument("--galeria-real", action="store_true", help="usa a galeria cadastrada em vez da sintética")
+
+    p = sub.add_parser("benchmark-detectores", help="Latência e F1 dos detectores de rosto sobre as amostras")
+    p.add_argument("--piso", type=float, default=PISO_ACURACIA_DETECCAO, help="F1 mínimo para seleção")
+    p.add_argument("--salvar", action="store_true", help="grava a escolha para esta máquina")
+
+    p = sub.add_parser("benchmark-perfis", help="Custo por rosto de cada perfil de codificação")
+    p.add_argument("imagens", nargs="+", help="imagens com rostos")
+    p.add_argument("--repeticoes", type=int, default=3)
+
+    p = sub.add_parser("cadastrar-lote", help="Cadastra faces a partir de uma pasta de imagens ou CSV nome,caminho")
+    p.add_argument("origem", help="pasta (arquivo = usuário, subpasta = usuário) ou CSV")
+    p.add_argument("--processos", type=int, default=None, help="padrão: número de núcleos")
+    p.add_argument("--perfil", choices=sorted(PERFIS_CODIFICACAO), default=PERFIL_CADASTRO)
+
+    p = sub.add_parser("benchmark-reconhecimento", help="Roda o loop de login/cadastro sem tela sobre uma fonte de quadros")
+    p.add_argument("fonte", help="índice da câmera, vídeo, pasta de imagens ou sintetico[:imagem]")
+    p.add_argument("--modo", choices=["login", "cadastro"], default="login")
+    p.add_argument("--tempo-limite", type=float, default=30.0, help="segundos")
+    p.add_argument("--sem-ritmo", action="store_true", help="entrega quadros o mais rápido possível em vez do fps da fonte")
+
+    p = sub.add_parser("servico-reconhecimento", help="Serviço HTTP local de codificação e busca para vários quiosques")
+    p.add_argument("--host", default=ENDERECO_SERVICO[0])
+    p.add_argument("--porta", type=int, default=ENDERECO_SERVICO[1])
+    p.add_argument("--lote", type=int, default=TAMANHO_LOTE_SERVICO, help="rostos no máximo por micro-lote")
+    p.add_argument("--espera-ms", type=float, default=ESPERA_LOTE_MS, help="espera máxima para formar o lote")
+
+    p = sub.add_parser("teste-carga-servico", help="Vazão do serviço de reconhecimento com N quiosques simulados")
+    p.add_argument("imagem", help="imagem com um rosto, enviada repetidamente")
+    p.add_argument("--endereco", default=f"{ENDERECO_SERVICO[0]}:{ENDERECO_SERVICO[1]}")
+    p.add_argument("--clientes", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--duracao", type=float, default=10.0, help="segundos por rodada")
+
+    p = sub.add_parser("benchmark-buffers", help="Tempo e memória por quadro alocando a cada quadro x com buffers reaproveitados")
+    p.add_argument("fonte", nargs="?", default="sintetico", help="vídeo, pasta de imagens ou sintetico[:imagem]")
+    p.add_argument("--quadros", type=int, default=300)
+    p.add_argument("--largura", type=int, default=1920, help="resolução da fonte sintética")
+    p.add_argument("--altura", type=int, default=1080)
+
+    p = sub.add_parser("multicamera", help="Reconhecimento simultâneo em várias câmeras/fontes com pool compartilhado")
+    p.add_argument("fontes", nargs="+", help="índices de câmera, vídeos, pastas de imagens ou sintetico[:imagem]")
+    p.add_argument("--processos", type=int, default=None, help="padrão: número de núcleos")
+    p.add_argument("--tempo-limite", type=float, default=None, help="segundos (padrão: até Ctrl+C ou fim das fontes)")
+    p.add_argument("--sem-ritmo", action="store_true", help="entrega quadros o mais rápido possível")
+    p.add_argument("--escalonamento", action="store_true",
+                   help="roda com 1, 2, ... N fontes e mostra a vazão total de cada rodada")
+
+    p = sub.add_parser("migrar-sqlite", help="Copia os arquivos JSON de dados para o banco SQLite (data/cofre.db)")
+    p.add_argument("--forcar", action="store_true", help="Recria o banco se ele já existir")
+
+    p = sub.add_parser("benchmark-armazenamento", help="Custo de gravar um usuário novo conforme a base cresce (JSON x SQLite)")
+    p.add_argument("--tamanhos", type=int, nargs="+", default=[100, 1000, 10000])
+    p.add_argument("--repeticoes", type=int, default=5)
+
+    p = sub.add_parser("benchmark-diario", help="Custo de gravar uma sessão: reescrever o JSON x anexar ao diário")
+    p.add_argument("--tamanhos", type=int, nargs="+", default=[100, 1000, 10000])
+    p.add_argument("--repeticoes", type=int, default=20)
+
+    p = sub.add_parser("teste-concorrencia", help="Vários processos gravando no mesmo data/; confere que nada se perde")
+    p.add_argument("--processos", type=int, default=8)
+    p.add_argument("--operacoes", type=int, default=50)
+    p.add_argument("--armazenamento", choices=["json", "sqlite"], default="json")
+    p.add_argument("--limite-diario", type=int, default=4096, help="Bytes do diário antes de compactar (baixo força compactações)")
+
+    p = sub.add_parser("trabalhador-concorrencia", help="Uso interno do teste-concorrencia")
+    p.add_argument("indice", type=int)
+    p.add_argument("operacoes", type=int)
+
+    p = sub.add_parser("benchmark-log", help="Latência e vazão de salvar_log: gravação direta x registro assíncrono")
+    p.add_argument("--mensagens", type=int, default=20000)
+    p.add_argument("--threads", type=int, default=1)
+
+    p = sub.add_parser("benchmark-inicializacao", help="Tempo de importação e de aquecimento dos modelos em processos novos")
+    p.add_argument("--repeticoes", type=int, default=3)
+
+    p = sub.add_parser("reidentificar", help="Procura usuários cadastrados em um vídeo ou pasta de imagens")
+    p.add_argument("entrada", help="arquivo de vídeo ou pasta de imagens")
+    p.add_argument("saida", help="arquivo JSONL de avistamentos")
+    p.add_argument("--passo", type=int, default=1, help="analisa 1 a cada N quadros")
+    p.add_argument("--lote", type=int, default=8, help="quadros por micro-lote")
+    p.add_argument("--processos", type=int, default=None, help="padrão: número de núcleos")
+    p.add_argument("--largura", type=int, default=LARGURA_REIDENTIFICACAO)
+    p.add_argument("--perfil", choices=sorted(PERFIS_CODIFICACAO), default=PERFIL_REIDENTIFICACAO)
+    p.add_argument("--tolerancia", type=float, default=TOLERANCIA_FACIAL)
+    p.add_argument("--incluir-desconhecidos", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.comando == "servico-reconhecimento":
+        servir_reconhecimento((args.host, args.porta), max(1, args.lote), max(0.0, args.espera_ms))
+    elif args.comando == "teste-carga-servico":
+        if teste_carga_servico(_endereco_servico(args.endereco), args.imagem, args.clientes, args.duracao) is None:
+            return 1
+    elif args.comando == "benchmark-buffers":
+        if benchmark_buffers(args.fonte, max(1, args.quadros), args.largura, args.altura) is None:
+            return 1
+    elif args.comando == "multicamera":
+        galeria = carregar_galeria()
+        if not len(galeria):
+            print("Nenhum usuário possui reconhecimento facial cadastrado.")
+            return 1
+        buscador = obter_buscador(galeria)
+        tempo_limite = args.tempo_limite or (10.0 if args.escalonamento else None)
+        avisar = None if args.escalonamento else (
+            lambda camera, c, latencia: print(f"[{camera}] {c.nome} reconhecido (distância {c.distancia:.3f}, {latencia * 1000:.0f} ms)"))
+        rodadas = range(1, len(args.fontes) + 1) if args.escalonamento else [len(args.fontes)]
+        vazao_uma = None
+        for n in rodadas:
+            relatorio = executar_multicamera(args.fontes[:n], buscador, args.processos, tempo_limite,
+                                             not args.sem_ritmo, avisar)
+            if relatorio is None:
+                return 1
+            if args.escalonamento:
+                vazao = sum(r["fps_inferencia"] for r in relatorio)
+                vazao_uma = vazao_uma or vazao
+                print(f"{n} fonte(s): {vazao:.1f} quadros inferidos/s (x{vazao / vazao_uma:.2f} em relação a 1)")
+            else:
+                _imprimir_relatorio_multicamera(relatorio)
+    elif args.comando == "migrar-sqlite":
+        contagem = migrar_para_sqlite(forcar=args.forcar)
+        if contagem is None:
+            return 1
+        print("Migrado: " + ", ".join(f"{n} {t}" for t, n in contagem.items()))
+    elif args.comando == "benchmark-armazenamento":
+        benchmark_armazenamento(args.tamanhos, max(1, args.repeticoes))
+    elif args.comando == "benchmark-diario":
+        benchmark_diario(args.tamanhos, max(1, args.repeticoes))
+    elif args.comando == "teste-concorrencia":
+        if not teste_concorrencia(max(1, args.processos), max(1, args.operacoes), args.armazenamento, args.limite_diario):
+            return 1
+    elif args.comando == "trabalhador-concorrencia":
+        _trabalhador_concorrencia(args.indice, args.operacoes)
+    elif args.comando == "benchmark-log":
+        benchmark_log(max(1, args.mensagens), max(1, args.threads))
+    elif args.comando == "benchmark-inicializacao":
+        if benchmark_inicializacao(max(1, args.repeticoes)) is None:
+            return 1
+    elif args.comando == "reidentificar":
+        estatisticas = reidentificar_arquivo(args.entrada, args.saida, max(1, args.passo), max(1, args.lote),
+                                             args.processos, args.largura, args.perfil, args.tolerancia,
+                                             args.incluir_desconhecidos)
+        if estatisticas is None:
+            return 1
+        print(json.dumps(estatisticas, indent=4, ensure_ascii=False))
+    elif args.comando == "benchmark-reconhecimento":
+        fonte = abrir_fonte(args.fonte, tempo_real=not args.sem_ritmo)
+        if not fonte.isOpened():
+            print(f"Não foi possível abrir a fonte: {args.fonte}")
+            return 1
+        try:
+            if args.modo == "login":
+                galeria = carregar_galeria()
+                if not len(galeria):
+                    print("Nenhum usuário possui reconhecimento facial cadastrado.")
+                    return 1
+                resultado, estatisticas = executar_login(fonte, obter_buscador(galeria), exibir=False,
+                                                         tempo_limite=args.tempo_limite)
+                estatisticas["reconhecido"] = resultado.nome if resultado else None
+            else:
+                resultado, estatisticas = executar_cadastro(fonte, "benchmark", exibir=False, automatico=True,
+                                                            tempo_limite=args.tempo_limite)
+                estatisticas["capturado"] = resultado is not None
+        finally:
+            fonte.release()
+        print(json.dumps(estatisticas, indent=4, ensure_ascii=False))
+        return 0 if resultado is not None else 2
+    elif args.comando == "cadastrar-lote":
+        if cadastrar_lote(args.origem, args.processos, args.perfil) is None:
+            return 1
+    elif args.comando == "benchmark-perfis":
+        detector = obter_detector()
+        amostras = []
+        for caminho in args.imagens:
+            rgb = face_recognition.load_image_file(caminho)
+            amostras.append((rgb, detector(rgb)))
+        print(f"{'perfil':>12} {'modelo':>7} {'jitters':>8} {'max':>4} {'ms/rosto':>9}")
+        for nome in PERFIS_CODIFICACAO:
+            perfil = obter_perfil(nome)
+            for _ in range(args.repeticoes):
+                for rgb, faces in amostras:
+                    perfil.codificar(rgb, faces)
+            r = perfil.relatorio()
+            custo = f"{r['custo_medio_ms']:.1f}" if r["custo_medio_ms"] is not None else "-"
+            print(f"{nome:>12} {r['modelo']:>7} {r['jitters']:>8} {str(r['max_rostos']):>4} {custo:>9}")
+    elif args.comando == "benchmark-detectores":
+        amostras = carregar_amostras_deteccao()
+        if not amostras:
+            print(f"Nenhuma imagem de amostra em {AMOSTRAS_DETECCAO_DIR}")
+            return 1
+        print(f"{len(amostras)} amostras")
+        print(f"{'detector':>10} {'ms/imagem':>10} {'F1':>6}")
+        for r in sorted(benchmark_detectores(amostras), key=lambda r: r["ms"]):
+            print(f"{r['detector']:>10} {r['ms']:>10.1f} {r['f1']:>6.3f}")
+        if len(_anotacoes_deteccao()) < len(amostras):
+            print(f"Imagens sem anotação usam {REFERENCIA_DETECTOR} como gabarito; a seleção automática só considera as anotadas.")
+        if args.salvar:
+            print(f"Selecionado: {selecionar_detector(args.piso, forcar=True)}")
+    elif args.comando == "benchmark-ann":
+        galeria = carregar_galeria() if args.galeria_real else None
+        if galeria is not None and len(galeria) < 2:
+            print("A galeria cadastrada precisa de pelo menos 2 usuários com face.")
+            return 1
+        benchmark_indice_ann(args.usuarios, args.consultas, args.sondagens, args.listas, galeria)
+    return 0
+
 # ------------------------- Execução -------------------------
 if __name__ == "__main__":
+    inicializar_dados()
+    if len(sys.argv) > 1:
+        sys.exit(executar_linha_comando(sys.argv[1:]))
+
     app = QApplication(sys.argv)
     janela = MenuPrincipal()
     janela.show()
-    sys.exit(app.exec_())
+    # Com o menu já na tela, carrega os modelos para o primeiro login facial
+    QTimer.singleShot(0, iniciar_aquecimento)
+    codigo = app.exec_()
+    # Antes de desmontar o Qt: uma queda na saída não leva o fim do log junto
+    REGISTRO.descarregar()
+    sys.exit(codigo)
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# O módulo lê COFRE_DATA_DIR na importação: os testes nunca tocam o data/ do repositório
+os.environ.setdefault("COFRE_DATA_DIR", tempfile.mkdtemp(prefix="cofre_testes_"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.makedirs(os.environ["COFRE_DATA_DIR"], exist_ok=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,119 @@
+import json
+import subprocess
+import sys
+import threading
+
+import CodigoCorreto as C
+
+
+def _gravar_externo(caminho, chave):
+    """Outro processo acrescenta uma chave pelo próprio ArquivoJSON"""
+    codigo = ("import sys, CodigoCorreto as C; a = C.ArquivoJSON(sys.argv[1], dict); "
+              "d = a.ler(); d[sys.argv[2]] = {'x': 1}; a.gravar(d)")
+    subprocess.run([sys.executable, "-c", codigo, str(caminho), chave], check=True,
+                   cwd=C.BASE_DIR or ".")
+
+
+def _ler_arquivo(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_copia_antiga_nao_apaga_gravacao_externa(tmp_path):
+    caminho = tmp_path / "usuarios.json"
+    arquivo = C.ArquivoJSON(str(caminho), dict)
+    arquivo.gravar({"base": {"x": 0}})
+
+    antiga = arquivo.ler()              # ex.: diálogo aberto
+    _gravar_externo(caminho, "externo")
+    arquivo.ler()                       # outra parte do processo relê o arquivo
+    antiga["meu"] = {"x": 2}
+    arquivo.gravar(antiga)
+
+    assert sorted(_ler_arquivo(caminho)) == ["base", "externo", "meu"]
+
+
+def test_copia_antiga_nao_desfaz_gravacao_no_mesmo_processo(tmp_path):
+    arquivo = C.ArquivoJSON(str(tmp_path / "a.json"), dict)
+    arquivo.gravar({"a": 1})
+    primeira, segunda = arquivo.ler(), arquivo.ler()
+    segunda["b"] = 2
+    arquivo.gravar(segunda)
+    del primeira["a"]
+    primeira["c"] = 3
+    arquivo.gravar(primeira)
+    assert arquivo.ler() == {"b": 2, "c": 3}
+
+
+def test_mesma_copia_gravada_duas_vezes(tmp_path):
+    arquivo = C.ArquivoJSON(str(tmp_path / "a.json"), dict)
+    arquivo.gravar({"a": 1})
+    dados = arquivo.ler()
+    dados["b"] = 2
+    arquivo.gravar(dados)
+    del dados["a"]
+    arquivo.gravar(dados)
+    assert arquivo.ler() == {"b": 2}
+
+
+def test_ler_entrega_copias_independentes(tmp_path):
+    arquivo = C.ArquivoJSON(str(tmp_path / "a.json"), dict)
+    arquivo.gravar({"u": {"pastas": ["/a"]}})
+    dados = arquivo.ler()
+    dados["u"]["pastas"].append("/b")
+    dados["novo"] = {}
+    assert arquivo.ler() == {"u": {"pastas": ["/a"]}}
+    assert arquivo.estatisticas()["acertos"] >= 1
+
+
+def test_gravar_item_json_nao_altera_copia_de_outra_thread(tmp_path):
+    motor = C.ArmazenamentoJSON(usuarios=C.ArquivoJSON(str(tmp_path / "u.json"), dict))
+    motor.gravar("usuarios", {f"u{i}": {"pastas": []} for i in range(50)})
+    em_uso = motor.ler("usuarios")
+    erros = []
+
+    def iterar():
+        try:
+            for _ in range(200):
+                for _ in em_uso.items():
+                    pass
+        except RuntimeError as e:
+            erros.append(e)
+
+    t = threading.Thread(target=iterar)
+    t.start()
+    for i in range(20):
+        motor.gravar_item("usuarios", f"novo{i}", {"pastas": []})
+    t.join()
+    assert not erros
+    assert len(em_uso) == 50
+    assert len(motor.ler("usuarios")) == 70
+
+
+def test_lista_remocao_e_acrescimo_concorrentes(tmp_path):
+    arquivo = C.ArquivoJSON(str(tmp_path / "p.json"), list)
+    arquivo.gravar(["/a", "/b"])
+    primeira, segunda = arquivo.ler(), arquivo.ler()
+    primeira.remove("/a")
+    arquivo.gravar(primeira)
+    segunda.append("/c")
+    arquivo.gravar(segunda)
+    assert arquivo.ler() == ["/b", "/c"]
+
+
+def test_sqlite_copia_antiga_nao_apaga_gravacao_de_outra_conexao(tmp_path):
+    caminho = str(tmp_path / "cofre.db")
+    motor = C.ArmazenamentoSQLite(caminho)
+    motor.gravar("usuarios", {"base": {"pastas": [], "embedding": None}})
+    antiga = motor.ler("usuarios")
+
+    outro = C.ArmazenamentoSQLite(caminho)   # como outro processo
+    dados = outro.ler("usuarios")
+    dados["externo"] = {"pastas": ["/x"], "embedding": [0.5] * 4}
+    outro.gravar("usuarios", dados)
+
+    motor.ler("usuarios")
+    antiga["meu"] = {"pastas": [], "embedding": None}
+    motor.gravar("usuarios", antiga)
+
+    assert sorted(C.ArmazenamentoSQLite(caminho).ler("usuarios")) == ["base", "externo", "meu"]
@@ -0,0 +1,60 @@
+import os
+import threading
+
+import CodigoCorreto as C
+
+
+def test_reaplicar_mantem_alteracoes_dos_outros():
+    base = {"a": 1, "b": 2, "c": 3}
+    nossos = {"a": 1, "b": 20, "d": 4}        # alteramos b, removemos c, criamos d
+    atuais = {"a": 10, "b": 2, "c": 3, "e": 5}  # outro processo alterou a e criou e
+    assert C._reaplicar_alteracoes(base, nossos, atuais) == {"a": 10, "b": 20, "d": 4, "e": 5}
+
+
+def test_reaplicar_nossa_alteracao_vence_na_mesma_chave():
+    assert C._reaplicar_alteracoes({"a": 1}, {"a": 2}, {"a": 3}) == {"a": 2}
+
+
+def test_reaplicar_chave_intocada_nao_ressuscita():
+    # Outro processo removeu "a"; nós não mexemos nela, então ela continua removida
+    assert C._reaplicar_alteracoes({"a": 1, "b": 2}, {"a": 1, "b": 3}, {"b": 2}) == {"b": 3}
+
+
+def test_reaplicar_lista_sem_duplicar():
+    base = ["/a", "/b"]
+    nossos = ["/b", "/c"]
+    atuais = ["/a", "/b", "/c", "/d"]
+    assert C._reaplicar_alteracoes(base, nossos, atuais) == ["/b", "/c", "/d"]
+
+
+def test_caminho_temporario_unico_por_thread(tmp_path):
+    caminho = str(tmp_path / "x.json")
+    nomes = []
+    juntas = threading.Barrier(4)  # vivas ao mesmo tempo: o ident só é reaproveitado depois que a thread termina
+
+    def gravar():
+        nomes.append(C._caminho_temporario(caminho))
+        juntas.wait()
+
+    threads = [threading.Thread(target=gravar) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(nomes)) == 4 and all(str(os.getpid()) in n for n in nomes)
+
+
+def test_gravar_atomico_nao_deixa_temporario_em_erro(tmp_path):
+    caminho = tmp_path / "x.json"
+    caminho.write_text("{}")
+
+    def falhar(f):
+        f.write("{")
+        raise RuntimeError("falha no meio")
+
+    try:
+        C.gravar_atomico(str(caminho), falhar)
+    except RuntimeError:
+        pass
+    assert caminho.read_text() == "{}"
+    assert os.listdir(tmp_path) == ["x.json"]
@@ -0,0 +1,76 @@
+import json
+
+import CodigoCorreto as C
+
+
+def _diario(pasta, limite=1 << 20):
+    return C.DiarioJSONL(str(pasta / "s.json"), str(pasta / "s.jsonl"), limite=limite)
+
+
+def _linhas(pasta):
+    return (pasta / "s.jsonl").read_text(encoding="utf-8").splitlines()
+
+
+def test_reabrir_reaplica_diario_sobre_snapshot(tmp_path):
+    diario = _diario(tmp_path)
+    diario.gravar({"a": 1})
+    diario.anexar([("set", "b", 2), ("del", "a", None), ("set", "c", {"x": 3})])
+    assert _diario(tmp_path).ler() == {"b": 2, "c": {"x": 3}}
+    assert json.loads((tmp_path / "s.json").read_text(encoding="utf-8")) == {"a": 1}
+
+
+def test_compacta_ao_passar_do_limite(tmp_path):
+    diario = _diario(tmp_path, limite=200)
+    for i in range(20):
+        diario.anexar([("set", f"k{i}", i)])
+    assert diario.compactacoes >= 2
+    assert all(len(linha) < 200 for linha in _linhas(tmp_path))
+    assert json.loads(_linhas(tmp_path)[0])["op"] == "inicio"
+    assert _diario(tmp_path).ler() == {f"k{i}": i for i in range(20)}
+
+
+def test_outro_leitor_le_so_o_que_foi_acrescentado(tmp_path):
+    escritor, leitor = _diario(tmp_path), _diario(tmp_path)
+    escritor.anexar([("set", "a", 1)])
+    assert leitor.ler() == {"a": 1}
+    recargas = leitor.recargas
+    escritor.anexar([("set", "b", 2)])
+    escritor.anexar([("del", "a", None)])
+    assert leitor.ler() == {"b": 2}
+    assert leitor.recargas == recargas
+
+
+def test_leitor_recarrega_depois_de_compactacao(tmp_path):
+    escritor, leitor = _diario(tmp_path), _diario(tmp_path)
+    escritor.anexar([("set", "a", 1)])
+    assert leitor.ler() == {"a": 1}
+    recargas = leitor.recargas
+    escritor.anexar([("set", "b", 2)])
+    escritor.compactar()
+    escritor.anexar([("set", "c", 3)])
+    assert leitor.ler() == {"a": 1, "b": 2, "c": 3}
+    assert leitor.recargas == recargas + 1
+
+
+def test_linha_incompleta_ignorada_e_descartada(tmp_path):
+    diario = _diario(tmp_path)
+    diario.anexar([("set", "a", 1)])
+    with open(tmp_path / "s.jsonl", "ab") as f:
+        f.write(b'{"op": "set", "chave": "meia')  # queda no meio da escrita
+    assert _diario(tmp_path).ler() == {"a": 1}
+
+    outro = _diario(tmp_path)
+    outro.anexar([("set", "b", 2)])
+    assert all(json.loads(linha) for linha in _linhas(tmp_path))
+    assert _diario(tmp_path).ler() == {"a": 1, "b": 2}
+
+
+def test_ler_entrega_copia(tmp_path):
+    diario = _diario(tmp_path)
+    diario.anexar([("set", "a", {"x": 1})])
+    copia = diario.ler()
+    copia["a"]["x"] = 99
+    copia["b"] = 2
+    for _ in copia:
+        diario.anexar([("set", "c", 3)])  # não altera a cópia durante a iteração
+    assert diario.ler() == {"a": {"x": 1}, "c": 3}
@@ -0,0 +1,40 @@
+import numpy as np
+
+import CodigoCorreto as C
+
+
+def _quadro(largura, altura):
+    return np.zeros((altura, largura, 3), dtype=np.uint8)
+
+
+def test_quadro_menor_nao_remove_niveis_de_camera_maior():
+    escala = C.EscalaAdaptativa(largura_inicial=320)
+    escala.reduzir(_quadro(200, 150))
+    assert escala.larguras == [160, 200]
+    escala.reduzir(_quadro(1280, 720))
+    assert escala.larguras == list(C.LARGURAS_PROCESSAMENTO)
+    assert escala.larguras[escala.nivel] == 160  # maior nível que não passa da largura anterior
+
+
+def test_niveis_nunca_passam_do_quadro():
+    escala = C.EscalaAdaptativa(largura_inicial=960)
+    reduzida, fator = escala.reduzir(_quadro(640, 480))
+    assert escala.larguras[-1] == 640
+    assert reduzida.shape[1] == 640 and fator == 1.0
+
+
+def test_subida_para_no_maior_nivel_dentro_do_orcamento():
+    escala = C.EscalaAdaptativa(orcamento_ms=80, larguras=(160, 320, 640, 1280), largura_inicial=160)
+    imagem = _quadro(160, 120)
+    # 320 px previstos em 50 ms, 640 px em 200 ms
+    escala.custo_por_pixel = 0.05 / (320 * 320 * 0.75)
+    rosto_pequeno = [(0, 5, 5, 0)]  # precisaria de mais de 1280 px para passar da altura mínima
+    assert escala.registrar(0.0, imagem, rosto_pequeno, deteccao_completa=False)
+    assert escala.larguras[escala.nivel] == 320
+
+
+def test_rosto_grande_reduz_nivel():
+    escala = C.EscalaAdaptativa(larguras=(160, 320, 640), largura_inicial=640)
+    imagem = _quadro(640, 480)
+    assert escala.registrar(0.01, imagem, [(0, 300, 300, 0)])
+    assert escala.larguras[escala.nivel] == 160
@@ -0,0 +1,84 @@
+import json
+import math
+import os
+
+import numpy as np
+
+import CodigoCorreto as C
+
+
+def _vetor(semente):
+    return np.random.default_rng(semente).normal(size=C.DIMENSAO_EMBEDDING).astype(np.float32)
+
+
+def _galeria(*sementes):
+    return C.GaleriaFacial([f"u{s}" for s in sementes], np.stack([_vetor(s) for s in sementes]))
+
+
+def test_correspondencias_melhor_e_margem():
+    galeria = _galeria(1, 2, 3)
+    dist = np.array([[0.5, 0.2, 0.9],
+                     [0.4, 0.7, 0.1]], dtype=np.float32)
+    primeira, segunda = galeria._correspondencias(dist)
+    assert primeira.nome == "u2" and math.isclose(primeira.distancia, 0.2, rel_tol=1e-6)
+    assert math.isclose(primeira.margem, 0.3, rel_tol=1e-6)
+    assert segunda.nome == "u3" and math.isclose(segunda.margem, 0.3, rel_tol=1e-6)
+
+
+def test_correspondencias_com_subconjunto_de_linhas():
+    galeria = _galeria(1, 2, 3, 4)
+    dist = np.array([[0.8, 0.3]], dtype=np.float32)
+    (resultado,) = galeria._correspondencias(dist, linhas=np.array([3, 0]))
+    assert resultado.nome == "u1"
+
+
+def test_correspondencias_com_uma_ou_nenhuma_coluna():
+    galeria = _galeria(1, 2)
+    (unica,) = galeria._correspondencias(np.array([[0.4]], dtype=np.float32), linhas=[1])
+    assert unica.nome == "u2" and unica.margem == float("inf")
+    assert galeria._correspondencias(np.empty((2, 0), dtype=np.float32)) == [None, None]
+
+
+def test_identificar_respeita_tolerancia():
+    galeria = _galeria(1, 2)
+    assert galeria.identificar([_vetor(2)]).nome == "u2"
+    assert galeria.identificar([_vetor(2) + 10.0]) is None
+
+
+def _usuarios(*sementes):
+    return {f"u{s}": {"pastas": [], "embedding": _vetor(s).tolist()} for s in sementes}
+
+
+def _trocar_usuarios(*sementes):
+    """Substitui todos os usuários pelo ciclo carregar -> alterar -> salvar do painel"""
+    usuarios = C.carregar_usuarios()
+    usuarios.clear()
+    usuarios.update(_usuarios(*sementes))
+    C.salvar_usuarios(usuarios)
+
+
+def test_indice_de_outra_gravacao_nao_e_aceito():
+    _trocar_usuarios(1, 2)
+    with open(C.GALERIA_INDICE_FILE, encoding="utf-8") as f:
+        indice_antigo = json.load(f)
+    _trocar_usuarios(3, 4)
+
+    # Índice da primeira gravação com a matriz da segunda: mesma forma e origem atual
+    indice_antigo["origem"] = C._assinatura_usuarios()
+    with open(C.GALERIA_INDICE_FILE, "w", encoding="utf-8") as f:
+        json.dump(indice_antigo, f)
+
+    galeria = C.carregar_galeria()
+    assert galeria.nomes == ["u3", "u4"]
+    assert np.array_equal(galeria.matriz, np.stack([_vetor(3), _vetor(4)]))
+
+
+def test_galeria_recarregada_sem_reconstruir():
+    _trocar_usuarios(5, 6, 7)
+    galeria = C.GaleriaFacial.de_usuarios(_usuarios(5, 6, 7))
+    mtime = os.stat(C.GALERIA_FILE).st_mtime_ns
+    carregada = C.carregar_galeria()
+    assert carregada.nomes == galeria.nomes
+    assert np.array_equal(carregada.matriz, galeria.matriz)
+    assert os.stat(C.GALERIA_FILE).st_mtime_ns == mtime
+    assert not [n for n in os.listdir(C.DATA_DIR) if n.endswith(".tmp")]
@@ -0,0 +1,19 @@
+import CodigoCorreto as C
+
+
+def _linha(texto, prefixo):
+    (linha,) = [l for l in texto.splitlines() if l.startswith(prefixo)]
+    return float(linha.rsplit(" ", 1)[1])
+
+
+def test_soma_e_contagem_acumuladas_alem_da_janela():
+    metricas = C.MetricasDesempenho(janela=3)
+    for i in range(1, 6):
+        metricas.registrar("login/deteccao", i / 100)
+    r = metricas.resumo()["etapas"]["login/deteccao"]
+    assert r["amostras"] == 3 and r["total"] == 5
+    texto = metricas.texto_prometheus()
+    rotulos = '{loop="login",etapa="deteccao"}'
+    assert _linha(texto, "cofre_etapa_ms_count" + rotulos) == 5
+    assert abs(_linha(texto, "cofre_etapa_ms_sum" + rotulos) - 150.0) < 1e-6
+    assert _linha(texto, 'cofre_etapa_ms{loop="login",etapa="deteccao",quantile="0.5"}') == 40.0
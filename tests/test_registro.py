@@ -0,0 +1,81 @@
+import threading
+
+import CodigoCorreto as C
+
+
+def _registro(pasta, **opcoes):
+    # Intervalo longo: a thread só grava quando a fila enche, em descarregar ou em fechar
+    opcoes.setdefault("intervalo", 60)
+    return C.RegistroAssincrono(str(pasta / "logs.txt"), **opcoes)
+
+
+def _mensagens(pasta):
+    return [linha.split("] ", 1)[1] for linha in (pasta / "logs.txt").read_text(encoding="utf-8").splitlines()]
+
+
+def test_fila_gravada_num_unico_lote(tmp_path):
+    registro = _registro(tmp_path)
+    for i in range(10):
+        registro.registrar(f"m{i}")
+    assert registro.descarregar()
+    assert _mensagens(tmp_path) == [f"m{i}" for i in range(10)]
+    assert registro.lotes == 1
+    registro.fechar()
+
+
+def test_lotes_nao_passam_do_limite(tmp_path):
+    registro = _registro(tmp_path, lote=4)
+    for i in range(10):
+        registro.registrar(f"m{i}")
+    registro.fechar()
+    assert _mensagens(tmp_path) == [f"m{i}" for i in range(10)]
+    assert registro.lotes >= 3
+
+
+def test_fila_cheia_descarta_sem_contar_como_gravada(tmp_path):
+    registro = _registro(tmp_path, capacidade=3)
+    for i in range(6):
+        registro.registrar(f"m{i}")
+    assert registro.descartadas == 3 and registro.enfileiradas == 3
+    assert registro.descarregar()
+    assert _mensagens(tmp_path) == ["m0", "m1", "m2"]  # descarregar esperou a gravação de verdade
+    registro.fechar()
+
+
+def test_falha_de_gravacao_conta_como_perdida(tmp_path):
+    registro = C.RegistroAssincrono(str(tmp_path / "nao_existe" / "logs.txt"), intervalo=60)
+    registro.registrar("m0")
+    registro.registrar("m1")
+    assert registro.descarregar()
+    assert registro.estatisticas()["perdidas"] == 2
+    assert registro.descartadas == 0 and registro.erros == 1
+    registro.fechar()
+
+
+def test_fechar_esvazia_a_fila_e_grava_o_que_vier_depois(tmp_path):
+    registro = _registro(tmp_path)
+    registro.registrar("antes")
+    registro.fechar()
+    registro.registrar("depois")
+    assert _mensagens(tmp_path) == ["antes", "depois"]
+    assert registro.estatisticas()["pendentes"] == 0
+
+
+def test_fechar_com_disco_lento_nao_grava_em_dobro(tmp_path):
+    registro = _registro(tmp_path)
+    liberar = threading.Event()
+    anexar = registro._anexar
+
+    def lento(caminho, texto):
+        liberar.wait()
+        anexar(caminho, texto)
+
+    registro._anexar = lento
+    registro.registrar("m0")
+    registro._acordar.set()
+    registro.registrar("m1")
+    registro.fechar(timeout=0.1)  # a thread segue presa no disco: fechar não esvazia em paralelo
+    liberar.set()
+    registro._thread.join(5)
+    assert sorted(_mensagens(tmp_path)) == ["m0", "m1"]
+    assert registro.gravadas == 2
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+import CodigoCorreto as C
+
+
+@pytest.fixture(autouse=True)
+def motor(tmp_path, monkeypatch):
+    diario = C.DiarioJSONL(str(tmp_path / "sessoes.json"), str(tmp_path / "sessoes.jsonl"))
+    motor = C.ArmazenamentoJSON(sessoes=diario)
+    monkeypatch.setattr(C, "_armazenamento", motor)
+    return motor
+
+
+def _armazem(duracao=3600, lote=C.LOTE_LIMPEZA_SESSOES):
+    # Intervalo longo: a thread de limpeza só acorda no vencimento, os testes controlam o relógio
+    return C.ArmazemSessoes(duracao=duracao, intervalo=3600, lote=lote)
+
+
+def test_sessao_vencida_e_removida_ao_obter():
+    armazem = _armazem(duracao=0.05)
+    sessao_id = armazem.criar("ana")
+    assert armazem.obter(sessao_id)["usuario"] == "ana"
+    time.sleep(0.1)
+    assert armazem.obter(sessao_id) is None
+    assert sessao_id not in C.carregar_sessoes()
+
+
+def test_limpeza_remove_so_as_vencidas_em_ordem_de_prazo():
+    armazem = _armazem()
+    curta = armazem.criar("ana")
+    armazem.duracao = 7200
+    longa = armazem.criar("bia")
+    assert armazem.limpar_expiradas(agora=time.time() + 5400) == 1
+    assert set(C.carregar_sessoes()) == {longa}
+    assert armazem.obter(curta) is None and armazem.obter(longa) is not None
+
+
+def test_limpeza_em_lotes():
+    armazem = _armazem(lote=2)
+    for i in range(5):
+        armazem.criar(f"u{i}")
+    depois = time.time() + 7200
+    assert [armazem.limpar_expiradas(agora=depois) for _ in range(4)] == [2, 2, 1, 0]
+    assert armazem.estatisticas()["expiradas"] == 5
+    assert C.carregar_sessoes() == {}
+
+
+def test_entrada_obsoleta_do_heap_e_descartada():
+    armazem = _armazem()
+    encerrada = armazem.criar("ana")
+    armazem.criar("bia")
+    armazem.encerrar(encerrada)
+    assert armazem.estatisticas()["heap"] == 2  # o heap só é podado na limpeza
+    assert armazem.limpar_expiradas(agora=time.time() + 7200) == 1
+    assert armazem.estatisticas() == {"ativas": 0, "usuarios": 0, "heap": 0, "expiradas": 1}
+
+
+def test_revogar_usuario_encerra_todas_as_sessoes_dele():
+    armazem = _armazem()
+    das_ana = [armazem.criar("ana") for _ in range(3)]
+    da_bia = armazem.criar("bia")
+    assert armazem.revogar_usuario("ana") == 3
+    assert armazem.revogar_usuario("ana") == 0
+    assert all(armazem.obter(s) is None for s in das_ana)
+    assert set(C.carregar_sessoes()) == {da_bia}
+    assert armazem.estatisticas()["usuarios"] == 1
+
+
+def test_outra_instancia_ve_as_alteracoes():
+    # Duas instâncias sobre o mesmo armazenamento, como dois processos sobre o mesmo data/
+    primeira, segunda = _armazem(), _armazem()
+    sessao_id = primeira.criar("ana")
+    assert segunda.obter(sessao_id)["usuario"] == "ana"
+    outra = segunda.criar("ana")
+    assert primeira.revogar_usuario("ana") == 2  # índice por usuário reconstruído com a sessão da segunda
+    assert segunda.obter(outra) is None
+    assert segunda.estatisticas()["ativas"] == 0
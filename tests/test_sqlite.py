@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import CodigoCorreto as C
+
+
+@pytest.fixture
+def motor(tmp_path):
+    motor = C.ArmazenamentoSQLite(str(tmp_path / "cofre.db"))
+    yield motor
+    motor._conexao().close()
+
+
+def _usuario(i, pastas=()):
+    return {"pastas": list(pastas), "embedding": np.linspace(0, 1, C.DIMENSAO_EMBEDDING).tolist(), "criado": i}
+
+
+def _comandos(motor, funcao):
+    """Comandos SQL executados pela conexão da thread durante funcao()"""
+    comandos = []
+    con = motor._conexao()
+    con.set_trace_callback(comandos.append)
+    try:
+        funcao()
+    finally:
+        con.set_trace_callback(None)
+    return comandos
+
+
+def _com_prefixo(comandos, prefixo):
+    return [c for c in comandos if c.lstrip().upper().startswith(prefixo)]
+
+
+def test_grava_so_o_usuario_alterado(motor):
+    motor.gravar("usuarios", {f"u{i}": _usuario(i) for i in range(50)})
+    usuarios = motor.ler("usuarios")
+    usuarios["u7"]["pastas"] = ["/docs"]
+    comandos = _comandos(motor, lambda: motor.gravar("usuarios", usuarios))
+    inseridos = _com_prefixo(comandos, "INSERT INTO USUARIOS ")
+    assert len(inseridos) == 1 and "'u7'" in inseridos[0]
+    assert not _com_prefixo(comandos, "DELETE FROM USUARIOS ")
+
+
+def test_gravar_sem_mudancas_nao_escreve_linhas(motor):
+    motor.gravar("admins", {"admin": {"senha_hash": "x", "nivel": "master", "criado_em": "hoje"}})
+    comandos = _comandos(motor, lambda: motor.gravar("admins", motor.ler("admins")))
+    assert _com_prefixo(comandos, "INSERT INTO META")  # só a versão avança
+    assert not _com_prefixo(comandos, "INSERT INTO ADMINS")
+    assert not _com_prefixo(comandos, "DELETE FROM ADMINS")
+
+
+def test_remocao_apaga_linha_e_pastas_do_usuario(motor):
+    motor.gravar("usuarios", {"ana": _usuario(1, ["/a", "/b"]), "bia": _usuario(2, ["/a"])})
+    usuarios = motor.ler("usuarios")
+    del usuarios["ana"]
+    motor.gravar("usuarios", usuarios)
+    con = motor._conexao()
+    assert [n for (n,) in con.execute("SELECT nome FROM usuarios")] == ["bia"]
+    assert con.execute("SELECT COUNT(*) FROM usuario_pastas WHERE usuario = 'ana'").fetchone()[0] == 0
+
+
+def test_ida_e_volta_sem_perda(motor):
+    usuario = _usuario(1, ["/z", "/a"])
+    usuario["embedding"] = (np.arange(C.DIMENSAO_EMBEDDING) / 3.0).tolist()
+    motor.gravar("usuarios", {"ana": usuario})
+    sessao = {"usuario": "ana", "autenticado_em": "t0", "expira_em": "t1", "metodo": "facial", "ip": "10.0.0.1"}
+    motor.gravar("sessoes", {"s1": sessao})
+    motor._cache.clear()
+    assert motor.ler("usuarios") == {"ana": usuario}
+    assert motor.ler("sessoes") == {"s1": sessao}
+
+
+def test_cache_atualizado_sem_remontar(motor, monkeypatch):
+    motor.gravar("usuarios", {f"u{i}": _usuario(i) for i in range(5)})
+    usuarios = motor.ler("usuarios")
+    usuarios["u9"] = _usuario(9)
+    motor.gravar("usuarios", usuarios)
+    monkeypatch.setattr(motor, "_montar", lambda *a: pytest.fail("remontou o dicionário"))
+    assert set(motor.ler("usuarios")) == {"u0", "u1", "u2", "u3", "u4", "u9"}
+
+
+def test_dicionario_sem_base_nao_apaga(motor):
+    motor.gravar("usuarios", {"ana": _usuario(1)})
+    motor.gravar("usuarios", {"bia": _usuario(2)})
+    assert set(motor.ler("usuarios")) == {"ana", "bia"}